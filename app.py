@@ -43,71 +43,7 @@ from models import db, User, Server, Channel, hash_pw, safe_slug
 # initialize db with the app
 db.init_app(app)
 
-# Real-time main content API for AJAX polling
-@app.route("/api/main-content")
-def api_main_content():
-    # Get latest videos and servers
-    bot = User.query.filter_by(username="GrowBot").first()
-    bot_id = bot.id if bot else None  # Ensure bot_id is set correctly
-    uploaded_vids = Video.query.filter(Video.uploader_id != bot_id).order_by(Video.created_at.desc()).limit(12).all() if bot_id else []
-    youtube_vids = Video.query.filter_by(uploader_id=bot_id).order_by(Video.created_at.desc()).limit(12).all() if bot_id else []
-    servers = Server.query.order_by(Server.name).all()
 
-    # Render video HTML
-    videos_html = ""
-    if uploaded_vids:
-        videos_html += '<h2>📤 Uploaded Videos</h2><div class="video-grid">'
-        for v in uploaded_vids:
-            videos_html += f'<a class="vcard" href="/watch/{v.id}"><img class="thumb" src="{v.thumbnail or "/static/leaf.png"}"><div class="vt">{v.title}</div><div class="meta"><span>👍 {getattr(v, "like_count", 0)}</span><span style="margin-left:8px">{v.created_at.strftime("%b %d, %Y")}</span></div></a>'
-        videos_html += '</div>'
-    if youtube_vids:
-        videos_html += '<h2 style="margin-top:32px">🎬 Featured Grow Tutorials</h2><div class="video-grid">'
-        for v in youtube_vids:
-            videos_html += f'<a class="vcard" href="/watch/{v.id}"><img class="thumb" src="{v.thumbnail or "/static/leaf.png"}"><div class="vt">{v.title}</div><div class="meta"><span>👍 {getattr(v, "like_count", 0)}</span><span style="margin-left:8px">YouTube</span></div></a>'
-        videos_html += '</div>'
-    if not uploaded_vids and not youtube_vids:
-        videos_html += '<h2>Recent</h2><p>No videos yet.</p>'
-
-    # Render server HTML
-    servers_html = ""
-    for s in servers:
-        servers_html += f'<a class="side-video" href="/server/{s.slug}">🌿 {s.name}</a>'
-
-    return jsonify({"videos_html": videos_html, "servers_html": servers_html})
-
-# Move these route decorators below app initialization
-@app.route("/admin/site-settings", methods=["POST"])
-def admin_site_settings():
-    u = current_user()
-    if not u or not u.is_admin:
-        return redirect(url_for("login"))
-    # SiteSetting model not defined, so this route is currently a placeholder
-    flash("Site settings model not implemented.", "error")
-    return redirect(url_for("admin_panel"))
-
-@app.route("/admin/ad/<int:ad_id>/edit", methods=["POST"])
-def admin_edit_ad(ad_id):
-    u = current_user()
-    if not u or not u.is_admin:
-        return redirect(url_for("login"))
-    ad = Advertisement.query.get_or_404(ad_id)
-    # Update fields
-    ad.title = request.form.get("title", ad.title).strip()
-    ad.content = request.form.get("content", ad.content)
-    ad.link = request.form.get("link", ad.link)
-    ad.placement = request.form.get("placement", ad.placement)
-    # Handle image upload
-    ad_image = request.files.get("image")
-    if ad_image and ad_image.filename:
-        fname = secure_filename(ad_image.filename)
-        image_path = os.path.join("uploads", "ads", f"ad_{secrets.token_hex(4)}_{fname}")
-        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-        ad_image.save(image_path)
-        ad.image = "/" + image_path.replace("\\", "/")
-    ad.updated_at = datetime.utcnow()
-    db.session.commit()
-    flash("✅ Advertisement updated!", "success")
-    return redirect(url_for("admin_panel"))
 import os, re, secrets, hashlib
 import smtplib
 import ssl
@@ -159,37 +95,6 @@ from models import (
 # initialize db with the app
 db.init_app(app)
 
-# Real-time main content API for AJAX polling
-@app.route("/api/main-content")
-def api_main_content():
-    # Get latest videos and servers
-    bot = User.query.filter_by(username="GrowBot").first()
-    bot_id = bot.id if bot else None
-    uploaded_vids = Video.query.filter(Video.uploader_id != bot_id).order_by(Video.created_at.desc()).limit(12).all() if bot_id else []
-    youtube_vids = Video.query.filter_by(uploader_id=bot_id).order_by(Video.created_at.desc()).limit(12).all() if bot_id else []
-    servers = Server.query.order_by(Server.name).all()
-
-    # Render video HTML
-    videos_html = ""
-    if uploaded_vids:
-        videos_html += '<h2>📤 Uploaded Videos</h2><div class="video-grid">'
-        for v in uploaded_vids:
-            videos_html += f'<a class="vcard" href="/watch/{v.id}"><img class="thumb" src="{v.thumbnail or "/static/leaf.png"}"><div class="vt">{v.title}</div><div class="meta"><span>👍 {getattr(v, "like_count", 0)}</span><span style="margin-left:8px">{v.created_at.strftime("%b %d, %Y")}</span></div></a>'
-        videos_html += '</div>'
-    if youtube_vids:
-        videos_html += '<h2 style="margin-top:32px">🎬 Featured Grow Tutorials</h2><div class="video-grid">'
-        for v in youtube_vids:
-            videos_html += f'<a class="vcard" href="/watch/{v.id}"><img class="thumb" src="{v.thumbnail or "/static/leaf.png"}"><div class="vt">{v.title}</div><div class="meta"><span>👍 {getattr(v, "like_count", 0)}</span><span style="margin-left:8px">YouTube</span></div></a>'
-        videos_html += '</div>'
-    if not uploaded_vids and not youtube_vids:
-        videos_html += '<h2>Recent</h2><p>No videos yet.</p>'
-
-    # Render server HTML
-    servers_html = ""
-    for s in servers:
-        servers_html += f'<a class="side-video" href="/server/{s.slug}">🌿 {s.name}</a>'
-
-    return jsonify({"videos_html": videos_html, "servers_html": servers_html})
 
 # Add bot to server route
 @app.route("/server/<slug>/add-bot", methods=["POST"])
@@ -255,13 +160,14 @@ def list_users():
     return render_template("users.html", users=[], user=u)
 
 import os, re, secrets, hashlib
+import shutil
 import smtplib
 import ssl
 from email.message import EmailMessage
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from datetime import datetime, date, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, flash, abort
-from sqlalchemy import func
+from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, flash, abort, jsonify, g
+from sqlalchemy import func, select
 from werkzeug.utils import secure_filename
 from markupsafe import escape
 from dotenv import load_dotenv
@@ -292,6 +198,9 @@ if database_url.startswith("postgres://"):
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["MAX_CONTENT_LENGTH"] = 512 * 1024 * 1024  # 512MB
+# Pool sizing per backend, SQLite WAL/pragmas on connect (see db_engine.py)
+from db_engine import engine_options, pool_stats
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_url)
 
 # use the centralized models/db module
 from models import (
@@ -299,24 +208,85 @@ from models import (
     Playlist, PlaylistVideo, Subscription, VideoLike, WatchLater, Short,
     Notification, VoiceParticipant, Friendship, DirectMessage, hash_pw, safe_slug, EmailVerification,
     RtcSignal, RtcParticipant, VideoComment, CustomEmoji, Post, Role, RoleMembership, Advertisement,
-    MusicBot, MusicQueue
+    MusicBot, MusicQueue, TimelineEntry, TrendingScore, RelatedVideo, UploadSession, MediaJob,
+    VideoTitleToken,
 )
 
 # initialize db with the app
 db.init_app(app)
+
+# Schema changes live in migrations.py and run once at worker boot, never per request
+import migrations
+from email_outbox import OutboxSender, enqueue as enqueue_email
+from cache import Generation, GenerationCache, snapshot_rows
+
+from identity import user_cache, invalidate_user
+from profiling import profiler
+from counters import bump
+from events import (hub as event_hub, bridge as event_bridge, publish as publish_event,
+                    stream as event_stream, streaming_supported)
+from fragments import fragment_cache
+from pagination import PAGE_LIMIT, clamp_limit, keyset_page
+import timeline
+import trending
+import related
+from views import view_counter, viewer_key
+from media import send_media
+import resumable
+import media_jobs
+import blobs
+import images
+import snapshots
+
+_NO_USER = object()
+
 def current_user():
+    """Logged-in User (ORM object), loaded at most once per request."""
     uid = session.get("uid")
     if not uid:
         return None
-    return User.query.get(uid)
+    cached = g.get("_current_user", _NO_USER)
+    if cached is not _NO_USER and cached is not None and cached.id == uid:
+        return cached
+    u = User.query.get(uid)
+    g._current_user = u
+    if u:
+        user_cache.put(u)
+    return u
 
-@app.before_request
-def ensure_tables():
-    # Lightweight safeguard to ensure new tables (like EmailVerification) exist after code updates
-    try:
-        db.create_all()
-    except Exception:
-        pass
+def current_identity():
+    """Read-only snapshot of the logged-in user for auth checks on hot endpoints.
+
+    Served from the in-process user cache, so it costs no query while the
+    snapshot is fresh. Use current_user() when the row needs to be modified.
+    """
+    uid = session.get("uid")
+    if not uid:
+        return None
+    snap = user_cache.get(uid)
+    if snap is not None:
+        return snap
+    u = current_user()
+    return user_cache.get(uid) if u else None
+
+# Per-endpoint latency/SQL stats for the admin Profiling tab (see profiling.py)
+profiler.init_app(app, db.Model, is_admin=lambda: bool(getattr(current_identity(), "admin", False)))
+
+def boot_worker():
+    """One-time startup for a web worker: schema check, then background threads."""
+    migrations.ensure_schema(app)
+    if EMAIL_WORKER and SMTP_HOST:
+        outbox_sender.start(app)
+    event_bridge.start(app)
+    if TIMELINE_WORKER:
+        timeline_fanout.start(app)
+    if TRENDING_WORKER:
+        trending.worker.start(app)
+    if RELATED_WORKER:
+        related_worker.start(app)
+    view_counter.start(app)
+    if MEDIA_WORKER:
+        media_jobs.worker.start(app)
 
 # --- Email configuration helpers ---
 SMTP_HOST = os.environ.get("SMTP_HOST")
@@ -327,43 +297,43 @@ SMTP_FROM = os.environ.get("SMTP_FROM", os.environ.get("SMTP_USER", "no-reply@ca
 SMTP_USE_SSL = os.environ.get("SMTP_USE_SSL", "false").lower() in ("1", "true", "yes")
 SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "true").lower() in ("1", "true", "yes")
 
+# Delivery happens off-request over one persistent SMTP session (see email_outbox.py)
+outbox_sender = OutboxSender(SMTP_HOST, SMTP_PORT, user=SMTP_USER, password=SMTP_PASS, sender=SMTP_FROM,
+                             use_ssl=SMTP_USE_SSL, use_tls=SMTP_USE_TLS)
+EMAIL_WORKER = os.environ.get("EMAIL_WORKER", "on").lower() not in ("0", "off", "false", "no")
+
+# Copies new uploads into subscribers' timelines (see timeline.py); off = run `python timeline.py` from cron
+timeline_fanout = timeline.TimelineFanout()
+TIMELINE_WORKER = os.environ.get("TIMELINE_WORKER", "on").lower() not in ("0", "off", "false", "no")
+
+# Flushes view/like/comment events into trending scores (see trending.py); off = write through per event
+TRENDING_WORKER = os.environ.get("TRENDING_WORKER", "on").lower() not in ("0", "off", "false", "no")
+
+# Recomputes related-video lists of liked/playlisted/new videos (see related.py); off = `python related.py` from cron
+related_worker = related.RelatedWorker()
+RELATED_WORKER = os.environ.get("RELATED_WORKER", "on").lower() not in ("0", "off", "false", "no")
+
+# Transcodes uploads to HLS and extracts posters/seek previews on a process pool (see media_jobs.py); off = run `python media_jobs.py` on its own
+MEDIA_WORKER = os.environ.get("MEDIA_WORKER", "on").lower() not in ("0", "off", "false", "no")
+
 def send_email(subject: str, to: str, text_body: str, html_body: str | None = None) -> bool:
-    """Send an email using SMTP settings from environment.
+    """Queue an email in the outbox for the background sender.
 
-    Returns True on success, False otherwise. If SMTP not configured, logs and returns False.
+    Returns True once queued, False otherwise. If SMTP not configured, logs and returns False.
     """
     if not SMTP_HOST or not to:
         # SMTP not configured; avoid breaking the flow in dev
         print(f"[email] SMTP not configured or no recipient. Skipping send to {to} with subject '{subject}'.")
         return False
 
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = SMTP_FROM
-    msg["To"] = to
-    msg.set_content(text_body)
-    if html_body:
-        msg.add_alternative(html_body, subtype="html")
-
     try:
-        if SMTP_USE_SSL:
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=context) as server:
-                if SMTP_USER and SMTP_PASS:
-                    server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-                if SMTP_USE_TLS:
-                    server.starttls(context=ssl.create_default_context())
-                if SMTP_USER and SMTP_PASS:
-                    server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        print(f"[email] Sent to {to}: {subject}")
-        return True
+        enqueue_email(subject, to, text_body, html_body)
     except Exception as e:
-        print(f"[email] Failed to send to {to}: {e}")
+        db.session.rollback()
+        print(f"[email] Failed to queue mail to {to}: {e}")
         return False
+    outbox_sender.notify()
+    return True
 
 def send_welcome_email(user: User):
     """Compose and send the welcome email to a new user."""
@@ -444,6 +414,9 @@ def send_password_reset_email(user: User):
     )
 
 # Template filters
+# img_tag(src, width, alt=..., sizes=..., class=...): <picture> with AVIF/WebP derivatives (see images.py)
+app.add_template_global(images.img_tag, "img_tag")
+
 @app.template_filter("date")
 def jinja_date(value, fmt: str = "%b %d, %Y"):
     """Format dates safely in templates.
@@ -487,16 +460,8 @@ def install():
         msg = ""
         errors = []
         env_content = ""
-        # Create backup before installation
-        import shutil
-        from datetime import datetime
-        backup_dir = os.path.join(BASE_DIR, "backups")
-        os.makedirs(backup_dir, exist_ok=True)
-
-        # Backup database if it exists
-        db_path = os.path.join(BASE_DIR, "cannaspot.db")
-        if os.path.exists(db_path):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Snapshot uploads and the database before installation (incremental, see snapshots.py)
+        _pre_install_snapshot()
 
         # List of models for backup or other operations (only valid models)
         models_list = [
@@ -558,16 +523,8 @@ def install():
         pass
     if request.method == "POST":
         env_content = ""
-        # Create backup before installation
-        import shutil
-        from datetime import datetime
-        backup_dir = os.path.join(BASE_DIR, "backups")
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # Backup database if it exists
-        db_path = os.path.join(BASE_DIR, "cannaspot.db")
-        if os.path.exists(db_path):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Snapshot uploads and the database before installation (incremental, see snapshots.py)
+        _pre_install_snapshot()
         # List of models for backup or other operations (only valid models)
         models_list = [
             ('User', User),
@@ -658,6 +615,7 @@ def install():
         db.engine.dispose()
         db.drop_all()
         db.create_all()
+        migrations.stamp(db.engine)
         username = request.form["admin_user"].strip()
         display  = request.form.get("admin_display", username)
         email    = request.form["admin_email"].strip()
@@ -687,6 +645,7 @@ def install():
         db.session.add_all([Membership(user_id=admin.id, server_id=srv.id), Membership(user_id=bot.id, server_id=srv.id)])
         db.session.add(Sponsor(name="Top420Seeds.com", url="https://top420seeds.com", logo="/static/logo.png", active=True))
         db.session.commit()
+        site_globals.invalidate()
         
         # Populate with cannabis grow videos
         print("📺 Populating recent videos with real YouTube cannabis content...")
@@ -721,6 +680,7 @@ def install():
             )
             db.session.add(video)
         db.session.commit()
+        invalidate_feed(reset=True)
         print(f"✅ Added {len(youtube_videos)} real YouTube cannabis grow videos!")
 
         
@@ -734,6 +694,12 @@ def install():
         return redirect(url_for("login"))
     return render_template("install.html", version=APP_VERSION)
 
+def _pre_install_snapshot():
+    try:
+        snapshots.snapshot(db.engine.url.render_as_string(hide_password=False), label="pre-install")
+    except Exception as e:
+        print(f"[install] Could not back up before installing: {e}")
+
 @app.route("/installed")
 def installed():
     return render_template("installed.html")
@@ -841,6 +807,7 @@ def reset_password(token):
         else:
             user.password_hash = hash_pw(pw)
             db.session.commit()
+            invalidate_user(user.id)
             flash("Password updated. You can now log in.", "success")
             return redirect(url_for("login"))
     return render_template("reset_password.html")
@@ -850,51 +817,182 @@ def logout():
     session.clear()
     return redirect(url_for("login"))
 
+# Everything the anonymous home page is built from
+HOME_PAGE_TAGS = ("videos", "servers", "live", "site_globals")
+
+def _live_banner():
+    v = Video.query.filter_by(is_live=True).order_by(Video.created_at.desc()).first()
+    if not v:
+        return ""
+    return (f'<section class="card live-card" id="liveSection"><h2 style="color:red">LIVE NOW</h2>'
+            f'<div class="video-player"><video src="{escape(v.filename)}" controls autoplay style="width:100%;max-width:640px;"></video>'
+            f'<div class="live-title">{escape(v.title)}</div></div></section>')
+
+def _render_home(user):
+    """recent.html, or None before the first account exists (the caller sends them to the welcome page)."""
+    if db.session.query(User.id).first() is None:
+        return None
+    # Video and server lists come pre-rendered from the feed cache; recent.html then listens for changes
+    feed = feed_cache.get()
+    live_html = fragment_cache.get_or_render("home:live", ("live",), _live_banner)
+    return render_template("recent.html", feed=feed, user=user, live_html=live_html)
+
 @app.route("/")
 def recent():
     try:
-        # Check if database is initialized
-        user_count = User.query.count()
-        if user_count == 0:
-            # No users, redirect to welcome page
+        if session.get("uid"):
+            page = _render_home(current_user())
+        else:
+            # The same for every anonymous visitor: served from the fragment cache without the ORM or Jinja
+            page = fragment_cache.get_or_render("page:home", HOME_PAGE_TAGS, lambda: _render_home(None))
+        if page is None:
             return redirect(url_for("welcome"))
-        
-        # Get GrowBot user ID (YouTube videos uploader)
-        bot = User.query.filter_by(username="GrowBot").first()
-        bot_id = bot.id if bot else None
-        
-        # Get uploaded videos (not from GrowBot) - show these first
-        uploaded_vids = Video.query.filter(Video.uploader_id != bot_id).order_by(Video.created_at.desc()).limit(12).all() if bot_id else []
-        
-        # Get YouTube videos (from GrowBot) - show after uploaded
-        youtube_vids = Video.query.filter_by(uploader_id=bot_id).order_by(Video.created_at.desc()).limit(12).all() if bot_id else []
-        
-        # Check for active live video
-        live_video = Video.query.filter_by(is_live=True).order_by(Video.created_at.desc()).first()
-
-        # Combine: uploaded first, then YouTube
-        vids = uploaded_vids + youtube_vids
-
-        # Add like counts to each video
-        for v in vids:
-            v.like_count = VideoLike.query.filter_by(video_id=v.id).count()
-
-        servers = Server.query.order_by(Server.name).all()
-        return render_template("recent.html", videos=vids, uploaded=uploaded_vids, youtube=youtube_vids, servers=servers, user=current_user(), live_video=live_video)
+        return page
     except Exception as e:
         # Database not initialized, redirect to welcome
         print(f"Error loading home page: {e}")
         return redirect(url_for("welcome"))
 
+# ===================== Home feed (rendered once per change, polled by recent.html) =====================
+FEED_LIMIT = 12
+TRENDING_FEED_LIMIT = 6
+FEED_TTL = float(os.environ.get("FEED_TTL", "300"))
+# Bumped when cards disappear or change (deletes, renames); clients then reload the whole feed
+feed_resets = Generation("feed-reset")
+# Same as the img_tag calls in _video_cards.html
+VIDEO_CARD_SIZES = "(max-width: 600px) 100vw, 360px"
+
+def _video_card(v, meta):
+    thumb = images.img_tag(v.thumbnail, 480, sizes=VIDEO_CARD_SIZES, **{"class": "thumb"})
+    return (f'<a class="vcard" href="/watch/{v.id}" data-id="{v.id}">{thumb}'
+            f'<div class="vt">{escape(v.title)}</div><div class="meta"><span>👍 {v.like_count or 0}</span>'
+            f'<span style="margin-left:8px">{meta}</span></div></a>')
+
+def _load_more(listing, next_cursor):
+    """Infinite-scroll trigger after a grid; same markup as templates/_load_more.html."""
+    if not next_cursor:
+        return ""
+    return (f'<button type="button" class="btn load-more" data-listing="{listing}" '
+            f'data-next="{next_cursor}">Load more</button>')
+
+def _load_feed():
+    # Uploaded videos (not from GrowBot) first, then GrowBot's YouTube picks
+    uploaded_page = video_page("recent", None, limit=FEED_LIMIT)
+    youtube_page = video_page("tutorials", None, limit=FEED_LIMIT)
+    uploaded, youtube = uploaded_page.items, youtube_page.items
+    servers = Server.query.order_by(Server.name).all()
+    hot = trending.top_videos(TRENDING_FEED_LIMIT)
+
+    uploaded_cards = [(v.id, _video_card(v, v.created_at.strftime("%b %d, %Y"))) for v in uploaded]
+    youtube_cards = [(v.id, _video_card(v, "YouTube")) for v in youtube]
+    videos_html = ""
+    if hot:
+        # Not part of the ?since= deltas: it changes all the time and refreshes with the cache TTL
+        videos_html += ('<h2>🔥 Trending</h2><div class="video-grid">'
+                        + "".join(_video_card(v, f"👁 {v.view_count or 0}") for v in hot) + '</div>'
+                        + '<a class="btn" href="/trending">See all trending</a>')
+    if uploaded_cards:
+        videos_html += ('<h2 style="margin-top:32px">📤 Uploaded Videos</h2><div class="video-grid" data-feed="uploaded">'
+                        + "".join(card for _, card in uploaded_cards) + '</div>'
+                        + _load_more("recent", uploaded_page.next_cursor))
+    if youtube_cards:
+        videos_html += ('<h2 style="margin-top:32px">🎬 Featured Grow Tutorials</h2><div class="video-grid" data-feed="youtube">'
+                        + "".join(card for _, card in youtube_cards) + '</div>'
+                        + _load_more("tutorials", youtube_page.next_cursor))
+    if not videos_html:
+        videos_html = '<h2>Recent</h2><p>No videos yet.</p>'
+
+    reset = feed_resets.shared()
+    max_vid = max((v.id for v in uploaded + youtube), default=0)
+    max_sid = max((s.id for s in servers), default=0)
+    return {
+        # Clients send this back as ?since= and it doubles as the ETag
+        "version": f"{reset}.{max_vid}.{max_sid}",
+        "reset": reset,
+        "max_sid": max_sid,
+        "uploaded": uploaded_cards,
+        "youtube": youtube_cards,
+        "videos_html": videos_html,
+        "servers_html": "".join(f'<a class="side-video" href="/server/{s.slug}">🌿 {escape(s.name)}</a>' for s in servers),
+    }
+
+feed_cache = GenerationCache(Generation("feed"), _load_feed, ttl=FEED_TTL)
+
+def invalidate_feed(reset=False, tags=("videos",), **event):
+    """Call after uploads and server changes; reset=True when cards were removed or edited.
+
+    ``tags`` are the fragment cache tags that changed ("videos", "servers").
+    Also pushes a "feed" event to open /api/events streams; ``event`` goes into its data.
+    """
+    if reset:
+        feed_resets.bump()
+    feed_cache.invalidate()
+    fragment_cache.invalidate(*tags)
+    publish_event("feed", reset=reset, **event)
+
+@app.route("/api/main-content")
+def api_main_content():
+    """Home feed for recent.html polling.
+
+    If-None-Match with the current version answers 304 from memory. With
+    ?since=<version> only the cards added after that version are returned.
+    """
+    feed = feed_cache.get()
+    version = feed["version"]
+    since = request.args.get("since", "")
+    if request.if_none_match.contains_weak(version) or since == version:
+        resp = app.response_class(status=304)
+    else:
+        parts = since.split(".")
+        if len(parts) == 3 and parts[0] == feed["reset"] and parts[1].isdigit() and parts[2].isdigit():
+            since_vid, since_sid = int(parts[1]), int(parts[2])
+            resp = jsonify({
+                "version": version,
+                "full": False,
+                "uploaded": [card for vid, card in feed["uploaded"] if vid > since_vid],
+                "youtube": [card for vid, card in feed["youtube"] if vid > since_vid],
+                "servers_html": feed["servers_html"] if feed["max_sid"] > since_sid else None,
+            })
+        else:
+            resp = jsonify({"version": version, "full": True,
+                            "videos_html": feed["videos_html"], "servers_html": feed["servers_html"]})
+    resp.set_etag(version, weak=True)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+@app.route("/api/events")
+def api_events():
+    """Server-Sent Events for recent.html (see events.py).
+
+    A "feed" event means /api/main-content has changed. Resumes after the
+    Last-Event-ID header (or ?last_id=). Answers 204 when this worker can't
+    hold streams open, which stops EventSource and leaves the page polling.
+    """
+    if not streaming_supported(request.environ):
+        return "", 204
+    event_bridge.start(app)
+    if event_hub.floor is None:
+        event_bridge.poll_once()  # first stream in this worker, before the bridge thread ran
+    if not event_hub.acquire_stream():
+        return "", 204
+    raw = request.headers.get("Last-Event-ID") or request.args.get("last_id", "")
+    last_id = int(raw) if raw.isdigit() else event_hub.last_id
+    # The stream only reads the in-process hub: don't hold a pooled connection for its lifetime
+    db.session.close()
+    resp = app.response_class(event_stream(last_id), mimetype="text/event-stream")
+    resp.call_on_close(event_hub.release_stream)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx: flush every frame
+    return resp
+
 @app.route("/watch/<int:vid>", methods=["GET", "POST"])
 def watch(vid):
     v = Video.query.get_or_404(vid)
     u = current_user()
     
-    # Increment view count (only on GET, not on comment POST)
-    if request.method == "GET":
-        v.view_count = (v.view_count or 0) + 1
-        db.session.commit()
+    # Count the view (only on GET, not on comment POST); buffered and flushed in batches by views.py
+    if request.method == "GET" and view_counter.count(vid, viewer_key(session)):
+        trending.record(vid, "view")
     
     # Handle comment submission
     if request.method == "POST" and u:
@@ -902,12 +1000,14 @@ def watch(vid):
         if content:
             comment = VideoComment(video_id=vid, user_id=u.id, content=content)
             db.session.add(comment)
+            bump(Video.comment_count, vid)
             db.session.commit()
+            trending.record(vid, "comment")
             # Notify uploader
             if v.uploader_id and v.uploader_id != u.id:
                 notif = Notification(
                     user_id=v.uploader_id,
-                    message=f"{u.username} commented on your video: {v.title[:30]}",
+                    message=f"{u.uname} commented on your video: {v.title[:30]}",
                     link=url_for("watch", vid=vid)
                 )
                 db.session.add(notif)
@@ -921,13 +1021,17 @@ def watch(vid):
                     .order_by(VideoComment.created_at.desc())
                     .all())
     
-    comments = [{"author": user.username, "text": comment.content, "created_at": comment.created_at} 
+    comments = [{"author": user.uname, "text": comment.content, "created_at": comment.created_at} 
                 for comment, user in comments_data]
     
     # Get uploader info
     uploader = User.query.get(v.uploader_id) if v.uploader_id else None
-    more = Video.query.order_by(Video.created_at.desc()).limit(10).all()
-    return render_template("watch.html", video=v, related=more, comments=comments, user=u, uploader=uploader)
+    more = related.related_videos(vid, 10)
+    if not more:
+        # Not computed yet (brand-new upload): latest videos instead
+        more = Video.query.filter(Video.id != vid).order_by(Video.created_at.desc()).limit(10).all()
+    return render_template("watch.html", video=v, related=more, comments=comments, user=u, uploader=uploader,
+                           view_count=(v.view_count or 0) + view_counter.pending(vid))
 
 from werkzeug.utils import secure_filename
 @app.route("/upload", methods=["GET","POST"])
@@ -940,19 +1044,14 @@ def upload():
         title = request.form.get("title","Untitled")
         desc = request.form.get("description","")
         if f:
-            fname = secure_filename(f.filename)
-            path = os.path.join("uploads","videos", fname)
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            f.save(path)
-            thumb_rel = None
-            if t:
-                tname = secure_filename(t.filename)
-                tpath = os.path.join("uploads","thumbnails", tname)
-                os.makedirs(os.path.dirname(tpath), exist_ok=True)
-                t.save(tpath)
-                thumb_rel = "/uploads/thumbnails/" + tname
-            v = Video(title=title, filename="/uploads/videos/"+fname, thumbnail=thumb_rel, description=desc, uploader_id=u.id)
+            # Stored by content hash (see blobs.py)
+            video_url = blobs.store(f)
+            thumb_rel = blobs.store(t) if t and t.filename else None
+            v = Video(title=title, filename=video_url, thumbnail=thumb_rel, description=desc, uploader_id=u.id)
             db.session.add(v); db.session.commit()
+            media_jobs.enqueue("video", v)
+            timeline_fanout.notify()
+            invalidate_feed(video=v.id)
             return redirect(url_for("recent"))
     return render_template("upload.html", user=u)
 
@@ -966,26 +1065,82 @@ def upload_short():
         t = request.files.get("thumb")
         title = request.form.get("title","Untitled Short")
         if f:
-            fname = secure_filename(f.filename)
-            path = os.path.join("uploads","videos", fname)
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            f.save(path)
-            
-            thumb_rel = None
-            if t:
-                tname = secure_filename(t.filename)
-                tpath = os.path.join("uploads","thumbnails", tname)
-                os.makedirs(os.path.dirname(tpath), exist_ok=True)
-                t.save(tpath)
-                thumb_rel = "/uploads/thumbnails/" + tname
-            
-            short = Short(title=title, filename="/uploads/videos/"+fname, thumbnail=thumb_rel, uploader_id=u.id)
+            video_url = blobs.store(f)
+            thumb_rel = blobs.store(t) if t and t.filename else None
+            short = Short(title=title, filename=video_url, thumbnail=thumb_rel, uploader_id=u.id)
             db.session.add(short)
             db.session.commit()
+            media_jobs.enqueue("short", short)
+            publish_event("short", short=short.id)
             flash("Short uploaded successfully!", "success")
             return redirect(url_for("shorts"))
     return render_template("upload_short.html", user=u)
 
+# ===================== Resumable uploads (see resumable.py) =====================
+TUS_HEADERS = {"Tus-Resumable": "1.0.0", "Cache-Control": "no-store"}
+
+def _upload_error(e):
+    body = {"error": str(e)}
+    return body, e.status, TUS_HEADERS
+
+@app.route("/api/uploads", methods=["POST"])
+def api_upload_create():
+    u = current_user()
+    if not u:
+        return {"error": "Not logged in"}, 401
+    try:
+        length = int(request.form.get("length") or request.headers.get("Upload-Length", ""))
+    except ValueError:
+        return {"error": "length is required"}, 400
+    try:
+        upload = resumable.create(u.id, request.form.get("kind", "video"), request.form.get("filename", ""), length,
+                                  request.form.get("title", ""), request.form.get("description", ""),
+                                  request.files.get("thumb"))
+    except resumable.UploadError as e:
+        return _upload_error(e)
+    location = url_for("api_upload", token=upload.token)
+    return ({"token": upload.token, "location": location, "offset": 0, "expires": upload.expires_at.isoformat()},
+            201, {**TUS_HEADERS, "Location": location, "Upload-Offset": "0"})
+
+@app.route("/api/uploads/<token>", methods=["HEAD", "PATCH", "DELETE"])
+def api_upload(token):
+    u = current_user()
+    if not u:
+        return {"error": "Not logged in"}, 401
+    upload = UploadSession.query.filter_by(token=token, user_id=u.id).first()
+    if not upload:
+        return {"error": "Upload not found or expired"}, 404, TUS_HEADERS
+    if request.method == "HEAD":
+        return "", 200, {**TUS_HEADERS, "Upload-Offset": str(upload.received), "Upload-Length": str(upload.length)}
+    if request.method == "DELETE":
+        resumable.abandon(upload)
+        return "", 204, TUS_HEADERS
+    if request.mimetype != "application/offset+octet-stream":
+        return {"error": "Content-Type must be application/offset+octet-stream"}, 415, TUS_HEADERS
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        return {"error": "Upload-Offset is required"}, 400, TUS_HEADERS
+    try:
+        offset = resumable.append(upload, offset, request.stream, request.headers.get("Upload-Checksum"))
+    except resumable.UploadError as e:
+        body, status, headers = _upload_error(e)
+        body["offset"] = upload.received
+        return body, status, {**headers, "Upload-Offset": str(upload.received)}
+    headers = {**TUS_HEADERS, "Upload-Offset": str(offset)}
+    if offset < upload.length:
+        return {"offset": offset, "complete": False}, 200, headers
+    row = resumable.finalize(upload)
+    media_jobs.enqueue("short" if isinstance(row, Short) else "video", row)
+    if isinstance(row, Short):
+        publish_event("short", short=row.id)
+        url = url_for("shorts")
+    else:
+        timeline_fanout.notify()
+        invalidate_feed(video=row.id)
+        url = url_for("watch", vid=row.id)
+    return {"offset": offset, "complete": True, "url": url}, 200, headers
+
 @app.route("/servers")
 def servers_view():
     servers = Server.query.order_by(Server.name).all()
@@ -1014,7 +1169,7 @@ def channel(slug, cid):
     s = Server.query.filter_by(slug=slug).first_or_404()
     ch = Channel.query.get_or_404(cid)
     u = current_user()
-    channels = Channel.query.filter_by(server_id=s.id).all()
+    channels = Channel.query.filter_by(server=s.id).order_by(Channel.pos, Channel.id).all()
     if request.method == "POST" and u:
         content = request.form.get("content","").strip()[:2000]
         if content:
@@ -1037,11 +1192,7 @@ def create_server():
         icon_path = None
         
         if icon_file and icon_file.filename:
-            fname = secure_filename(icon_file.filename)
-            icon_path = os.path.join("uploads", "avatars", f"server_{secrets.token_hex(4)}_{fname}")
-            os.makedirs(os.path.dirname(icon_path), exist_ok=True)
-            icon_file.save(icon_path)
-            icon_path = "/" + icon_path.replace("\\", "/")
+            icon_path = blobs.store(icon_file)
         
         s = Server(name=name, slug=slug, owner_id=u.id, server_icon=icon_path)
         db.session.add(s); db.session.commit()
@@ -1051,6 +1202,8 @@ def create_server():
         db.session.add(Channel(server_id=s.id, name="Voice Chat", is_voice=True))
         db.session.commit()
         db.session.add(Membership(user_id=u.id, server_id=s.id)); db.session.commit()
+        site_globals.invalidate()
+        invalidate_feed(tags=("servers",), server=s.id)
         return redirect(url_for("server", slug=slug))
     return render_template("create_server.html", user=u)
 
@@ -1212,6 +1365,7 @@ def my_profile():
         u.dname = new_dname or u.dname
         u.profile_html = request.form.get("profile_html")[:5000]
         db.session.commit()
+        invalidate_user(u.id)
         flash("✅ Profile updated successfully!", "success")
         return redirect(url_for("my_profile"))
     return render_template("profile.html", user=u)
@@ -1242,6 +1396,7 @@ def change_password():
     # Update password
     u.password_hash = hash_pw(new_pw)
     db.session.commit()
+    invalidate_user(u.id)
     flash("✅ Password changed successfully!", "success")
     return redirect(url_for("my_profile"))
 
@@ -1259,6 +1414,7 @@ def admin_panel():
             if x:
                 x.admin = True
                 db.session.commit()
+                invalidate_user(x.id)
                 flash(f"✅ {x.username} is now an admin", "success")
 
         elif action == "remove_admin":
@@ -1267,6 +1423,7 @@ def admin_panel():
             if x and x.id != u.id:  # Can't demote yourself
                 x.admin = False
                 db.session.commit()
+                invalidate_user(x.id)
                 flash(f"✅ Removed admin from {x.username}", "success")
 
         elif action == "ban_user":
@@ -1275,6 +1432,7 @@ def admin_panel():
             if x and x.id != u.id and x.status != "banned":
                 x.status = "banned"
                 db.session.commit()
+                invalidate_user(x.id)
                 flash(f"🚫 Banned user {x.username}", "warning")
 
         elif action == "unban_user":
@@ -1283,6 +1441,7 @@ def admin_panel():
             if x and x.status == "banned":
                 x.status = "online"
                 db.session.commit()
+                invalidate_user(x.id)
                 flash(f"✅ Unbanned user {x.username}", "success")
 
         elif action == "reset_password":
@@ -1293,6 +1452,7 @@ def admin_panel():
                 new_pw = secrets.token_urlsafe(8)
                 x.password_hash = hash_pw(new_pw)
                 db.session.commit()
+                invalidate_user(x.id)
                 flash(f"🔑 Password for {x.username} reset to: {new_pw}", "success")
 
         elif action == "delete_user":
@@ -1300,6 +1460,17 @@ def admin_panel():
             x = User.query.get(uid)
             if x and x.id != u.id:  # Can't delete yourself
                 # Delete user's content
+                TimelineEntry.query.filter((TimelineEntry.user_id == uid) | (TimelineEntry.uploader_id == uid)).delete()
+                TrendingScore.query.filter(TrendingScore.video_id.in_(select(Video.id).where(Video.uploader_id == uid))).delete()
+                RelatedVideo.query.filter(RelatedVideo.video_id.in_(select(Video.id).where(Video.uploader_id == uid))
+                                          | RelatedVideo.related_id.in_(select(Video.id).where(Video.uploader_id == uid))).delete()
+                VideoTitleToken.query.filter(VideoTitleToken.video_id.in_(select(Video.id).where(Video.uploader_id == uid))).delete()
+                MediaJob.query.filter(MediaJob.kind == "video",
+                                      MediaJob.target_id.in_(select(Video.id).where(Video.uploader_id == uid))).delete()
+                for filename, thumbnail in db.session.execute(
+                        select(Video.filename, Video.thumbnail).where(Video.uploader_id == uid)).all():
+                    blobs.release(filename)
+                    blobs.release(thumbnail)
                 Video.query.filter_by(uploader_id=uid).delete()
                 Message.query.filter_by(user_id=uid).delete()
                 DirectMessage.query.filter(
@@ -1312,6 +1483,8 @@ def admin_panel():
                 Membership.query.filter_by(user_id=uid).delete()
                 db.session.delete(x)
                 db.session.commit()
+                invalidate_user(uid)
+                invalidate_feed(reset=True, tags=("videos", "live"))
                 flash(f"🗑️ Deleted user {x.username} and all their content", "warning")
         
         # Video management
@@ -1322,15 +1495,24 @@ def admin_panel():
                 # Delete related records
                 VideoLike.query.filter_by(video_id=vid).delete()
                 WatchLater.query.filter_by(video_id=vid).delete()
+                TimelineEntry.query.filter_by(video_id=vid).delete()
+                TrendingScore.query.filter_by(video_id=vid).delete()
+                RelatedVideo.query.filter((RelatedVideo.video_id == vid) | (RelatedVideo.related_id == vid)).delete()
+                VideoTitleToken.query.filter_by(video_id=vid).delete()
                 PlaylistVideo.query.filter_by(video_id=vid).delete()
-                # Try to delete actual file
-                if v.filename and os.path.exists(v.filename.lstrip('/')):
+                MediaJob.query.filter_by(kind="video", target_id=vid).delete()
+                blobs.release(v.thumbnail)
+                # Try to delete actual file; stored blobs may be shared and go once unreferenced
+                if not blobs.release(v.filename) and v.filename and os.path.exists(v.filename.lstrip('/')):
                     try:
                         os.remove(v.filename.lstrip('/'))
                     except:
                         pass
+                for media_dir in (media_jobs.HLS_DIR, media_jobs.PREVIEW_DIR):
+                    shutil.rmtree(os.path.join(media_dir, f"video-{vid}"), ignore_errors=True)
                 db.session.delete(v)
                 db.session.commit()
+                invalidate_feed(reset=True, tags=("videos", "live"))
                 flash(f"🗑️ Deleted video: {v.title}", "warning")
 
         elif action == "feature_video":
@@ -1339,6 +1521,7 @@ def admin_panel():
             if v:
                 v.is_live = True
                 db.session.commit()
+                fragment_cache.invalidate("live")
                 flash(f"🌟 Featured video: {v.title}", "success")
 
         elif action == "edit_video":
@@ -1347,7 +1530,9 @@ def admin_panel():
             v = Video.query.get(vid)
             if v and new_title:
                 v.title = new_title
+                related.mark_stale(vid)  # re-indexes the title words
                 db.session.commit()
+                invalidate_feed(reset=True, tags=("videos", "live"))
                 flash(f"✏️ Updated video title to: {new_title}", "success")
         
         # Server management
@@ -1361,8 +1546,11 @@ def admin_panel():
                     VoiceParticipant.query.filter_by(channel_id=ch.id).delete()
                 Channel.query.filter_by(server_id=sid).delete()
                 Membership.query.filter_by(server_id=sid).delete()
+                blobs.release(s.icon)
                 db.session.delete(s)
                 db.session.commit()
+                site_globals.invalidate()
+                invalidate_feed(reset=True, tags=("servers",))
                 flash(f"🗑️ Deleted server: {s.name}", "warning")
 
         elif action == "edit_server":
@@ -1373,6 +1561,8 @@ def admin_panel():
                 s.name = new_name
                 s.slug = safe_slug(new_name)
                 db.session.commit()
+                site_globals.invalidate()
+                invalidate_feed(reset=True, tags=("servers",))
                 flash(f"✏️ Updated server name to: {new_name}", "success")
 
         elif action == "manage_members":
@@ -1389,6 +1579,7 @@ def admin_panel():
             name = request.form.get("name"); url = request.form.get("url")
             db.session.add(Sponsor(name=name, url=url, logo="/static/logo.png", active=True))
             db.session.commit()
+            site_globals.invalidate()
             flash(f"✅ Added sponsor: {name}", "success")
         
         elif action == "toggle_sponsor":
@@ -1397,6 +1588,7 @@ def admin_panel():
             if s:
                 s.active = not s.active
                 db.session.commit()
+                site_globals.invalidate()
                 flash(f"✅ Sponsor {s.name} is now {'active' if s.active else 'inactive'}", "success")
         
         elif action == "delete_sponsor":
@@ -1405,6 +1597,7 @@ def admin_panel():
             if s:
                 db.session.delete(s)
                 db.session.commit()
+                site_globals.invalidate()
                 flash(f"🗑️ Deleted sponsor: {s.name}", "warning")
         
         # Emoji management
@@ -1418,14 +1611,8 @@ def admin_panel():
             if 'emoji_image' in request.files:
                 file = request.files['emoji_image']
                 if file and file.filename:
-                    fname = secure_filename(file.filename)
-                    # Create emojis directory if it doesn't exist
-                    emoji_dir = os.path.join(UPLOAD_DIR, 'emojis')
-                    os.makedirs(emoji_dir, exist_ok=True)
-                    # Save with unique name
-                    unique_fname = f"{secrets.token_hex(8)}_{fname}"
-                    image_path = os.path.join('emojis', unique_fname)
-                    file.save(os.path.join(UPLOAD_DIR, image_path))
+                    # Relative to uploads/, like emojis saved before the blob store
+                    image_path = blobs.store(file).removeprefix("/uploads/")
             
             # Need either emoji_char or image
             if emoji_char or image_path:
@@ -1453,6 +1640,7 @@ def admin_panel():
             eid = int(request.form.get("emoji_id"))
             e = CustomEmoji.query.get(eid)
             if e:
+                blobs.release(e.image_path)
                 db.session.delete(e)
                 db.session.commit()
                 flash(f"🗑️ Deleted emoji: {e.emoji_char}", "warning")
@@ -1519,12 +1707,62 @@ def admin_panel():
                          users=users, videos=videos, servers=servers, 
                          recent_messages=recent_messages, custom_emojis=custom_emojis,
                          advertisements=advertisements, activity_log=activity_log,
-                         notifications=notifications)
+                         notifications=notifications, profile_stats=profiler.report())
+
+@app.route("/theGspot/profile/<int:dump_id>")
+def admin_profile_dump(dump_id):
+    """Query list captured for one request sent with X-Profile-Queries: 1"""
+    u = current_user()
+    if not (u and u.admin): abort(403)
+    dump = profiler.dump(dump_id)
+    if not dump:
+        return {"error": "Dump not found (only the last 50 are kept)"}, 404
+    return jsonify(dump)
+
+@app.route("/theGspot/profile/reset", methods=["POST"])
+def admin_profile_reset():
+    u = current_user()
+    if not (u and u.admin): abort(403)
+    profiler.reset()
+    flash("⏱️ Profiling stats cleared", "success")
+    return redirect(url_for("admin_panel"))
+
+@app.route("/admin/site-settings", methods=["POST"])
+def admin_site_settings():
+    u = current_user()
+    if not u or not u.admin:
+        return redirect(url_for("login"))
+    # SiteSetting model not defined, so this route is currently a placeholder
+    flash("Site settings model not implemented.", "error")
+    return redirect(url_for("admin_panel"))
+
+@app.route("/admin/ad/<int:ad_id>/edit", methods=["POST"])
+def admin_edit_ad(ad_id):
+    u = current_user()
+    if not u or not u.admin:
+        return redirect(url_for("login"))
+    ad = Advertisement.query.get_or_404(ad_id)
+    # Update fields
+    ad.title = request.form.get("title", ad.title).strip()
+    ad.content = request.form.get("content", ad.content)
+    ad.link = request.form.get("link", ad.link)
+    ad.placement = request.form.get("placement", ad.placement)
+    # Handle image upload
+    ad_image = request.files.get("image")
+    if ad_image and ad_image.filename:
+        # Store first: store() commits on its own connection, release() writes in this session
+        image, ad.image = ad.image, blobs.store(ad_image)
+        blobs.release(image)
+    ad.updated_at = datetime.utcnow()
+    db.session.commit()
+    site_globals.invalidate()
+    flash("✅ Advertisement updated!", "success")
+    return redirect(url_for("admin_panel"))
 
 @app.route("/admin/ad/create", methods=["POST"])
 def admin_create_ad():
     u = current_user()
-    if not u or not u.is_admin:
+    if not u or not u.admin:
         return redirect(url_for("login"))
     
     title = request.form.get("title", "").strip()
@@ -1536,11 +1774,7 @@ def admin_create_ad():
     image_path = None
     ad_image = request.files.get("image")
     if ad_image and ad_image.filename:
-        fname = secure_filename(ad_image.filename)
-        image_path = os.path.join("uploads", "ads", f"ad_{secrets.token_hex(4)}_{fname}")
-        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-        ad_image.save(image_path)
-        image_path = "/" + image_path.replace("\\", "/")
+        image_path = blobs.store(ad_image)
     
     ad = Advertisement(
         title=title,
@@ -1552,29 +1786,33 @@ def admin_create_ad():
     )
     db.session.add(ad)
     db.session.commit()
+    site_globals.invalidate()
     flash("✅ Advertisement created!", "success")
     return redirect(url_for("admin_panel"))
 
 @app.route("/admin/ad/<int:ad_id>/toggle", methods=["POST"])
 def admin_toggle_ad(ad_id):
     u = current_user()
-    if not u or not u.is_admin:
+    if not u or not u.admin:
         return {"error": "Unauthorized"}, 403
     
     ad = Advertisement.query.get_or_404(ad_id)
     ad.is_active = not ad.is_active
     db.session.commit()
+    site_globals.invalidate()
     return {"success": True, "is_active": ad.is_active}
 
 @app.route("/admin/ad/<int:ad_id>/delete", methods=["POST"])
 def admin_delete_ad(ad_id):
     u = current_user()
-    if not u or not u.is_admin:
+    if not u or not u.admin:
         return redirect(url_for("login"))
     
     ad = Advertisement.query.get_or_404(ad_id)
+    blobs.release(ad.image)
     db.session.delete(ad)
     db.session.commit()
+    site_globals.invalidate()
     flash("🗑️ Advertisement deleted", "warning")
     return redirect(url_for("admin_panel"))
 
@@ -1596,16 +1834,30 @@ def ad_click(ad_id):
 
 @app.route("/uploads/<path:filename>")
 def uploads(filename):
-    return send_from_directory("uploads", filename)
+    # Range/ETag aware, sendfile or X-Accel-Redirect/X-Sendfile offload (see media.py)
+    return send_media(UPLOAD_DIR, filename)
+
+@app.route("/img/<fmt>/<int:width>/<path:src>")
+def image_derivative(fmt, width, src):
+    # Resized WebP/AVIF copy of an /uploads/ or /static/ image, rendered on first request
+    return images.serve(fmt, width, src)
+
+def _load_site_globals():
+    # Snapshots, not ORM rows, so the lists can be shared across requests
+    return dict(
+        sponsors=snapshot_rows(Sponsor.query.filter_by(active=True).all()),
+        servers=snapshot_rows(Server.query.order_by(Server.created.desc()).all()),
+        # Get active ads for different placements
+        sidebar_ads=snapshot_rows(Advertisement.query.filter_by(is_active=True, placement='sidebar').limit(3).all()),
+        feed_ads=snapshot_rows(Advertisement.query.filter_by(is_active=True, placement='feed').limit(2).all()),
+    )
+
+# Sponsor/server/ad chrome shown on every page; admin and server actions bump the generation
+site_globals = GenerationCache(Generation("site_globals"), _load_site_globals)
 
 @app.context_processor
 def inject_globals():
-    sponsors = Sponsor.query.filter_by(active=True).all()
-    servers = Server.query.order_by(Server.created.desc()).all()
-    # Get active ads for different placements
-    sidebar_ads = Advertisement.query.filter_by(is_active=True, placement='sidebar').limit(3).all()
-    feed_ads = Advertisement.query.filter_by(is_active=True, placement='feed').limit(2).all()
-    return dict(app_version="3.6", sponsors=sponsors, servers=servers, sidebar_ads=sidebar_ads, feed_ads=feed_ads)
+    return dict(app_version="3.6", **site_globals.get())
 
 # ===================== WebRTC (Polling-based signaling for LiteSpeed) =====================
 from datetime import timedelta
@@ -1716,10 +1968,72 @@ def rtc_poll(room):
         pass
     return {"success": True, "signals": out, "latest": (out[-1]["id"] if out else since)}
 
+# ===================== Video listings (keyset-paginated, see pagination.py) =====================
+_growbot = select(User.id).where(User.uname == "GrowBot")
+
+def _keyset(build):
+    """Page function for a listing given by build(user) -> (query, timestamp column, id column)."""
+    return lambda u, cursor, limit: keyset_page(*build(u), cursor, limit)
+
+# name -> (login required, page(user, cursor, limit) -> Page)
+VIDEO_LISTINGS = {
+    "recent": (False, _keyset(lambda u: (Video.query.filter(Video.uploader_id.notin_(_growbot)), Video.created_at, Video.id))),
+    "tutorials": (False, _keyset(lambda u: (Video.query.filter(Video.uploader_id.in_(_growbot)), Video.created_at, Video.id))),
+    "videos": (False, _keyset(lambda u: (Video.query, Video.created_at, Video.id))),
+    "my_videos": (True, _keyset(lambda u: (Video.query.filter_by(uploader_id=u.id), Video.created_at, Video.id))),
+    "subscriptions": (True, lambda u, cursor, limit: timeline.timeline_page(u.id, cursor, limit)),
+    "liked": (True, _keyset(lambda u: (
+        Video.query.join(VideoLike, VideoLike.video_id == Video.id)
+        .filter(VideoLike.user_id == u.id), VideoLike.created_at, VideoLike.id))),
+    "watch_later": (True, _keyset(lambda u: (
+        Video.query.join(WatchLater, WatchLater.video_id == Video.id)
+        .filter(WatchLater.user_id == u.id), WatchLater.added_at, WatchLater.id))),
+    "shorts": (False, _keyset(lambda u: (Short.query, Short.created_at, Short.id))),
+}
+
+def video_page(listing, u, cursor=None, limit=PAGE_LIMIT):
+    return VIDEO_LISTINGS[listing][1](u, cursor, limit)
+
+def _short_item(s):
+    return {"id": s.id, "title": s.title, "filename": s.filename, "thumbnail": s.thumbnail,
+            "hls": s.hls_url if s.hls_status == "ready" else None,
+            "created_at": s.created_at.isoformat() if s.created_at else None}
+
+def _listing_html(listing, items):
+    if listing == "recent":
+        return "".join(_video_card(v, v.created_at.strftime("%b %d, %Y")) for v in items)
+    if listing == "tutorials":
+        return "".join(_video_card(v, "YouTube") for v in items)
+    if listing == "shorts":
+        return render_template("_short_cards.html", shorts=items)
+    return render_template("_video_cards.html", videos=items, show_date=listing == "my_videos")
+
+@app.route("/api/videos/<listing>")
+def api_videos(listing):
+    """Next page of a listing for infinite scroll: ?cursor=<token from the last page>&limit=<n>.
+
+    Returns the items, the rendered cards and the cursor for the page after
+    (null on the last page).
+    """
+    if listing not in VIDEO_LISTINGS:
+        abort(404)
+    u = current_identity()
+    if VIDEO_LISTINGS[listing][0] and not u:
+        return {"error": "Not logged in"}, 401
+    page = video_page(listing, u, request.args.get("cursor"), clamp_limit(request.args.get("limit")))
+    if listing == "shorts":
+        items = [_short_item(s) for s in page.items]
+    else:
+        items = [{"id": v.id, "title": v.title, "thumbnail": v.thumbnail, "uploader_id": v.uploader_id,
+                  "like_count": v.like_count or 0, "created_at": v.created_at.isoformat() if v.created_at else None}
+                 for v in page.items]
+    return jsonify({"items": items, "html": _listing_html(listing, page.items), "next": page.next_cursor})
+
 @app.route("/shorts")
 def shorts():
-    shorts = Short.query.order_by(Short.created_at.desc()).limit(24).all()
-    return render_template("shorts.html", shorts=shorts, user=current_user())
+    page = video_page("shorts", None, request.args.get("cursor"))
+    return render_template("shorts.html", shorts=page.items, shorts_data=[_short_item(s) for s in page.items],
+                           next_cursor=page.next_cursor, user=current_user())
 
 @app.route("/slots")
 def slots():
@@ -1734,19 +2048,14 @@ def subscriptions():
             .join(Subscription, Subscription.subscribed_to_id == User.id)
             .filter(Subscription.subscriber_id == u.id)
             .all())
-    videos = (db.session.query(Video)
-             .join(Subscription, Subscription.subscribed_to_id == Video.uploader_id)
-             .filter(Subscription.subscriber_id == u.id)
-             .order_by(Video.created_at.desc())
-             .limit(24)
-             .all())
-    return render_template("subscriptions.html", subs=subs, videos=videos, user=u)
+    page = video_page("subscriptions", u, request.args.get("cursor"))
+    return render_template("subscriptions.html", subs=subs, videos=page.items, next_cursor=page.next_cursor, user=u)
 
 @app.route("/music")
 def music():
     # This could be filtered to only show music-related videos in the future
-    videos = Video.query.order_by(Video.created_at.desc()).limit(24).all()
-    return render_template("music.html", videos=videos, user=current_user())
+    page = video_page("videos", None, request.args.get("cursor"))
+    return render_template("music.html", videos=page.items, next_cursor=page.next_cursor, user=current_user())
 
 @app.route("/playlists")
 def playlists():
@@ -1761,40 +2070,37 @@ def my_videos():
     u = current_user()
     if not u:
         return redirect(url_for("login"))
-    videos = Video.query.filter_by(uploader_id=u.id).order_by(Video.created_at.desc()).all()
-    return render_template("my_videos.html", videos=videos, user=u)
+    page = video_page("my_videos", u, request.args.get("cursor"))
+    return render_template("my_videos.html", videos=page.items, next_cursor=page.next_cursor, user=u)
 
 @app.route("/watch-later")
 def watch_later():
     u = current_user()
     if not u:
         return redirect(url_for("login"))
-    videos = (db.session.query(Video)
-             .join(WatchLater, WatchLater.video_id == Video.id)
-             .filter(WatchLater.user_id == u.id)
-             .order_by(WatchLater.added_at.desc())
-             .all())
-    return render_template("watch_later.html", videos=videos, user=u)
+    page = video_page("watch_later", u, request.args.get("cursor"))
+    return render_template("watch_later.html", videos=page.items, next_cursor=page.next_cursor, user=u)
+
+@app.route("/trending")
+def trending_page():
+    # Ranked by score, which moves between requests, so one page instead of cursors
+    return render_template("trending.html", videos=trending.top_videos(), user=current_user())
 
 @app.route("/liked")
 def liked():
     u = current_user()
     if not u:
         return redirect(url_for("login"))
-    videos = (db.session.query(Video)
-             .join(VideoLike, VideoLike.video_id == Video.id)
-             .filter(VideoLike.user_id == u.id)
-             .order_by(VideoLike.created_at.desc())
-             .all())
-    return render_template("liked.html", videos=videos, user=u)
+    page = video_page("liked", u, request.args.get("cursor"))
+    return render_template("liked.html", videos=page.items, next_cursor=page.next_cursor, user=u)
 
 @app.route("/downloads")
 def downloads():
     u = current_user()
     if not u:
         return redirect(url_for("login"))
-    videos = Video.query.order_by(Video.created_at.desc()).limit(24).all()
-    return render_template("downloads.html", videos=videos, user=u)
+    page = video_page("videos", u, request.args.get("cursor"))
+    return render_template("downloads.html", videos=page.items, next_cursor=page.next_cursor, user=u)
 
 @app.route("/search")
 def search():
@@ -1810,8 +2116,8 @@ def search():
     
     # Search users by username or display name
     users = User.query.filter(
-        (User.username.ilike(f"%{query}%")) | 
-        (User.display.ilike(f"%{query}%"))
+        (User.uname.ilike(f"%{query}%")) |
+        (User.dname.ilike(f"%{query}%"))
     ).limit(20).all()
     
     # Search servers by name
@@ -1831,6 +2137,7 @@ def go_live():
     if v:
         v.is_live = True
         db.session.commit()
+        fragment_cache.invalidate("live")
     return render_template("go_live.html", user=u, live_video=v)
 
 # --- Posts helpers and routes ---
@@ -1930,7 +2237,7 @@ def notifications():
 def voice_channel(slug, cid):
     s = Server.query.filter_by(slug=slug).first_or_404()
     ch = Channel.query.get_or_404(cid)
-    if not ch.is_voice:
+    if not ch.voice:
         return redirect(url_for("channel", slug=slug, cid=cid))
     u = current_user()
     participants = (db.session.query(User, VoiceParticipant)
@@ -2032,6 +2339,7 @@ def api_add_to_playlist(pid, vid):
     max_pos = db.session.query(func.max(PlaylistVideo.position)).filter_by(playlist_id=pid).scalar() or 0
     pv = PlaylistVideo(playlist_id=pid, video_id=vid, position=max_pos + 1)
     db.session.add(pv)
+    related.mark_stale(vid)
     db.session.commit()
     return {"success": True}
 
@@ -2054,15 +2362,20 @@ def like_video(vid):
     u = current_user()
     if not u:
         return {"error": "Not logged in"}, 401
+    video = Video.query.get(vid)
+    if not video:
+        return {"error": "Video not found"}, 404
     if not VideoLike.query.filter_by(user_id=u.id, video_id=vid).first():
         db.session.add(VideoLike(user_id=u.id, video_id=vid))
+        bump(Video.like_count, vid)
+        related.mark_stale(vid)
         # Notify uploader
-        video = Video.query.get(vid)
-        if video and video.uploader_id and video.uploader_id != u.id:
-            notif = Notification(user_id=video.uploader_id, message=f"{u.username} liked your video!")
+        if video.uploader_id and video.uploader_id != u.id:
+            notif = Notification(user_id=video.uploader_id, message=f"{u.uname} liked your video!")
             db.session.add(notif)
         db.session.commit()
-    return {"success": True}
+        trending.record(vid, "like")
+    return {"success": True, "likes": video.like_count}
 
 @app.route("/api/watch-later/<int:vid>", methods=["POST"])
 def add_watch_later(vid):
@@ -2071,6 +2384,7 @@ def add_watch_later(vid):
         return {"error": "Not logged in"}, 401
     if not WatchLater.query.filter_by(user_id=u.id, video_id=vid).first():
         db.session.add(WatchLater(user_id=u.id, video_id=vid))
+        related.mark_stale(vid)
         db.session.commit()
     return {"success": True}
 
@@ -2079,15 +2393,35 @@ def subscribe(uid):
     u = current_user()
     if not u:
         return {"error": "Not logged in"}, 401
+    target = User.query.get(uid)
+    if not target:
+        return {"error": "User not found"}, 404
     if u.id != uid and not Subscription.query.filter_by(subscriber_id=u.id, subscribed_to_id=uid).first():
         db.session.add(Subscription(subscriber_id=u.id, subscribed_to_id=uid))
+        bump(User.subscriber_count, uid)
+        timeline.backfill(u.id, uid)
         # Create notification for the subscribed user
-        target = User.query.get(uid)
-        if target:
-            notif = Notification(user_id=uid, message=f"{u.username} subscribed to you!")
-            db.session.add(notif)
+        notif = Notification(user_id=uid, message=f"{u.uname} subscribed to you!")
+        db.session.add(notif)
         db.session.commit()
-    return {"success": True}
+        invalidate_user(uid)
+    return {"success": True, "subscribers": target.subscriber_count}
+
+@app.route("/api/unsubscribe/<int:uid>", methods=["POST"])
+def unsubscribe(uid):
+    u = current_user()
+    if not u:
+        return {"error": "Not logged in"}, 401
+    target = User.query.get(uid)
+    if not target:
+        return {"error": "User not found"}, 404
+    removed = Subscription.query.filter_by(subscriber_id=u.id, subscribed_to_id=uid).delete()
+    if removed:
+        bump(User.subscriber_count, uid, -removed)
+        timeline.remove(u.id, uid)
+        db.session.commit()
+        invalidate_user(uid)
+    return {"success": True, "subscribers": target.subscriber_count}
 
 @app.route("/api/notification/<int:nid>/read", methods=["POST"])
 def mark_notification_read(nid):
@@ -2103,7 +2437,7 @@ def mark_notification_read(nid):
 
 @app.route("/api/notifications/unread")
 def unread_notifications():
-    u = current_user()
+    u = current_identity()
     if not u:
         return {"count": 0}
     count = Notification.query.filter_by(user_id=u.id, is_read=False).count()
@@ -2183,7 +2517,7 @@ def voice_counts(slug):
         return {"error": "Server not found"}, 404
     
     # Get all voice channels for this server
-    channels = Channel.query.filter_by(server_id=server.id, is_voice=True).all()
+    channels = Channel.query.filter_by(server=server.id, voice=True).all()
     counts = {}
     for ch in channels:
         count = VoiceParticipant.query.filter_by(channel_id=ch.id).count()
@@ -2602,7 +2936,7 @@ def friends():
         Friendship.status == "pending"
     ).all()
     
-    return render_template("friends.html", user=user, friends=friends_list, pending=pending, servers=Server.query.all(), sponsors=Sponsor.query.all(), app_version=APP_VERSION)
+    return render_template("friends.html", user=user, friends=friends_list, pending=pending, app_version=APP_VERSION)
 
 @app.route("/members")
 def members():
@@ -2625,7 +2959,7 @@ def members():
         else:
             friend_ids.add(f.user_id)
     
-    return render_template("members.html", user=user, members=all_members, friend_ids=friend_ids, servers=Server.query.all(), sponsors=Sponsor.query.all(), app_version=APP_VERSION)
+    return render_template("members.html", user=user, members=all_members, friend_ids=friend_ids, app_version=APP_VERSION)
 
 @app.route("/messages")
 @app.route("/messages/<int:friend_id>")
@@ -2663,8 +2997,7 @@ def messages(friend_id=None):
         unread_counts[friend.id] = count
     
     return render_template("messages.html", user=user, friends=friends_list, active_friend=active_friend, 
-                         conversation=conversation, unread_counts=unread_counts, servers=Server.query.all(), 
-                         sponsors=Sponsor.query.all(), app_version=APP_VERSION)
+                         conversation=conversation, unread_counts=unread_counts, app_version=APP_VERSION)
 
 # ============ API: Friends ============
 @app.route("/api/friend/add/<int:friend_id>", methods=["POST"])
@@ -2795,20 +3128,22 @@ def update_status():
     user.status = new_status
     user.last_seen = datetime.utcnow()
     db.session.commit()
+    invalidate_user(user.id)
     
     return {"success": True, "status": new_status}
 
 @app.route("/api/status/heartbeat", methods=["POST"])
 def status_heartbeat():
     """Update last_seen timestamp to track online status"""
-    user = current_user()
+    user = current_identity()
     if not user:
         return {"error": "Not logged in"}, 401
     
-    user.last_seen = datetime.utcnow()
+    # Identity comes from the snapshot cache; only touch the row when the status flips
     if user.status == "offline":
-        user.status = "online"
-    db.session.commit()
+        User.query.filter_by(id=user.id).update({"status": "online"})
+        db.session.commit()
+        invalidate_user(user.id)
     
     return {"success": True}
 
@@ -2827,6 +3162,9 @@ def get_custom_emojis():
         }
         if e.image_path:
             emoji_data['image'] = url_for('uploads', filename=e.image_path, _external=True)
+            if "webp" in images.formats() and not e.image_path.lower().endswith(".gif"):
+                # Picker buttons show it at 28px; messages keep linking the original
+                emoji_data['srcset'] = images.srcset(url_for('uploads', filename=e.image_path), 28, "webp")
         else:
             emoji_data['char'] = e.emoji_char
         grouped[e.category].append(emoji_data)
@@ -2871,6 +3209,7 @@ def health_check():
         "status": "healthy" if db_status == "healthy" else "degraded",
         "version": APP_VERSION,
         "database": db_status,
+        "db_pool": pool_stats.snapshot(),
         "upload_dirs": {
             "videos": os.path.exists(VIDEO_DIR),
             "thumbnails": os.path.exists(THUMB_DIR),
@@ -2883,6 +3222,7 @@ if __name__ == "__main__":
     # Development: debug=True
     import os
     debug_mode = os.environ.get("FLASK_ENV") != "production"
+    boot_worker()
     app.run(host="0.0.0.0", port=5000, debug=debug_mode)
 
  
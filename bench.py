@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Route benchmark suite with regression gates.
+
+Seeds a synthetic database with seed_data.py (cached under instance/bench/ so
+later runs start instantly), boots the app in-process against a fresh copy of
+it and drives each scenario through the Flask test client. For every scenario
+it records throughput, p50/p95/p99 latency and SQL statements per request.
+
+Results are compared with a JSON baseline. A scenario regresses when
+- its SQL count per request goes up (counts are deterministic, so no slack)
+- p50 or p95 latency grows by more than --tolerance (and by more than
+  --noise-ms, so sub-millisecond jitter doesn't fail a run)
+- throughput drops by more than --tolerance
+- it starts returning errors it didn't return in the baseline
+
+--save-baseline refuses to record a scenario that answers 5xx.
+
+    python bench.py                        # run, compare with bench_baseline.json
+    python bench.py --save-baseline        # run and overwrite the baseline
+    python bench.py --only home --only dm  # subset of scenarios
+    python bench.py --preset medium --requests 500
+
+Exits 1 when anything regressed.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+BENCH_DIR = os.path.join(BASE_DIR, "instance", "bench")
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "bench_baseline.json")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--preset", default="small", help="seed_data.py preset for the benchmark database")
+    parser.add_argument("--seed", type=int, default=420)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--only", action="append", default=[], help="run only scenarios whose name contains this")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative latency/throughput change")
+    parser.add_argument("--noise-ms", type=float, default=2.0, help="latency changes below this never fail")
+    parser.add_argument("--json", dest="json_out", help="also write this run's results to a file")
+    parser.add_argument("--reseed", action="store_true", help="rebuild the cached seed database")
+    return parser.parse_args(argv)
+
+
+ARGS = parse_args() if __name__ == "__main__" else parse_args([])
+
+
+def prepare_database(args) -> str:
+    """Path to a fresh working copy of the seeded database for this preset."""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    # Seeded up to today: trending scores decay from the real clock, so an older copy is reseeded
+    epoch = datetime.utcnow().date().isoformat()
+    seeded = os.path.join(BENCH_DIR, f"seed-{args.preset}-{args.seed}-{epoch}.db")
+    if args.reseed or not os.path.exists(seeded):
+        for path in glob.glob(os.path.join(BENCH_DIR, f"seed-{args.preset}-{args.seed}[.-]*")):
+            os.remove(path)
+        import subprocess
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{seeded}", EMAIL_WORKER="off", PROFILING="off")
+        subprocess.run([sys.executable, os.path.join(BASE_DIR, "seed_data.py"), "--preset", args.preset,
+                        "--seed", str(args.seed), "--epoch", epoch], env=env, check=True)
+    working = os.path.join(BENCH_DIR, "run.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(working + suffix):
+            os.remove(working + suffix)
+    shutil.copyfile(seeded, working)
+    return working
+
+
+if __name__ == "__main__":
+    os.environ["DATABASE_URL"] = f"sqlite:///{prepare_database(ARGS)}"
+    os.environ.setdefault("EMAIL_WORKER", "off")
+    # The suite counts SQL itself; the admin profiler would only add overhead
+    os.environ["PROFILING"] = "off"
+
+from sqlalchemy import event, insert, select, func, update  # noqa: E402
+
+
+# --- Scenarios ---
+# Ordered list of (name, fn). fn(client, ctx, rnd) performs one request and
+# returns the response.
+SCENARIOS = []
+
+
+def scenario(name: str):
+    def wrap(fn):
+        SCENARIOS.append((name, fn))
+        return fn
+    return wrap
+
+
+@scenario("home feed")
+def _home(client, ctx, rnd):
+    return client.get("/")
+
+
+@scenario("home feed poll (idle)")
+def _home_poll(client, ctx, rnd):
+    if "feed_version" not in ctx:
+        ctx["feed_version"] = client.get("/api/main-content").get_json()["version"]
+    version = ctx["feed_version"]
+    return client.get(f"/api/main-content?since={version}", headers={"If-None-Match": f'W/"{version}"'})
+
+
+@scenario("home feed (anonymous)")
+def _home_anon(client, ctx, rnd):
+    if "anon_client" not in ctx:
+        ctx["anon_client"] = client.application.test_client()
+    return ctx["anon_client"].get("/")
+
+
+@scenario("video listing api (page 20)")
+def _listing_deep(client, ctx, rnd):
+    if "deep_cursor" not in ctx:
+        # Walk to page 20 once; keyset pages should cost the same however deep they are
+        cursor = None
+        for _ in range(19):
+            data = client.get("/api/videos/videos", query_string={"cursor": cursor} if cursor else {}).get_json()
+            cursor = data["next"] or cursor
+        ctx["deep_cursor"] = cursor
+    return client.get("/api/videos/videos", query_string={"cursor": ctx["deep_cursor"]})
+
+
+@scenario("subscriptions feed")
+def _subscriptions(client, ctx, rnd):
+    return client.get("/subscriptions")
+
+
+@scenario("trending page")
+def _trending(client, ctx, rnd):
+    return client.get("/trending")
+
+
+@scenario("watch page")
+def _watch(client, ctx, rnd):
+    return client.get(f"/watch/{rnd.choice(ctx['hot_videos'])}")
+
+
+@scenario("channel view (long history)")
+def _channel(client, ctx, rnd):
+    return client.get(f"/c/{ctx['busy_server_slug']}/{ctx['busy_channel']}")
+
+
+@scenario("dm thread")
+def _dm(client, ctx, rnd):
+    return client.get(f"/messages/{ctx['dm_friend']}")
+
+
+@scenario("dm unread poll")
+def _dm_unread(client, ctx, rnd):
+    return client.get("/api/messages/unread")
+
+
+@scenario("voice page")
+def _voice(client, ctx, rnd):
+    return client.get(f"/voice/{ctx['voice_server_slug']}/{ctx['voice_channel']}")
+
+
+@scenario("music bot polling")
+def _music_poll(client, ctx, rnd):
+    # The voice page polls status and queue together
+    client.get(f"/api/music/bot/status/{ctx['voice_channel']}")
+    return client.get(f"/api/music/bot/queue/{ctx['voice_channel']}")
+
+
+@scenario("voice counts")
+def _voice_counts(client, ctx, rnd):
+    return client.get(f"/api/voice/counts/{ctx['voice_server_slug']}")
+
+
+@scenario("rtc signal")
+def _rtc_signal(client, ctx, rnd):
+    return client.post(f"/api/rtc/signal/{ctx['rtc_room']}",
+                       json={"kind": "candidate", "target_id": ctx["dm_friend"], "payload": '{"candidate": "x"}'})
+
+
+@scenario("rtc poll")
+def _rtc_poll(client, ctx, rnd):
+    return client.get(f"/api/rtc/poll/{ctx['rtc_room']}?since=0")
+
+
+@scenario("heartbeat")
+def _heartbeat(client, ctx, rnd):
+    return client.post("/api/status/heartbeat")
+
+
+@scenario("search")
+def _search(client, ctx, rnd):
+    return client.get(f"/search?q={rnd.choice(('grow', 'harvest', 'scrog', 'user12', 'club'))}")
+
+
+@scenario("admin panel")
+def _admin(client, ctx, rnd):
+    return client.get("/theGspot")
+
+
+# --- Fixture ---
+def build_context(app, db) -> dict:
+    """Pick deterministic ids from the seeded data and add the few rows seed_data doesn't make."""
+    from models import (
+        User, Server, Channel, Message, VideoLike, DirectMessage,
+        MusicBot, MusicQueue, VoiceParticipant, RtcParticipant,
+    )
+
+    with app.app_context():
+        s = db.session
+        busy_channel = s.execute(select(Message.channel_id, func.count()).group_by(Message.channel_id)
+                                 .order_by(func.count().desc(), Message.channel_id).limit(1)).first()[0]
+        busy_server = s.get(Server, s.get(Channel, busy_channel).server)
+        # DM thread: the longest conversation, viewed by one of its participants
+        sender, recipient = s.execute(
+            select(DirectMessage.sender_id, DirectMessage.recipient_id).group_by(DirectMessage.sender_id, DirectMessage.recipient_id)
+            .order_by(func.count().desc(), DirectMessage.sender_id).limit(1)).first()
+        hot_videos = [v for (v,) in s.execute(select(VideoLike.video_id).group_by(VideoLike.video_id)
+                                                .order_by(func.count().desc(), VideoLike.video_id).limit(20))]
+        voice = s.execute(select(Channel).where(Channel.voice == True).order_by(Channel.id).limit(1)).scalar_one()  # noqa: E712
+        voice_server = s.get(Server, voice.server)
+
+        # The benchmark user is an admin so the admin panel scenario can run
+        s.execute(update(User).where(User.id == recipient).values(admin=True))
+        if not s.execute(select(MusicBot.id).where(MusicBot.channel_id == voice.id)).first():
+            s.execute(insert(MusicBot), [{"channel_id": voice.id, "is_active": True, "is_playing": True,
+                                          "current_song": "https://example.com/song.mp3", "current_song_title": "Song"}])
+            s.execute(insert(MusicQueue), [{"channel_id": voice.id, "added_by": recipient, "song_url": f"https://example.com/{i}.mp3",
+                                            "song_title": f"Track {i}", "position": i, "is_played": i < 10} for i in range(40)])
+            s.execute(insert(VoiceParticipant), [{"user_id": uid, "channel_id": voice.id} for uid in range(1, 9)])
+        room = f"voice-{voice.id}"
+        s.execute(insert(RtcParticipant), [{"room": room, "user_id": uid} for uid in (recipient, sender)])
+        s.commit()
+        return {
+            "user_id": recipient,
+            "dm_friend": sender,
+            "busy_channel": busy_channel,
+            "busy_server_slug": busy_server.slug,
+            "hot_videos": hot_videos or [1],
+            "voice_channel": voice.id,
+            "voice_server_slug": voice_server.slug,
+            "rtc_room": room,
+        }
+
+
+# --- Measurement ---
+class QueryCounter:
+    """Statements run on the thread that drives the test client.
+
+    The trending and view-count workers flush on their own threads; counting
+    those would make SQL per request depend on timing.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        self.thread = threading.get_ident()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        if threading.get_ident() == self.thread:
+            self.count += 1
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def run_scenario(client, fn, ctx, counter, requests: int, warmup: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    for _ in range(warmup):
+        fn(client, ctx, rnd)
+    latencies, queries, errors, statuses = [], [], 0, {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        before = counter.count
+        t0 = time.perf_counter()
+        response = fn(client, ctx, rnd)
+        latencies.append(time.perf_counter() - t0)
+        queries.append(counter.count - before)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries": round(sum(queries) / requests, 2),
+        "max_queries": max(queries),
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def compare(name: str, current: dict, base: dict, tolerance: float, noise_ms: float) -> list:
+    """Human-readable regressions of one scenario against its baseline."""
+    problems = []
+    if current["queries"] > base["queries"]:
+        problems.append(f"SQL per request {base['queries']} -> {current['queries']}")
+    for key in ("p50_ms", "p95_ms"):
+        grew = current[key] - base[key]
+        if grew > noise_ms and current[key] > base[key] * (1 + tolerance):
+            problems.append(f"{key} {base[key]} -> {current[key]} (+{grew / base[key] * 100 if base[key] else 100:.0f}%)")
+    if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+        # Throughput is the inverse of mean latency; apply the same noise floor
+        if 1000 / current["rps"] - 1000 / base["rps"] > noise_ms:
+            problems.append(f"rps {base['rps']} -> {current['rps']}")
+    if current["errors"] and not base["errors"]:
+        problems.append(f"now failing: status {current['statuses']}")
+    return problems
+
+
+def main(args=ARGS):
+    from app import app
+    from models import db
+    import migrations
+    import trending
+    from views import view_counter
+
+    migrations.ensure_schema(app)
+    # As boot_worker() does, so views are buffered instead of written through per request
+    trending.worker.start(app)
+    view_counter.start(app)
+    # Failing routes show up in the status column; keep their tracebacks out of the table
+    app.logger.disabled = True
+    ctx = build_context(app, db)
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["uid"] = ctx["user_id"]
+
+    results = {}
+    print(f"{'scenario':<30}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'SQL/req':>9}  status")
+    for i, (name, fn) in enumerate(SCENARIOS):
+        if args.only and not any(o in name for o in args.only):
+            continue
+        r = run_scenario(client, fn, ctx, counter, args.requests, args.warmup, args.seed + i)
+        results[name] = r
+        status = ",".join(f"{k}×{v}" for k, v in r["statuses"].items())
+        print(f"{name:<30}{r['rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['queries']:>9}  {status}")
+
+    report = {
+        "meta": {"preset": args.preset, "seed": args.seed, "requests": args.requests,
+                 "python": platform.python_version(), "machine": platform.machine()},
+        "scenarios": results,
+    }
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        broken = [name for name, r in results.items() if any(int(code) >= 500 for code in r["statuses"])]
+        if broken:
+            # A baseline of error pages can never regress
+            print(f"\n❌ Not saving a baseline with failing scenarios: {', '.join(broken)}")
+            return 1
+        if os.path.exists(args.baseline) and args.only:
+            # Partial run: only replace the scenarios that were measured
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            previous["scenarios"].update(results)
+            previous["meta"] = report["meta"]
+            report = previous
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\n💾 Baseline written to {os.path.relpath(args.baseline)}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {os.path.relpath(args.baseline)}; run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("meta", {}).get("preset") != args.preset:
+        print(f"\n⚠️ Baseline was recorded with preset '{baseline['meta'].get('preset')}', not '{args.preset}'; not comparing")
+        return 0
+
+    regressions = 0
+    print()
+    for name, current in results.items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            print(f"➕ {name}: new scenario, no baseline")
+            continue
+        problems = compare(name, current, base, args.tolerance, args.noise_ms)
+        if problems:
+            regressions += 1
+            print(f"❌ {name}: " + "; ".join(problems))
+    if regressions:
+        print(f"\n{regressions} scenario(s) regressed beyond {args.tolerance:.0%}")
+        return 1
+    print(f"✅ No regressions against {os.path.relpath(args.baseline)} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
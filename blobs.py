@@ -0,0 +1,295 @@
+"""
+Content-addressed storage for uploads.
+
+Uploaded files used to be saved as uploads/<dir>/<secure_filename>, so two
+users uploading ``video.mp4`` overwrote each other and the same file
+uploaded twice took its space twice. Now every upload is stored once per
+content as
+
+    uploads/blobs/ab/cd/<sha256>.<ext>
+
+- ``store()`` hashes an upload while it streams to a temporary file in the
+  store and renames it into place; ``adopt()`` does the same for a file
+  already on disk (finished resumable uploads). Same bytes, same path: a
+  second copy just replaces the first with identical content
+- a Blob row per digest counts the columns in REFERENCES that point at it;
+  store/adopt add one, ``release()`` drops one when a row is deleted or its
+  file replaced. Blobs at zero are deleted by ``collect()`` once they have
+  been unreferenced for BLOB_GC_GRACE_SECONDS (``python blobs.py --gc``)
+- the store and the collector take a per-shard lock file, so a blob can't
+  be deleted under an upload of the same content
+- the path of a blob never changes content, so media.py sends it with a
+  year-long immutable Cache-Control (the digest is in the file name)
+
+``recount()`` recomputes every count from REFERENCES (``python blobs.py
+--recount``), for counts left too high by a request that stored a file and
+then failed. ``python blobs.py --adopt`` moves files from before the store
+into it and rewrites the columns that name them.
+"""
+
+import glob
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+from models import db, Blob, Video, Short, User, Server, CustomEmoji, Advertisement
+
+try:
+    import fcntl
+except ImportError:  # Windows development: no shard locks
+    fcntl = None
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+TMP_DIR = os.path.join(BLOB_DIR, ".tmp")  # same filesystem, so finished uploads are renamed, not copied
+
+BLOB_GC_GRACE_SECONDS = int(os.environ.get("BLOB_GC_GRACE_SECONDS", "3600"))
+BLOCK_SIZE = 1024 * 1024
+
+# Columns holding /uploads/ URLs (CustomEmoji.image_path is relative to uploads/)
+REFERENCES = (
+    Video.filename, Video.thumbnail, Short.filename, Short.thumbnail, User.avatar, Server.icon,
+    CustomEmoji.image_path, Advertisement.image,
+)
+
+_BLOB_PATH = re.compile(r"(?:^|/)blobs/([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(\.[a-z0-9]{1,10})?$")
+
+
+def _ext(filename: str | None) -> str:
+    ext = os.path.splitext(secure_filename(filename or ""))[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+
+def relative_path(sha256: str, ext: str) -> str:
+    """Path of a blob below uploads/."""
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def url_for_blob(sha256: str, ext: str) -> str:
+    return "/uploads/" + relative_path(sha256, ext)
+
+
+def digest(url: str | None):
+    """The SHA-256 a stored upload's URL (or uploads-relative path) names, or None for anything else."""
+    m = _BLOB_PATH.search(url or "")
+    return m.group(3) if m else None
+
+
+@contextmanager
+def _shard_lock(sha256: str):
+    shard = os.path.join(BLOB_DIR, sha256[:2], sha256[2:4])
+    os.makedirs(shard, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(shard, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _commit(tmp: str, sha256: str, size: int, ext: str) -> str:
+    """Count one reference to ``sha256`` and move ``tmp`` to its path. Returns the blob's URL.
+
+    The count is committed on its own connection, so the caller's session and transaction are
+    untouched; callers store before they write anything else (see admin_edit_ad).
+    """
+    with _shard_lock(sha256):
+        with db.engine.begin() as conn:
+            row = conn.execute(select(Blob.ext).where(Blob.sha256 == sha256)).first()
+            if row is None:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(insert(Blob).values(sha256=sha256, ext=ext, size=size, refcount=1,
+                                                         created_at=datetime.utcnow()))
+                except IntegrityError:
+                    # Stored meanwhile by another host (lock files only serialize one host)
+                    row = conn.execute(select(Blob.ext).where(Blob.sha256 == sha256)).first()
+            if row is not None:
+                ext = row.ext
+                conn.execute(update(Blob).where(Blob.sha256 == sha256)
+                             .values(refcount=Blob.refcount + 1, released_at=None))
+        # Identical bytes: replacing an existing copy is harmless and restores a missing one
+        os.replace(tmp, os.path.join(UPLOAD_DIR, relative_path(sha256, ext)))
+    return url_for_blob(sha256, ext)
+
+
+def store(file, filename: str | None = None) -> str:
+    """Stream an upload (werkzeug FileStorage or binary file object) into the store. Returns its URL.
+
+    Counts one reference, committed right away on its own connection; the caller saves the URL
+    in one of REFERENCES.
+    """
+    stream = getattr(file, "stream", file)
+    filename = filename or getattr(file, "filename", None)
+    os.makedirs(TMP_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=TMP_DIR)
+    h, size = hashlib.sha256(), 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = stream.read(BLOCK_SIZE)
+                if not block:
+                    break
+                h.update(block)
+                out.write(block)
+                size += len(block)
+        return _commit(tmp, h.hexdigest(), size, _ext(filename))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def adopt(path: str, filename: str | None = None) -> str:
+    """Move a file already on disk into the store. Returns its URL; counts one reference.
+
+    The file is renamed when it lives on the same filesystem as the store, copied otherwise.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    os.makedirs(TMP_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=TMP_DIR)
+    os.close(fd)
+    try:
+        try:
+            os.replace(path, tmp)
+        except OSError:  # another filesystem
+            shutil.copyfile(path, tmp)
+            os.remove(path)
+        return _commit(tmp, h.hexdigest(), os.path.getsize(tmp), _ext(filename or path))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def release(url: str | None) -> bool:
+    """Drop one reference to the blob ``url`` names. Returns False if it isn't a stored upload.
+
+    Runs in the caller's transaction; the file goes once collect() finds it unreferenced.
+    """
+    sha256 = digest(url)
+    if sha256 is None:
+        return False
+    db.session.execute(update(Blob).where(Blob.sha256 == sha256, Blob.refcount > 0)
+                       .values(refcount=Blob.refcount - 1, released_at=datetime.utcnow()))
+    return True
+
+
+def collect(grace_seconds: int = BLOB_GC_GRACE_SECONDS, limit: int = 500) -> int:
+    """Delete blobs unreferenced for ``grace_seconds``. Returns blobs deleted."""
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    candidates = db.session.execute(
+        select(Blob.sha256, Blob.ext)
+        .where(Blob.refcount <= 0, Blob.released_at < cutoff)
+        .limit(limit)
+    ).all()
+    deleted = 0
+    for sha256, ext in candidates:
+        with _shard_lock(sha256):
+            # Only if nobody stored the same content again meanwhile
+            gone = db.session.execute(
+                delete(Blob).where(Blob.sha256 == sha256, Blob.refcount <= 0)
+            ).rowcount
+            db.session.commit()
+            if gone:
+                # With its resized copies (images.py names them by the source digest)
+                paths = [os.path.join(UPLOAD_DIR, relative_path(sha256, ext))]
+                paths += glob.glob(os.path.join(UPLOAD_DIR, "derived", sha256[:2], f"{sha256}-*"))
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                deleted += 1
+    return deleted
+
+
+def recount(bind) -> int:
+    """Recompute every refcount from REFERENCES. Returns blobs whose count changed.
+
+    ``bind`` is a Connection or a Session.
+    """
+    counts = {}
+    for column in REFERENCES:
+        for (value,) in bind.execute(select(column).where(column.like("%blobs/%"))):
+            sha256 = digest(value)
+            if sha256:
+                counts[sha256] = counts.get(sha256, 0) + 1
+    changed = 0
+    now = datetime.utcnow()
+    for sha256, refcount in bind.execute(select(Blob.sha256, Blob.refcount)).all():
+        actual = counts.get(sha256, 0)
+        if actual != refcount:
+            bind.execute(update(Blob).where(Blob.sha256 == sha256)
+                         .values(refcount=actual, released_at=now if actual == 0 else None))
+            changed += 1
+    return changed
+
+
+def adopt_legacy() -> int:
+    """Move files saved before the store into it and point their columns at the blobs. Returns files moved."""
+    moved, done = 0, {}  # legacy path -> blob URL
+    for column in REFERENCES:
+        relative = column is CustomEmoji.image_path
+        model = column.class_
+        values = db.session.execute(select(column).where(column.isnot(None)).group_by(column)).scalars().all()
+        for value in values:
+            rel = value if relative else value.removeprefix("/uploads/")
+            if digest(value) or (not relative and not value.startswith("/uploads/")):
+                continue  # already stored, or not a local upload (YouTube, external URL)
+            path = os.path.join(UPLOAD_DIR, rel)
+            if path not in done and not os.path.isfile(path):
+                continue
+            # Each row naming the file counts as a reference
+            refs = db.session.execute(select(func.count()).select_from(model).where(column == value)).scalar()
+            if path in done:
+                url = done[path]
+            else:
+                url = done[path] = adopt(path)
+                refs -= 1
+                moved += 1
+            if refs:
+                db.session.execute(update(Blob).where(Blob.sha256 == digest(url))
+                                   .values(refcount=Blob.refcount + refs))
+            new = url.removeprefix("/uploads/") if relative else url
+            db.session.execute(update(model).where(column == value).values({column.key: new}))
+            db.session.commit()
+    return moved
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        args = sys.argv[1:]
+        if "--adopt" in args:
+            print(f"[blobs] moved {adopt_legacy()} files into the store")
+        if "--recount" in args:
+            changed = recount(db.session)
+            db.session.commit()
+            print(f"[blobs] corrected {changed} reference counts")
+        if "--gc" in args or not args:
+            total = 0
+            while True:
+                n = collect()
+                total += n
+                if n < 500:
+                    break
+            print(f"[blobs] deleted {total} unreferenced blobs")
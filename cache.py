@@ -0,0 +1,92 @@
+"""
+Small in-process caches with cross-worker invalidation.
+
+A ``Generation`` is a stamp that changes whenever the data behind a cache
+changes. It lives in a tiny file under ``instance/cache`` so every gunicorn
+worker sees a bump on its next read without a database round-trip. Caches
+keep the stamp they were built with and rebuild lazily when it moves.
+"""
+
+import os
+import threading
+import time
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(BASE_DIR, "instance", "cache"))
+
+
+class Generation:
+    """Cross-worker change stamp backed by a file."""
+
+    def __init__(self, name: str, directory: str = CACHE_DIR):
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.gen")
+        self._local = 0
+
+    def shared(self) -> str:
+        """The file part only: identical in every worker, so safe to hand to clients."""
+        try:
+            with open(self.path, "r", encoding="ascii") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def value(self) -> str:
+        return f"{self.shared()}.{self._local}"
+
+    def bump(self):
+        self._local += 1
+        stamp = f"{time.time_ns():x}{os.getpid():x}"
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w", encoding="ascii") as f:
+                f.write(stamp)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            # Other workers fall back to their TTL; this worker already sees the local bump
+            print(f"[cache] could not bump {self.name}: {e}")
+
+
+class RowSnapshot:
+    """Plain copy of a model row's columns, safe to share across requests."""
+
+    def __init__(self, row):
+        for col in row.__table__.columns:
+            setattr(self, col.key, getattr(row, col.key))
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {getattr(self, 'id', None)}>"
+
+
+def snapshot_rows(rows) -> list:
+    return [RowSnapshot(r) for r in rows]
+
+
+class GenerationCache:
+    """Holds one computed value, rebuilt when its Generation moves or the TTL passes."""
+
+    def __init__(self, generation: Generation, loader, ttl: float = 300.0):
+        self.generation = generation
+        self.loader = loader
+        self.ttl = ttl
+        self._value = None
+        self._stamp = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self):
+        stamp = self.generation.value()
+        if self._stamp == stamp and time.monotonic() < self._expires_at:
+            return self._value
+        with self._lock:
+            if self._stamp != stamp or time.monotonic() >= self._expires_at:
+                self._value = self.loader()
+                self._stamp = stamp
+                self._expires_at = time.monotonic() + self.ttl
+                self.loads += 1
+        return self._value
+
+    def invalidate(self):
+        self.generation.bump()
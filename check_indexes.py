@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Index audit: EXPLAIN every statement the hot routes and workers run.
+
+Builds a throwaway SQLite database (or uses DATABASE_URL with --use-env),
+applies migrations and seeds it with seed_data.py. Then it drives the
+bench.py scenarios, the pages in EXTRA_PAGES, both pages of every keyset
+listing, a resumable upload and one batch of each background worker,
+recording the SQL they send. Every distinct statement is EXPLAINed with the
+parameters it ran with, so the audit follows the code rather than a
+hand-kept copy of its queries. Exits 1 if any statement does a full table
+scan that isn't listed in ALLOWED_SCANS.
+
+    python check_indexes.py              # seeded temp SQLite DB
+    python check_indexes.py --use-env    # against DATABASE_URL (a scratch copy: the routes write to it)
+    python check_indexes.py --verbose    # print every statement with its plan
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--use-env", action="store_true", help="use DATABASE_URL instead of a temp SQLite DB")
+    parser.add_argument("--preset", default="small", help="seed_data.py preset to seed")
+    parser.add_argument("--no-seed", action="store_true", help="skip seeding (existing data only)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="print every statement and its plan")
+    return parser.parse_args(argv)
+
+
+ARGS = parse_args()
+if not ARGS.use_env:
+    _tmp = tempfile.NamedTemporaryFile(prefix="cannaspot_explain_", suffix=".db", delete=False)
+    _tmp.close()
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+os.environ.setdefault("EMAIL_WORKER", "off")
+os.environ["PROFILING"] = "off"
+
+from sqlalchemy import event, update  # noqa: E402
+
+import bench  # noqa: E402
+import migrations  # noqa: E402
+from app import app, VIDEO_LISTINGS  # noqa: E402
+from models import db, Video  # noqa: E402
+
+# Pages outside bench.py's scenarios whose SQL is audited too
+EXTRA_PAGES = [
+    "/notifications", "/api/notifications/unread", "/friends", "/api/friends/status", "/playlists",
+    "/api/playlists", "/liked", "/watch-later", "/my-videos", "/downloads", "/music", "/shorts", "/servers",
+    "/members", "/profile",
+]
+
+# Expected full scans: (table, fragment of the unquoted statement, why)
+ALLOWED_SCANS = [
+    ("server", "FROM server ORDER BY", "the sidebar and server pickers list every server"),
+    ("sponsor", "FROM sponsor", "a handful of rows, cached in site_globals"),
+    ("custom_emoji", "FROM custom_emoji", "a handful of rows"),
+    ("user", "LIKE", "search matches substrings, which no B-tree index serves"),
+    ("server", "LIKE", "search matches substrings, which no B-tree index serves"),
+    ("user", "WHERE user.id !=", "/members lists every user"),
+    ("user", "WHERE user.admin =", "admin panel: admin count"),
+    ("user", "FROM user ORDER BY user.created DESC", "admin panel: newest users"),
+    ("advertisement", "FROM advertisement ORDER BY", "admin panel: every ad"),
+    ("activity", "FROM activity ORDER BY", "admin panel: activity log"),
+    ("notification", "FROM notification ORDER BY", "admin panel: latest notifications across all users"),
+]
+
+
+class Recorder:
+    """Distinct statements sent on this thread while enabled, with where they came from."""
+
+    def __init__(self, engine):
+        self.thread = threading.get_ident()
+        self.source = None
+        self.statements = {}  # sql -> (parameters, source)
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.source is None or executemany or threading.get_ident() != self.thread:
+            return
+        if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+            self.statements.setdefault(statement, (parameters, self.source))
+
+
+def drive(recorder):
+    """Run the routes and worker batches whose SQL is audited."""
+    import blobs
+    import related
+    import timeline
+    import trending
+    from email_outbox import OutboxSender
+    import media_jobs
+    from views import view_counter
+
+    ctx = bench.build_context(app, db)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["uid"] = ctx["user_id"]
+    for i, (name, fn) in enumerate(bench.SCENARIOS):
+        recorder.source = name
+        fn(client, ctx, random.Random(i))
+    for path in EXTRA_PAGES:
+        recorder.source = path
+        client.get(path)
+    for listing in VIDEO_LISTINGS:
+        recorder.source = f"/api/videos/{listing}"
+        cursor = client.get(f"/api/videos/{listing}").get_json().get("next")
+        if cursor:
+            client.get(f"/api/videos/{listing}", query_string={"cursor": cursor})
+
+    recorder.source = "resumable upload"
+    created = client.post("/api/uploads", data={"length": "4", "filename": "audit.mp4", "title": "Audit"}).get_json()
+    client.head(f"/api/uploads/{created['token']}")
+    client.delete(f"/api/uploads/{created['token']}")
+
+    with app.app_context():
+        recorder.source = "view counter flush"
+        view_counter.flush()
+        recorder.source = "trending flush"
+        trending.worker.flush()
+        recorder.source = "timeline fan-out"
+        db.session.execute(update(Video).where(Video.id == ctx["hot_videos"][0]).values(fanout="pending"))
+        db.session.commit()
+        timeline.fan_out_pending()
+        recorder.source = "related refresh"
+        related.mark_stale(ctx["hot_videos"][0])
+        db.session.commit()
+        related.refresh_stale()
+        recorder.source = "media job claim"
+        media_jobs.claim(1)
+        recorder.source = "blob gc"
+        blobs.collect()
+        recorder.source = "email outbox"
+        OutboxSender("127.0.0.1", use_tls=False).drain_once()
+        db.session.remove()
+    recorder.source = None
+
+
+def explain(conn, sql: str, parameters) -> tuple:
+    """Return (plan lines, full-scan lines) for a statement on the current dialect."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        lines = [r[-1] for r in rows]
+        # "SCAN video" is a full scan; "SCAN video USING INDEX ..." walks an index
+        scans = [l for l in lines if l.startswith("SCAN ") and " USING " not in l]
+    elif dialect == "postgresql":
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        lines = [r[0] for r in conn.exec_driver_sql(f"EXPLAIN {sql}", parameters).fetchall()]
+        scans = [l.strip() for l in lines if "Seq Scan" in l]
+    else:
+        rows = conn.exec_driver_sql(f"EXPLAIN {sql}", parameters).mappings().fetchall()
+        lines = [str(dict(r)) for r in rows]
+        scans = [str(dict(r)) for r in rows if (r.get("type") or "").upper() == "ALL"]
+    return lines, scans
+
+
+def allowed(scan: str, sql: str) -> bool:
+    sql = " ".join(sql.replace('"', "").replace("`", "").split())
+    return any(re.search(rf"\b{table}\b", scan) and fragment in sql for table, fragment, _ in ALLOWED_SCANS)
+
+
+def main():
+    with app.app_context():
+        migrations.upgrade(db.engine, log=lambda *_: None)
+        if not ARGS.no_seed and not ARGS.use_env:
+            import seed_data
+            counts = seed_data.volumes(argparse.Namespace(preset=ARGS.preset, scale=1.0))
+            seed_data.seed(db.engine, counts, log=lambda *_: None)
+        engine = db.engine
+    # Failing routes would print tracebacks between the results; the status is what matters here
+    app.logger.disabled = True
+    recorder = Recorder(engine)
+    drive(recorder)
+
+    failures = 0
+    by_source = {}
+    for sql, (parameters, source) in recorder.statements.items():
+        by_source.setdefault(source, []).append((sql, parameters))
+    with engine.connect() as conn:
+        for source, statements in by_source.items():
+            bad = []
+            for sql, parameters in statements:
+                lines, scans = explain(conn, sql, parameters)
+                scans = [s for s in scans if not allowed(s, sql)]
+                if scans:
+                    bad.append((sql, lines))
+                elif ARGS.verbose:
+                    print(f"   {sql}\n     " + "\n     ".join(lines))
+            if bad:
+                failures += len(bad)
+                print(f"❌ {source}")
+                for sql, lines in bad:
+                    print(f"   {sql}")
+                    for line in lines:
+                        print(f"     {line}")
+            else:
+                print(f"✅ {source} ({len(statements)} statements)")
+        conn.rollback()
+    if not ARGS.use_env:
+        engine.dispose()
+        os.remove(_tmp.name)
+    print(f"\n{len(recorder.statements)} distinct statements")
+    if failures:
+        print(f"{failures} statement(s) do full table scans")
+        return 1
+    print("No full table scans")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Denormalized counters: Video.like_count, Video.comment_count and
+User.subscriber_count.
+
+Listing pages read the stored counts instead of running COUNT(*) per row.
+The routes that add likes, comments and subscriptions call ``bump()`` in the
+same transaction as the insert, so the count commits or rolls back together
+with the row. The increment is a single ``UPDATE ... SET c = c + 1`` in the
+database, so concurrent requests can't lose updates.
+
+``reconcile()`` recomputes every counter in bulk from the source tables and
+fixes only the rows that drifted (bulk deletes, manual edits, races between
+the duplicate check and the insert). Run it from cron:
+
+    python counters.py            # fix drift, print how many rows changed
+    python counters.py --check    # report drift only, exit 1 if any
+"""
+
+import sys
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm.util import identity_key
+
+from models import db, User, Video, VideoLike, VideoComment, Subscription
+
+# (owning model, counter column, child model, child foreign key)
+COUNTERS = [
+    (Video, "like_count", VideoLike, "video_id"),
+    (Video, "comment_count", VideoComment, "video_id"),
+    (User, "subscriber_count", Subscription, "subscribed_to_id"),
+]
+
+
+def bump(column, row_id: int, delta: int = 1):
+    """Atomically add ``delta`` to a counter, e.g. ``bump(Video.like_count, vid)``.
+
+    Joins the current session transaction; the caller commits.
+    """
+    model = column.class_
+    db.session.execute(
+        update(model)
+        .where(model.id == row_id)
+        .values({column.key: func.coalesce(column, 0) + delta})
+        .execution_options(synchronize_session=False)
+    )
+    # Keep an already-loaded instance from rendering the old number
+    obj = db.session.identity_map.get(identity_key(model, row_id))
+    if obj is not None:
+        db.session.expire(obj, [column.key])
+
+
+def _drift_condition(model, attr: str, child, fk: str):
+    table = model.__table__
+    actual = (select(func.count())
+              .select_from(child.__table__)
+              .where(child.__table__.c[fk] == table.c.id)
+              .scalar_subquery())
+    # NULL counters (rows inserted without the ORM default) count as drift
+    return actual, func.coalesce(table.c[attr], -1) != actual
+
+
+def drift(bind) -> dict:
+    """Rows whose stored counter disagrees with the source table, per counter."""
+    out = {}
+    for model, attr, child, fk in COUNTERS:
+        _, differs = _drift_condition(model, attr, child, fk)
+        n = bind.execute(select(func.count()).select_from(model.__table__).where(differs)).scalar()
+        out[f"{model.__tablename__}.{attr}"] = n
+    return out
+
+
+def reconcile(bind) -> dict:
+    """Recompute every counter with one UPDATE per counter. Returns rows fixed per counter.
+
+    ``bind`` is a Connection (e.g. inside a migration) or a Session.
+    """
+    out = {}
+    for model, attr, child, fk in COUNTERS:
+        actual, differs = _drift_condition(model, attr, child, fk)
+        result = bind.execute(update(model.__table__).where(differs).values({attr: actual}))
+        out[f"{model.__tablename__}.{attr}"] = result.rowcount
+    return out
+
+
+if __name__ == "__main__":
+    from app import app
+
+    check_only = "--check" in sys.argv[1:]
+    with app.app_context():
+        if check_only:
+            counts = drift(db.session)
+        else:
+            counts = reconcile(db.session)
+            db.session.commit()
+        for name, n in counts.items():
+            print(f"{name:<24} {n:>8} {'rows drifted' if check_only else 'rows fixed'}")
+    sys.exit(1 if check_only and any(counts.values()) else 0)
@@ -0,0 +1,139 @@
+"""
+Backend-aware SQLAlchemy engine configuration.
+
+- SQLite: WAL journaling, synchronous=NORMAL, busy_timeout, mmap and page
+  cache set on every new connection, so heartbeats and view counts don't trip
+  over "database is locked".
+- PostgreSQL/MySQL: pool size, overflow, timeout, pre-ping and recycle from env.
+- The pool holds one connection per gunicorn thread (WEB_THREADS, which the
+  Procfile and deploy configs pass as --threads) plus DB_MAX_OVERFLOW for the
+  background threads, so requests never queue for a connection. Each worker
+  process can open that many: keep workers * (WEB_THREADS + DB_MAX_OVERFLOW)
+  under the database's connection limit, or lower DB_POOL_SIZE and watch the
+  wait times.
+
+Pool checkout wait time is recorded for every connection checkout and shown
+on /health, which is what to watch when sizing gunicorn workers against the
+database's connection limit.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes")
+
+
+# gunicorn --threads; every request thread may hold one pooled connection
+WEB_THREADS = _env_int("WEB_THREADS", 32)
+
+SQLITE_BUSY_TIMEOUT_MS = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_CACHE_SIZE_KB = _env_int("SQLITE_CACHE_SIZE_KB", 20000)
+SQLITE_MMAP_SIZE = _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    SQLITE_SYNCHRONOUS = "NORMAL"
+
+
+class PoolStats:
+    """Checkout wait times (seconds), aggregated and as a recent sample window."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append(wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts, total, worst = self.checkouts, self.total_wait, self.max_wait
+
+        def pct(p):
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(p * len(recent)))]
+
+        return {
+            "checkouts": checkouts,
+            "avg_wait_ms": round(total / checkouts * 1000, 3) if checkouts else 0.0,
+            "p95_wait_ms": round(pct(0.95) * 1000, 3),
+            "p99_wait_ms": round(pct(0.99) * 1000, 3),
+            "max_wait_ms": round(worst * 1000, 3),
+        }
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record(time.perf_counter() - start)
+
+
+def engine_options(database_url: str) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured backend."""
+    if database_url.startswith("sqlite"):
+        if database_url in ("sqlite://", "sqlite:///:memory:"):
+            return {}  # in-memory DBs keep SQLAlchemy's single-connection pool
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": _env_int("DB_POOL_SIZE", WEB_THREADS),
+            "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+            "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+            # busy_timeout is also set by pragma; this covers the initial connect
+            "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000, "check_same_thread": False},
+        }
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": _env_int("DB_POOL_SIZE", WEB_THREADS),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+    finally:
+        cursor.close()
@@ -0,0 +1,251 @@
+"""
+Durable email outbox.
+
+send_email() in app.py only inserts an EmailOutbox row. This module drains
+the table in batches over one persistent, authenticated SMTP session:
+
+- rows are claimed with a conditional UPDATE so several gunicorn workers
+  (or a separate ``python email_outbox.py`` process) never send twice
+- failures are retried with exponential backoff; after EMAIL_MAX_ATTEMPTS a
+  row is dead-lettered (status "dead") and kept for inspection
+- the SMTP connection is reused across batches, checked with NOOP after it
+  has been idle, and closed once nothing has been sent for a while
+- when the relay can't be reached (or drops the session) the row being sent
+  counts a failed attempt and the rest of the batch is handed back unsent,
+  so a dead relay costs one connect timeout per batch, never one per row,
+  and a batch never outlives its SENDING_LEASE_SECONDS claim
+
+Set EMAIL_WORKER=off to keep the sender thread out of the web workers and
+run ``python email_outbox.py`` as its own process instead.
+"""
+
+import os
+import smtplib
+import ssl
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from models import db, EmailOutbox
+
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", "50"))
+EMAIL_POLL_SECONDS = float(os.environ.get("EMAIL_POLL_SECONDS", "5"))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_BACKOFF_SECONDS = int(os.environ.get("EMAIL_BACKOFF_SECONDS", "30"))
+EMAIL_BACKOFF_MAX_SECONDS = int(os.environ.get("EMAIL_BACKOFF_MAX_SECONDS", "3600"))
+SMTP_IDLE_CLOSE_SECONDS = float(os.environ.get("SMTP_IDLE_CLOSE_SECONDS", "120"))
+SMTP_NOOP_AFTER_SECONDS = 30
+# A claimed row whose sender died is handed out again after this long
+SENDING_LEASE_SECONDS = 600
+# Failures of the session rather than of one message: the rest of the batch goes back unsent
+SESSION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPHeloError,
+                  smtplib.SMTPAuthenticationError)
+
+
+def enqueue(subject: str, to: str, text_body: str, html_body: str | None = None) -> EmailOutbox:
+    row = EmailOutbox(to_addr=to, subject=subject, text_body=text_body, html_body=html_body)
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(EMAIL_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)), EMAIL_BACKOFF_MAX_SECONDS))
+
+
+class OutboxSender:
+    """Delivers queued EmailOutbox rows over a single reusable SMTP session."""
+
+    def __init__(self, host, port=587, user=None, password=None, sender="no-reply@cannaspot.local",
+                 use_ssl=False, use_tls=True, smtp_factory=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender
+        self.use_ssl = use_ssl
+        self.use_tls = use_tls
+        self.smtp_factory = smtp_factory
+        self._smtp = None
+        self._last_used = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- SMTP session ---
+    def _connect(self):
+        if self.smtp_factory:
+            smtp = self.smtp_factory(self.host, self.port)
+        elif self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, context=ssl.create_default_context(), timeout=30)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+            if self.use_tls:
+                smtp.starttls(context=ssl.create_default_context())
+        if self.user and self.password:
+            smtp.login(self.user, self.password)
+        return smtp
+
+    def _session(self):
+        idle = time.monotonic() - self._last_used
+        if self._smtp is not None and idle > SMTP_NOOP_AFTER_SECONDS:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except OSError:  # includes SMTPException
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _message(self, row: EmailOutbox) -> EmailMessage:
+        msg = EmailMessage()
+        msg["Subject"] = row.subject
+        msg["From"] = self.sender
+        msg["To"] = row.to_addr
+        msg.set_content(row.text_body)
+        if row.html_body:
+            msg.add_alternative(row.html_body, subtype="html")
+        return msg
+
+    # --- Queue draining ---
+    def _claim(self, limit: int) -> list:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=SENDING_LEASE_SECONDS)
+        candidates = (EmailOutbox.query
+                      .filter(((EmailOutbox.status == "pending") & (EmailOutbox.next_attempt_at <= now)) |
+                              ((EmailOutbox.status == "sending") & (EmailOutbox.next_attempt_at <= stale)))
+                      .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                      .limit(limit)
+                      .with_entities(EmailOutbox.id, EmailOutbox.status)
+                      .all())
+        claimed = []
+        for row_id, status in candidates:
+            # Conditional update: only one sender wins each row
+            won = (EmailOutbox.query
+                   .filter_by(id=row_id, status=status)
+                   .update({"status": "sending", "next_attempt_at": now}, synchronize_session=False))
+            if won:
+                claimed.append(row_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+
+    def _failed(self, row: EmailOutbox, error: Exception):
+        row.attempts = (row.attempts or 0) + 1
+        row.last_error = str(error)[:1000]
+        if row.attempts >= EMAIL_MAX_ATTEMPTS:
+            row.status = "dead"
+            print(f"[email] Dead-lettered #{row.id} to {row.to_addr} after {row.attempts} attempts: {error}")
+        else:
+            row.status = "pending"
+            row.next_attempt_at = datetime.utcnow() + backoff_delay(row.attempts)
+            print(f"[email] Retry #{row.id} to {row.to_addr} in {backoff_delay(row.attempts)}: {error}")
+
+    def _release(self, rows: list):
+        """Hand claimed rows back unsent, without counting an attempt."""
+        now = datetime.utcnow()
+        for row in rows:
+            row.status = "pending"
+            row.next_attempt_at = now
+
+    def drain_once(self, limit: int = EMAIL_BATCH_SIZE) -> int:
+        """Send one batch. Must run inside an app context. Returns rows sent."""
+        rows = self._claim(limit)
+        sent = 0
+        for i, row in enumerate(rows):
+            lost = None
+            try:
+                smtp = self._session()
+                smtp.send_message(self._message(row))
+            except smtplib.SMTPRecipientsRefused as e:
+                # Permanent for this address; retrying won't help
+                row.attempts = (row.attempts or 0) + 1
+                row.status = "dead"
+                row.last_error = str(e)[:1000]
+                print(f"[email] Recipient refused for #{row.id} {row.to_addr}: {e}")
+            except SESSION_ERRORS as e:
+                lost = e
+            except smtplib.SMTPException as e:
+                self._failed(row, e)
+            except OSError as e:  # refused, unreachable, timed out, TLS
+                lost = e
+            except Exception as e:
+                self._failed(row, e)
+            else:
+                row.status = "sent"
+                row.sent_at = datetime.utcnow()
+                row.attempts = (row.attempts or 0) + 1
+                row.last_error = None
+                sent += 1
+                self._last_used = time.monotonic()
+                print(f"[email] Sent to {row.to_addr}: {row.subject}")
+            if lost is not None:
+                # Every later row would wait out its own connect timeout against the same relay
+                self.close()
+                self._failed(row, lost)
+                self._release(rows[i + 1:])
+                db.session.commit()
+                break
+            db.session.commit()
+        return sent
+
+    def drain(self) -> int:
+        """Send batches until nothing is due."""
+        total = 0
+        while True:
+            sent = self.drain_once()
+            total += sent
+            if sent < EMAIL_BATCH_SIZE:
+                return total
+
+    # --- Background thread ---
+    def notify(self):
+        self._wake.set()
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    self.drain()
+                    db.session.remove()
+            except Exception as e:
+                print(f"[email] Outbox worker error: {e}")
+            if self._smtp is not None and time.monotonic() - self._last_used > SMTP_IDLE_CLOSE_SECONDS:
+                self.close()
+            self._wake.wait(EMAIL_POLL_SECONDS)
+            self._wake.clear()
+        self.close()
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,), name="email-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+if __name__ == "__main__":
+    # Standalone sender process: python email_outbox.py
+    from app import app, outbox_sender
+    print(f"[email] Outbox sender running (batch {EMAIL_BATCH_SIZE}, poll {EMAIL_POLL_SECONDS}s)")
+    try:
+        outbox_sender.run_forever(app)
+    except KeyboardInterrupt:
+        outbox_sender.close()
@@ -0,0 +1,207 @@
+"""
+Server-Sent Events push channel for the home feed.
+
+``publish()`` appends a row to the EventLog table. Each web worker runs an
+``EventBridge`` thread that tails that table (one indexed ``id > cursor``
+query per poll, however many clients are connected) and hands new rows to
+the in-process ``EventHub``. SSE streams block on the hub's condition
+variable, so an idle tab costs a parked thread and a heartbeat comment, not
+a request every ten seconds.
+
+- event ids are EventLog primary keys, identical in every worker, so a
+  browser reconnecting with ``Last-Event-ID`` to a different worker resumes
+  where it left off
+- the hub keeps the last EVENTS_BACKLOG events for resume; a client that
+  fell further behind gets a single ``feed`` event with ``reset: true``
+- the publishing worker wakes its own bridge immediately; other workers
+  pick the event up within EVENTS_POLL_SECONDS
+- streams end after EVENTS_STREAM_SECONDS and the browser reconnects, so
+  threads are recycled and proxies never see a connection as stuck
+
+Each open stream holds a worker thread, so streaming is only offered when
+the server can spare them (EVENTS_STREAM=auto checks for a threaded or
+gevent worker; run gunicorn with ``--threads``). Otherwise, or past
+EVENTS_MAX_STREAMS, /api/events answers 204 and recent.html keeps polling.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from models import db, EventLog
+
+EVENTS_STREAM = os.environ.get("EVENTS_STREAM", "auto").lower()
+EVENTS_MAX_STREAMS = int(os.environ.get("EVENTS_MAX_STREAMS", "24"))
+EVENTS_POLL_SECONDS = float(os.environ.get("EVENTS_POLL_SECONDS", "1"))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_STREAM_SECONDS = float(os.environ.get("EVENTS_STREAM_SECONDS", "300"))
+EVENTS_BACKLOG = int(os.environ.get("EVENTS_BACKLOG", "256"))
+EVENTS_RETENTION_SECONDS = int(os.environ.get("EVENTS_RETENTION_SECONDS", "3600"))
+# Browser reconnect delay after a stream ends, sent as the SSE retry: field
+EVENTS_RETRY_MS = 3000
+PRUNE_EVERY_SECONDS = 300
+
+
+class EventHub:
+    """Recent events in id order plus a condition variable streams wait on."""
+
+    def __init__(self, backlog: int = EVENTS_BACKLOG):
+        self._events = deque(maxlen=backlog)  # (id, kind, payload json)
+        self._cond = threading.Condition()
+        # Events at or below the floor are no longer (or were never) in the buffer
+        self.floor = None
+        self.last_id = 0
+        self.streams = 0
+
+    def reset(self, cursor: int):
+        with self._cond:
+            self._events.clear()
+            self.floor = self.last_id = cursor
+
+    def dispatch(self, rows):
+        """Append (id, kind, payload) rows, ascending by id, and wake every stream."""
+        with self._cond:
+            for row in rows:
+                if row[0] <= self.last_id:
+                    continue
+                if len(self._events) == self._events.maxlen:
+                    self.floor = self._events[0][0]
+                self._events.append(row)
+                self.last_id = row[0]
+            self._cond.notify_all()
+
+    def since(self, last_id: int):
+        """Events after ``last_id``, or None if some of them were already dropped."""
+        with self._cond:
+            if self.floor is None or last_id < self.floor:
+                return None
+            return [e for e in self._events if e[0] > last_id]
+
+    def wait(self, last_id: int, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.last_id > last_id, timeout)
+
+    def acquire_stream(self) -> bool:
+        with self._cond:
+            if self.streams >= EVENTS_MAX_STREAMS:
+                return False
+            self.streams += 1
+            return True
+
+    def release_stream(self):
+        with self._cond:
+            self.streams -= 1
+
+
+class EventBridge:
+    """Tails EventLog into the hub so every worker sees every event."""
+
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+
+    def poll_once(self) -> int:
+        """Dispatch new EventLog rows. Must run inside an app context."""
+        if self.hub.floor is None:
+            # Start from the current head: history before boot is not replayed
+            self.hub.reset(db.session.execute(select(func.max(EventLog.id))).scalar() or 0)
+        rows = db.session.execute(
+            select(EventLog.id, EventLog.kind, EventLog.payload)
+            .where(EventLog.id > self.hub.last_id)
+            .order_by(EventLog.id)
+            .limit(500)
+        ).all()
+        if rows:
+            self.hub.dispatch([tuple(r) for r in rows])
+        if time.monotonic() - self._last_prune > PRUNE_EVERY_SECONDS:
+            self._last_prune = time.monotonic()
+            cutoff = datetime.utcnow() - timedelta(seconds=EVENTS_RETENTION_SECONDS)
+            db.session.execute(delete(EventLog).where(EventLog.created_at < cutoff))
+        db.session.commit()
+        return len(rows)
+
+    def notify(self):
+        self._wake.set()
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    self.poll_once()
+                    db.session.remove()
+            except Exception as e:
+                print(f"[events] Bridge error: {e}")
+            self._wake.wait(EVENTS_POLL_SECONDS)
+            self._wake.clear()
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,), name="event-bridge", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+hub = EventHub()
+bridge = EventBridge(hub)
+
+
+def publish(kind: str, **data):
+    """Record an event for every worker's streams. Never raises into the caller."""
+    try:
+        # Own connection, so the caller's session and transaction are untouched
+        with db.engine.begin() as conn:
+            conn.execute(insert(EventLog).values(kind=kind, payload=json.dumps(data), created_at=datetime.utcnow()))
+    except Exception as e:
+        print(f"[events] Could not publish {kind}: {e}")
+        return
+    bridge.notify()
+
+
+def streaming_supported(environ) -> bool:
+    if EVENTS_STREAM in ("0", "off", "false", "no"):
+        return False
+    if EVENTS_STREAM in ("1", "on", "true", "yes"):
+        return True
+    # auto: a sync worker would be pinned by one open stream
+    if environ.get("wsgi.multithread"):
+        return True
+    monkey = sys.modules.get("gevent.monkey")
+    return bool(monkey and monkey.is_module_patched("socket"))
+
+
+def _frame(event_id, kind, payload) -> str:
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+
+
+def stream(last_id: int):
+    """Generator of SSE frames for one client, starting after ``last_id``."""
+    yield f"retry: {EVENTS_RETRY_MS}\n\n"
+    deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        events = hub.since(last_id)
+        if events is None:
+            # Resume point is gone (or from before this worker booted): make the client resync
+            last_id = hub.last_id
+            yield _frame(last_id, "feed", json.dumps({"reset": True}))
+            events = []
+        for event_id, kind, payload in events:
+            yield _frame(event_id, kind, payload)
+            last_id = event_id
+        if not hub.wait(last_id, EVENTS_HEARTBEAT_SECONDS):
+            yield ": ping\n\n"
@@ -0,0 +1,200 @@
+"""
+Rendered-fragment cache with tag-based invalidation.
+
+Each entry is a piece of HTML plus the stamps of the tags it was built from.
+A tag is a ``Generation`` name (see cache.py), so ``invalidate("videos")``
+is one small file write that every gunicorn worker notices on its next read,
+and existing generations such as ``site_globals`` can be used as tags too.
+An entry whose recorded stamps no longer match is a miss.
+
+Entries live in an in-process LRU bounded by the UTF-8 size of the cached
+HTML (FRAGMENT_CACHE_BYTES). With FRAGMENT_BACKEND set, misses fall through
+to a shared store before rendering, so one worker's render serves the rest:
+
+    FRAGMENT_BACKEND=file             # files under instance/cache/fragments
+    FRAGMENT_BACKEND=redis://host/0   # needs the redis package
+
+Set FRAGMENT_CACHE=off to render every time.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cache import CACHE_DIR, Generation
+
+FRAGMENT_CACHE = os.environ.get("FRAGMENT_CACHE", "on").lower() not in ("0", "off", "false", "no")
+FRAGMENT_CACHE_BYTES = int(os.environ.get("FRAGMENT_CACHE_BYTES", str(16 * 1024 * 1024)))
+FRAGMENT_BACKEND = os.environ.get("FRAGMENT_BACKEND", "")
+# Upper bound on staleness for data that isn't tagged (like counts on cards)
+FRAGMENT_TTL = float(os.environ.get("FRAGMENT_TTL", "300"))
+
+
+class FileBackend:
+    """One JSON file per key; fine for workers on one host."""
+
+    def __init__(self, directory: str = os.path.join(CACHE_DIR, "fragments")):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key: str, data: str):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[fragments] could not write {key}: {e}")
+
+
+class RedisBackend:
+    def __init__(self, url: str, ttl: int = int(FRAGMENT_TTL)):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str):
+        value = self.client.get(f"fragment:{key}")
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, data: str):
+        self.client.set(f"fragment:{key}", data, ex=self.ttl)
+
+
+def backend_from_env(spec: str = FRAGMENT_BACKEND):
+    if not spec:
+        return None
+    try:
+        if spec == "file":
+            return FileBackend()
+        if spec.startswith(("redis://", "rediss://", "unix://")):
+            return RedisBackend(spec)
+    except ImportError as e:
+        print(f"[fragments] shared backend {spec!r} unavailable ({e}); using the in-process cache only")
+        return None
+    print(f"[fragments] unknown FRAGMENT_BACKEND {spec!r}; using the in-process cache only")
+    return None
+
+
+class FragmentCache:
+    """LRU of rendered HTML keyed by name, validated against tag stamps."""
+
+    def __init__(self, max_bytes: int = FRAGMENT_CACHE_BYTES, backend=None, enabled: bool = FRAGMENT_CACHE):
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (stamps, html, size, expires_at)
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _generation(self, tag: str) -> Generation:
+        gen = self._tags.get(tag)
+        if gen is None:
+            gen = self._tags.setdefault(tag, Generation(tag))
+        return gen
+
+    def stamps(self, tags) -> dict:
+        return {tag: self._generation(tag).shared() for tag in tags}
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self._generation(tag).bump()
+
+    # --- Storage ---
+    def _get_local(self, key: str, stamps: dict):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != stamps or time.time() >= entry[3]:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def _put_local(self, key: str, stamps: dict, html: str, expires_at: float):
+        size = len(html.encode("utf-8"))
+        if size > self.max_bytes // 4:
+            return  # one huge fragment would flush everything else
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (stamps, html, size, expires_at)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._entries:
+                _, (_, _, dropped, _) = self._entries.popitem(last=False)
+                self.bytes -= dropped
+                self.evictions += 1
+
+    def _get_shared(self, key: str, stamps: dict):
+        try:
+            data = self.backend.get(key)
+            if data is None:
+                return None
+            entry = json.loads(data)
+        except Exception as e:
+            print(f"[fragments] shared get failed for {key}: {e}")
+            return None
+        if entry.get("stamps") != stamps or time.time() >= entry.get("expires_at", 0):
+            return None
+        return entry["html"], entry["expires_at"]
+
+    def _put_shared(self, key: str, stamps: dict, html: str, expires_at: float):
+        try:
+            self.backend.set(key, json.dumps({"stamps": stamps, "html": html, "expires_at": expires_at}))
+        except Exception as e:
+            print(f"[fragments] shared set failed for {key}: {e}")
+
+    # --- Public API ---
+    def get_or_render(self, key: str, tags, render, ttl: float = FRAGMENT_TTL):
+        """Cached HTML for ``key``; calls ``render()`` when a tag moved or ``ttl`` seconds passed.
+
+        ``render`` may return None to skip caching, and None is passed through.
+        """
+        if not self.enabled:
+            return render()
+        # Stamps are read before rendering, so a change that lands mid-render invalidates the result
+        stamps = self.stamps(tags)
+        html = self._get_local(key, stamps)
+        if html is not None:
+            self.hits += 1
+            return html
+        if self.backend is not None:
+            shared = self._get_shared(key, stamps)
+            if shared is not None:
+                self.hits += 1
+                self._put_local(key, stamps, *shared)
+                return shared[0]
+        self.misses += 1
+        html = render()
+        if html is None:
+            return None
+        html = str(html)
+        expires_at = time.time() + ttl
+        self._put_local(key, stamps, html, expires_at)
+        if self.backend is not None:
+            self._put_shared(key, stamps, html, expires_at)
+        return html
+
+
+fragment_cache = FragmentCache(backend=backend_from_env())
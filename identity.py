@@ -0,0 +1,93 @@
+"""
+Identity cache for the logged-in user.
+
+Two layers:
+- the ORM ``User`` is memoized on ``flask.g`` for the life of one request
+- a short-TTL, in-process LRU of read-only user snapshots keyed by uid, so hot
+  polling endpoints can authenticate without touching the database
+
+Each uid carries a version stamp. Code that changes a user row calls
+``invalidate_user(uid)`` which bumps the stamp and drops the cached snapshot.
+Other workers only see the change once their TTL runs out, so keep it short.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "2048"))
+
+
+class UserSnapshot:
+    """Detached, read-only copy of a User row's columns."""
+
+    def __init__(self, values: dict, version: int):
+        self.__dict__.update(values)
+        self._version = version
+
+    @classmethod
+    def from_user(cls, user, version: int):
+        values = {c.name: getattr(user, c.name) for c in user.__table__.columns}
+        return cls(values, version)
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.id} v{self._version}>"
+
+
+class UserCache:
+    """Thread-safe LRU of UserSnapshot with TTL and per-uid version stamps."""
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # uid -> (expires_at, snapshot)
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, uid: int) -> int:
+        return self._versions.get(uid, 0)
+
+    def get(self, uid: int):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(uid)
+            if entry:
+                expires_at, snap = entry
+                if expires_at > now and snap._version == self._versions.get(uid, 0):
+                    self._data.move_to_end(uid)
+                    self.hits += 1
+                    return snap
+                del self._data[uid]
+            self.misses += 1
+            return None
+
+    def put(self, user):
+        with self._lock:
+            snap = UserSnapshot.from_user(user, self._versions.get(user.id, 0))
+            self._data[user.id] = (time.monotonic() + self.ttl, snap)
+            self._data.move_to_end(user.id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return snap
+
+    def invalidate(self, uid: int):
+        with self._lock:
+            self._versions[uid] = self._versions.get(uid, 0) + 1
+            self._data.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+user_cache = UserCache()
+
+
+def invalidate_user(uid):
+    """Call after any write to a User row (profile, password, status, admin actions)."""
+    if uid:
+        user_cache.invalidate(int(uid))
@@ -0,0 +1,249 @@
+"""
+Responsive image derivatives.
+
+Server icons, emoji images, ad images and thumbnails used to be sent at
+whatever size they were uploaded, often megabyte PNGs shown at 32px.
+``img_tag()`` (a template global) now renders
+
+    <picture><source type="image/avif" srcset="..."><source type="image/webp" srcset="...">
+    <img src="original" ...></picture>
+
+where every srcset candidate is /img/<format>/<width>/<source path>, a
+WIDTHS bucket of the source in AVIF or WebP:
+
+- generated on the first request and cached on disk under
+  uploads/derived/ as ``<source sha256>-<width>.<format>``, so equal
+  sources share derivatives and a changed legacy file gets new ones
+- sources in the blob store (blobs.py) never change under their URL, so
+  their derivatives are sent with a year-long immutable Cache-Control;
+  anything else with media.py's MEDIA_MAX_AGE
+- a fixed display size (``width=``) gets 1x/2x candidates, fluid images
+  (``sizes=``) width candidates up to ``width * 2``
+- YouTube thumbnails get YouTube's own mq/hq renditions instead
+- ``python blobs.py --gc`` deletes a blob's derivatives with it; the whole
+  of uploads/derived/ can be deleted at any time and is rebuilt on demand
+
+Needs Pillow 11.3+ for AVIF (requirements.txt); older versions do WebP
+only. Without Pillow, or for sources it can't decode or that are animated,
+pages keep the plain <img> and /img/ redirects to the original. GIFs (mostly
+animated emoji) get no <source>s at all. A source Pillow can't decode leaves
+a ``<source sha256>-failed`` marker next to where its derivatives would be,
+so it is opened once, not on every request, and its redirect is a 301
+cached like a derivative would be. Errors writing the derivative (disk
+full, permissions) leave no marker and are retried on the next request.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from flask import abort, redirect
+from markupsafe import Markup, escape
+from werkzeug.security import safe_join
+
+import blobs
+from media import IMMUTABLE_MAX_AGE, MEDIA_MAX_AGE, send_media
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+ROOTS = {"uploads": UPLOAD_DIR, "static": os.path.join(BASE_DIR, "static")}
+
+WIDTHS = (32, 64, 128, 256, 480, 960)
+QUALITY = {"avif": 55, "webp": 78}
+MIME = {"avif": "image/avif", "webp": "image/webp"}
+IMAGE_FORMATS = os.environ.get("IMAGE_FORMATS", "avif,webp").lower().split(",")
+IMAGE_MAX_SOURCE_PIXELS = int(os.environ.get("IMAGE_MAX_SOURCE_PIXELS", str(40_000_000)))
+# Memoized source digests, keyed by (path, mtime, size)
+DIGEST_CACHE_SIZE = 10000
+
+_YOUTUBE = re.compile(r"^https?://(?:img\.youtube\.com|i\.ytimg\.com)/vi/([\w-]{6,20})/\w+\.jpg$")
+YOUTUBE_RENDITIONS = ((320, "mqdefault"), (480, "hqdefault"))
+
+_digests = OrderedDict()
+_digest_lock = threading.Lock()
+_pillow = None
+
+
+def _pil():
+    """(Image, ImageOps) from Pillow, or None when it isn't installed."""
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image, ImageOps  # optional dependency
+        except ImportError:
+            _pillow = False
+        else:
+            Image.MAX_IMAGE_PIXELS = IMAGE_MAX_SOURCE_PIXELS
+            _pillow = (Image, ImageOps)
+    return _pillow or None
+
+
+def formats() -> list:
+    """Derivative formats this install can write, best first."""
+    pil = _pil()
+    if pil is None:
+        return []
+    from PIL import features
+    available = []
+    for fmt in IMAGE_FORMATS:
+        try:
+            if fmt in MIME and features.check(fmt):
+                available.append(fmt)
+        except ValueError:  # Pillow too old to know the codec
+            pass
+    return available
+
+
+def _local(src: str | None):
+    """(root name, path below it) for a local /uploads/ or /static/ URL, else None."""
+    if not src or not src.startswith("/"):
+        return None
+    root, _, rel = src.lstrip("/").partition("/")
+    if root not in ROOTS or not rel or "?" in rel:
+        return None
+    return root, rel
+
+
+def derived_url(src: str, width: int, fmt: str) -> str:
+    root, rel = _local(src)
+    return f"/img/{fmt}/{width}/{root}/{rel}"
+
+
+def _buckets(width: int, fluid: bool) -> list:
+    if fluid:
+        return [w for w in WIDTHS if w <= width * 2] or [WIDTHS[0]]
+    one = next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+    two = next((w for w in WIDTHS if w >= width * 2), WIDTHS[-1])
+    return [one] if two == one else [one, two]
+
+
+def srcset(src: str, width: int, fmt: str, fluid: bool = False) -> str:
+    buckets = _buckets(width, fluid)
+    if fluid:
+        return ", ".join(f"{derived_url(src, w, fmt)} {w}w" for w in buckets)
+    return ", ".join(f"{derived_url(src, w, fmt)} {i + 1}x" for i, w in enumerate(buckets))
+
+
+def img_tag(src: str | None, width: int, alt: str = "", sizes: str | None = None,
+            fallback: str = "/static/leaf.png", **attrs) -> Markup:
+    """An <img> for ``src`` shown ``width`` CSS px wide (or per ``sizes``), with AVIF/WebP sources.
+
+    Extra keyword arguments become attributes of the <img> (``class`` works from templates).
+    """
+    src = src or fallback
+    img = {"src": src, "srcset": None, "sizes": sizes, "alt": alt, "loading": "lazy", "decoding": "async", **attrs}
+    sources = []  # (type, srcset)
+    youtube = _YOUTUBE.match(src)
+    if youtube:
+        vid = youtube.group(1)
+        img["srcset"] = ", ".join(f"https://i.ytimg.com/vi/{vid}/{name}.jpg {w}w" for w, name in YOUTUBE_RENDITIONS)
+        img["sizes"] = sizes or f"{width}px"
+        sources.append(("image/webp", ", ".join(f"https://i.ytimg.com/vi_webp/{vid}/{name}.webp {w}w"
+                                                for w, name in YOUTUBE_RENDITIONS)))
+    elif _local(src) and not src.lower().endswith((".svg", ".gif")):
+        sources = [(MIME[fmt], srcset(src, width, fmt, fluid=bool(sizes))) for fmt in formats()]
+
+    def tag(name, values):
+        return f"<{name} " + " ".join(f'{k}="{escape(v)}"' for k, v in values.items() if v is not None) + ">"
+
+    if not sources:
+        return Markup(tag("img", img))
+    tags = "".join(tag("source", {"type": t, "srcset": s, "sizes": img["sizes"]}) for t, s in sources)
+    # display:contents keeps the wrapper out of layout, so existing <img> styles still apply
+    return Markup(f'<picture style="display:contents">{tags}{tag("img", img)}</picture>')
+
+
+# --- Serving ---
+def source_digest(path: str, rel: str) -> str:
+    """SHA-256 of a source file: from the name for stored blobs, else hashed once per version."""
+    sha = blobs.digest(rel)
+    if sha:
+        return sha
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        if key in _digests:
+            _digests.move_to_end(key)
+            return _digests[key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    with _digest_lock:
+        _digests[key] = h.hexdigest()
+        while len(_digests) > DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return _digests[key]
+
+
+def render(path: str, out: str, width: int, fmt: str) -> bool:
+    """Write the ``width``-px ``fmt`` derivative of ``path`` to ``out``.
+
+    False if Pillow can't decode the source (or it is animated). Errors
+    reading the file or writing ``out`` (disk full, permissions) raise.
+    """
+    Image, ImageOps = _pil()
+    with open(path, "rb") as f:
+        try:
+            with Image.open(f) as im:
+                if getattr(im, "n_frames", 1) > 1:
+                    return False  # animated GIF/WebP emoji: keep the animation
+                im.draft("RGB", (width, width * 4))  # JPEG: decode at a reduced scale
+                im = ImageOps.exif_transpose(im)
+                has_alpha = im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info)
+                im = im.convert("RGBA" if has_alpha else "RGB")
+                im.thumbnail((width, width * 4), Image.LANCZOS)  # never upscales
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return False
+    tmp = f"{out}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        im.save(tmp, format=fmt.upper(), quality=QUALITY[fmt])
+        os.replace(tmp, out)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return True
+
+
+def serve(fmt: str, width: int, src: str):
+    """Response for /img/<fmt>/<width>/<src>."""
+    root, _, rel = src.partition("/")
+    if root not in ROOTS or width not in WIDTHS or fmt not in MIME:
+        abort(404)
+    path = safe_join(ROOTS[root], rel)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    if fmt not in formats():
+        return redirect(f"/{root}/{rel}")
+    sha = source_digest(path, rel)
+    name = f"derived/{sha[:2]}/{sha}-{width}.{fmt}"
+    out = os.path.join(UPLOAD_DIR, name)
+    # Blob sources never change under their URL, so neither do their derivatives.
+    immutable = root == "uploads" and blobs.digest(rel) is not None
+    if not os.path.exists(out):
+        # Same name pattern as the derivatives, so blobs.py's gc removes it with them
+        failed = os.path.join(UPLOAD_DIR, f"derived/{sha[:2]}/{sha}-failed")
+        if os.path.exists(failed):
+            return _original(root, rel, immutable)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        try:
+            rendered = render(path, out, width, fmt)
+        except OSError as e:
+            # Disk full, permissions: nothing wrong with the source, so try again next time
+            print(f"[images] Could not write {name}: {e}")
+            return redirect(f"/{root}/{rel}")
+        if not rendered:
+            open(failed, "w").close()
+            return _original(root, rel, immutable)
+    # Served from uploads/ so MEDIA_OFFLOAD's front server finds the file too
+    return send_media(UPLOAD_DIR, name, immutable=immutable)
+
+
+def _original(root: str, rel: str, immutable: bool):
+    """Permanent redirect from a derivative URL to a source that can't be rendered."""
+    response = redirect(f"/{root}/{rel}", 301)
+    response.headers["Cache-Control"] = (f"public, max-age={IMMUTABLE_MAX_AGE}, immutable" if immutable
+                                         else f"public, max-age={MEDIA_MAX_AGE}")
+    return response
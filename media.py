@@ -0,0 +1,144 @@
+"""
+Media delivery for /uploads (videos, thumbnails, avatars, emojis).
+
+- ``Range: bytes=a-b`` answers 206 with the slice, an unsatisfiable range
+  416; ``If-Range`` with a stale validator falls back to the whole file,
+  and multi-range requests get the whole file (allowed by RFC 9110)
+- ETag / If-None-Match and Last-Modified; files named by their content
+  digest (40-64 hex characters) never change, so they are sent with
+  ``Cache-Control: immutable`` and a year's max-age, everything else with
+  MEDIA_MAX_AGE
+- bytes go out through the server's ``wsgi.file_wrapper``, which gunicorn
+  and mod_wsgi turn into ``os.sendfile`` (the slice is positioned by seeking
+  and bounded by Content-Length), so the kernel copies file to socket; other
+  servers get a bounded read loop
+
+With a front server, MEDIA_OFFLOAD hands the transfer over and frees the
+worker as soon as the headers are built:
+
+    MEDIA_OFFLOAD=x-accel      # nginx; location MEDIA_ACCEL_PREFIX { internal; alias .../uploads/; }
+    MEDIA_OFFLOAD=x-sendfile   # Apache mod_xsendfile or LiteSpeed, see deploy/apache_directadmin.conf
+
+The front server then handles Range and conditional requests itself.
+"""
+
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from flask import abort, request
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Response
+
+MEDIA_OFFLOAD = os.environ.get("MEDIA_OFFLOAD", "").lower()
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/_media/")
+MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE", "3600"))
+MEDIA_BLOCK_SIZE = 256 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_DIGEST_NAME = re.compile(r"^[0-9a-f]{40,64}$")
+
+# HLS output of media_jobs.py; not in every system's mime.types (.ts is often TypeScript)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+
+def content_digest(filename: str):
+    """The digest a content-addressed file is named by, or None."""
+    stem = os.path.basename(filename).split(".", 1)[0]
+    return stem if _DIGEST_NAME.match(stem) else None
+
+
+def _zero_copy(environ) -> bool:
+    # Only servers whose file wrapper honours Content-Length can be handed a seeked slice
+    if "wsgi.file_wrapper" not in environ:
+        return False
+    return environ.get("SERVER_SOFTWARE", "").startswith("gunicorn") or "mod_wsgi.version" in environ
+
+
+def _read_slice(f, length: int):
+    try:
+        while length > 0:
+            chunk = f.read(min(MEDIA_BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _byte_range(size: int, etag: str, mtime: float):
+    """(start, stop, status) for this request, or None when the range can't be satisfied."""
+    rng = request.range
+    if rng is None or rng.units != "bytes" or len(rng.ranges) != 1:
+        return 0, size, 200
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return 0, size, 200
+    if if_range.date is not None and if_range.date.timestamp() < int(mtime):
+        return 0, size, 200
+    span = rng.range_for_length(size)
+    if span is None:
+        return None
+    return span[0], span[1], 206
+
+
+def send_media(root: str, filename: str, immutable: bool | None = None) -> Response:
+    """Send ``root/filename``. ``immutable`` overrides the guess from the file name."""
+    path = safe_join(root, filename)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+
+    digest = content_digest(filename)
+    etag = digest or f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    if immutable is None:
+        immutable = digest is not None
+    headers = {
+        "ETag": f'"{etag}"',
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (f"public, max-age={IMMUTABLE_MAX_AGE}, immutable" if immutable
+                          else f"public, max-age={MEDIA_MAX_AGE}"),
+    }
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if request.if_none_match.contains_weak(etag) or (
+            not request.if_none_match and request.if_modified_since
+            and request.if_modified_since.timestamp() >= int(st.st_mtime)):
+        return Response(status=304, headers=headers)
+
+    if MEDIA_OFFLOAD in ("x-accel", "x-accel-redirect"):
+        rel = os.path.relpath(path, root).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + quote(rel)
+        return Response(headers=headers, mimetype=mimetype)
+    if MEDIA_OFFLOAD == "x-sendfile":
+        headers["X-Sendfile"] = path
+        return Response(headers=headers, mimetype=mimetype)
+
+    span = _byte_range(st.st_size, etag, st.st_mtime)
+    if span is None:
+        headers["Content-Range"] = f"bytes */{st.st_size}"
+        return Response(status=416, headers=headers)
+    start, stop, status = span
+    if status == 206:
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{st.st_size}"
+
+    f = open(path, "rb")
+    f.seek(start)
+    if _zero_copy(request.environ):
+        body = request.environ["wsgi.file_wrapper"](f, MEDIA_BLOCK_SIZE)
+    else:
+        body = _read_slice(f, stop - start)
+    resp = Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    resp.content_length = stop - start
+    return resp
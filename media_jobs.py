@@ -0,0 +1,606 @@
+"""
+Background media processing for uploaded videos and shorts.
+
+upload(), upload_short() and finished resumable uploads store the original
+file and call ``enqueue()``; one MediaJob row per upload and stage is the
+queue. The ``MediaWorker`` thread claims pending jobs with a conditional
+UPDATE and runs them on a ProcessPoolExecutor of MEDIA_PROCS processes, so
+ffmpeg never runs on a request thread and however many uploads arrive at
+most MEDIA_PROCS encodes share the machine.
+
+Stages (STAGES):
+
+- ``hls``: one ffmpeg run encodes an adaptive ladder (HLS_LADDER; rungs
+  above the source's short side are dropped) as HLS_SEGMENT_SECONDS
+  segments per rendition plus a master.m3u8 under uploads/hls/<kind>-<id>/.
+  The row's hls_status turns "ready" and watch.html / shorts play hls_url;
+  until then, and if it fails, they play the original file
+- ``preview``: a representative poster frame (ffmpeg's thumbnail filter,
+  past the first tenth of the video) becomes the row's thumbnail unless
+  the uploader attached one, and a sprite sheet of up to PREVIEW_MAX_TILES
+  tiles read from keyframes only, with a WebVTT track pointing into it
+  (``sprite.webp#xywh=...``), drives the watch page's seek preview. All
+  images are WebP, under uploads/previews/<kind>-<id>/
+
+- pool processes only run ffmpeg and never touch the database; the thread
+  records results, and output goes to a temporary directory that is renamed
+  into place, so half-written output is never served
+- stages are idempotent: output that is already in place isn't rebuilt, so
+  a job redone after a crash only records the result, and an interrupted
+  backfill picks up where it stopped
+- the thread keeps its claims fresh; a job whose process died is handed out
+  again after MEDIA_LEASE_SECONDS, and after MEDIA_MAX_ATTEMPTS failures the
+  row is marked "failed" and keeps its original file
+- only one process per host runs the pool (a lock file under instance/), so
+  several gunicorn workers don't each start MEDIA_PROCS encodes
+- uploads that aren't local files (YouTube embeds) are marked "skipped"
+
+Needs ffmpeg and ffprobe on PATH (or set FFMPEG / FFPROBE); without them
+the thread doesn't start and everything plays from the original files.
+MEDIA_WORKER=off keeps the thread out of the web workers: run
+``python media_jobs.py`` as its own process instead. ``python media_jobs.py
+--backfill`` queues every upload that has no job yet (migrations 12 and 13
+did this once per stage).
+
+Browsers without native HLS play the ladder through hls.js, committed under
+static/js/vendor/ at the exact version HLS_JS_VERSION (never a CDN, so no
+third-party script runs on the watch pages). To move to another version, set
+HLS_JS_VERSION and HLS_JS_SHA256 (the SHA-256 of its dist/hls.min.js) and
+run ``python media_jobs.py --fetch-hls-js``: it downloads that version's npm
+tarball and writes the build only if it has exactly that digest.
+"""
+
+import atexit
+import base64
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from urllib.request import urlopen
+
+from sqlalchemy import and_, exists, insert, select, update
+
+from models import db, Video, Short, MediaJob
+
+try:
+    import fcntl
+except ImportError:  # Windows development: every worker may run a pool
+    fcntl = None
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+HLS_DIR = os.path.join(UPLOAD_DIR, "hls")
+PREVIEW_DIR = os.path.join(UPLOAD_DIR, "previews")
+LOCK_PATH = os.path.join(BASE_DIR, "instance", "media-worker.lock")
+# Keep in step with HLS_JS in static/js/hls.js
+HLS_JS_VERSION = "1.4.10"
+HLS_JS_SHA256 = "30b278794fd3f269a47e6dc7b76ae9a04f08acffdd72f9b8cc26d49d3ba09c38"  # dist/hls.min.js
+HLS_JS_PATH = os.path.join(BASE_DIR, "static", "js", "vendor", f"hls-{HLS_JS_VERSION}.min.js")
+NPM_REGISTRY = "https://registry.npmjs.org"
+
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")
+FFPROBE = os.environ.get("FFPROBE", "ffprobe")
+# ffmpeg runs with FFMPEG_THREADS threads, so half the cores keeps the machine responsive
+MEDIA_PROCS = int(os.environ.get("MEDIA_PROCS", str(max(1, (os.cpu_count() or 2) // 2))))
+MEDIA_POLL_SECONDS = float(os.environ.get("MEDIA_POLL_SECONDS", "10"))
+MEDIA_MAX_ATTEMPTS = int(os.environ.get("MEDIA_MAX_ATTEMPTS", "3"))
+MEDIA_TIMEOUT_SECONDS = int(os.environ.get("MEDIA_TIMEOUT_SECONDS", "3600"))
+FFMPEG_THREADS = 2
+HLS_SEGMENT_SECONDS = 6
+# (short side in pixels, video kbit/s, audio kbit/s), lowest first
+HLS_LADDER = ((240, 400, 64), (480, 1000, 96), (720, 2500, 128))
+POSTER_SIZE = 640  # long side
+POSTER_SAMPLE_FRAMES = 50  # frames the thumbnail filter picks the most typical one from
+PREVIEW_TILE_SIZE = 160  # long side of a sprite tile
+PREVIEW_COLUMNS = 10
+PREVIEW_MAX_TILES = 100
+PREVIEW_MIN_INTERVAL = 2.0  # seconds between tiles on short videos
+# Claims older than this belong to a worker that died
+MEDIA_LEASE_SECONDS = 300
+# A failed job waits this long before its next attempt
+MEDIA_RETRY_SECONDS = 60
+# The pool's processes are shut down after this long without work
+POOL_IDLE_SECONDS = 300
+
+MODELS = {"video": Video, "short": Short}
+
+
+class MediaError(Exception):
+    """A stage that can't process its file; the message ends up in MediaJob.last_error."""
+
+
+def available() -> bool:
+    return bool(shutil.which(FFMPEG) and shutil.which(FFPROBE))
+
+
+def source_path(filename: str | None):
+    """Local path of an uploaded file, or None for anything not under /uploads/ (YouTube embeds)."""
+    if not filename or not filename.startswith("/uploads/"):
+        return None
+    return os.path.join(BASE_DIR, filename.lstrip("/"))
+
+
+def _run(cmd: list, timeout: int = MEDIA_TIMEOUT_SECONDS) -> str:
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise MediaError(f"{os.path.basename(cmd[0])} timed out after {timeout}s")
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise MediaError(f"{os.path.basename(cmd[0])} exited with {proc.returncode}: {tail}")
+    return proc.stdout
+
+
+def probe(src: str) -> dict:
+    """Display width/height (after rotation), duration and whether there is audio."""
+    info = json.loads(_run([FFPROBE, "-v", "error", "-print_format", "json",
+                            "-show_streams", "-show_format", src], timeout=120))
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise MediaError("no video stream")
+    width, height = int(video.get("width") or 0), int(video.get("height") or 0)
+    rotation = video.get("tags", {}).get("rotate")
+    for side in video.get("side_data_list", []):
+        rotation = side.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width  # phones record sideways and flag the rotation
+    return {
+        "width": width,
+        "height": height,
+        "duration": float(info.get("format", {}).get("duration") or 0),
+        "audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def _swap_in(tmp: str, final: str):
+    """Replace directory ``final`` by ``tmp`` so readers see the old or the new one, never a mix."""
+    trash = f"{final}.old-{os.getpid()}"
+    if os.path.exists(final):
+        os.rename(final, trash)
+    os.rename(tmp, final)
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def _fit(width: int, height: int, long_side: int):
+    """Even-sized (width, height) with the given long side and the source's aspect ratio."""
+    if not width or not height:
+        return long_side, long_side * 9 // 16 // 2 * 2
+    if width >= height:
+        return long_side, max(2, round(long_side * height / width / 2) * 2)
+    return max(2, round(long_side * width / height / 2) * 2), long_side
+
+
+def _build(out_root: str, name: str, expected: tuple, build) -> str:
+    """Run ``build(tmp_dir)`` and swap the result in as ``out_root/name``. Returns that directory.
+
+    Nothing is rebuilt when every ``expected`` file is already in place.
+    """
+    final = os.path.join(out_root, name)
+    if all(os.path.exists(os.path.join(final, f)) for f in expected):
+        return final
+    tmp = os.path.join(out_root, f".{name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        build(tmp)
+        missing = [f for f in expected if not os.path.exists(os.path.join(tmp, f))]
+        if missing:
+            raise MediaError(f"ffmpeg wrote no {', '.join(missing)}")
+        _swap_in(tmp, final)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return final
+
+
+# --- Stages (run in pool processes) ---
+def hls_command(src: str, out_dir: str, info: dict) -> list:
+    """The ffmpeg invocation that encodes every rung of the ladder in one decode of ``src``."""
+    short_side = min(info["width"], info["height"]) or HLS_LADDER[0][0]
+    rungs = [r for r in HLS_LADDER if r[0] <= short_side] or [HLS_LADDER[0]]
+    landscape = info["width"] >= info["height"]
+    labels = "".join(f"[s{i}]" for i in range(len(rungs)))
+    graph = [f"[0:v]split={len(rungs)}{labels}"]
+    for i, (size, _, _) in enumerate(rungs):
+        scale = f"-2:{size}" if landscape else f"{size}:-2"
+        graph.append(f"[s{i}]scale={scale}[v{i}]")
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", src,
+           "-filter_complex", ";".join(graph)]
+    streams = []
+    for i, (_, video_kbps, audio_kbps) in enumerate(rungs):
+        cmd += ["-map", f"[v{i}]", f"-b:v:{i}", f"{video_kbps}k",
+                f"-maxrate:v:{i}", f"{video_kbps * 107 // 100}k", f"-bufsize:v:{i}", f"{video_kbps * 3 // 2}k"]
+        if info["audio"]:
+            cmd += ["-map", "0:a:0", f"-b:a:{i}", f"{audio_kbps}k"]
+            streams.append(f"v:{i},a:{i}")
+        else:
+            streams.append(f"v:{i}")
+    cmd += ["-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-pix_fmt", "yuv420p",
+            # Keyframes on segment boundaries so players can switch renditions there
+            "-sc_threshold", "0", "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+            "-threads", str(FFMPEG_THREADS)]
+    if info["audio"]:
+        cmd += ["-c:a", "aac", "-ac", "2", "-ar", "48000"]
+    cmd += ["-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+            "-hls_flags", "independent_segments",
+            "-hls_segment_filename", os.path.join(out_dir, "%v", "seg_%04d.ts"),
+            "-master_pl_name", "master.m3u8", "-var_stream_map", " ".join(streams),
+            os.path.join(out_dir, "%v", "index.m3u8")]
+    return cmd
+
+
+def transcode_hls(src: str, kind: str, target_id: int) -> dict:
+    """Encode the HLS ladder of one upload. Returns the row's new column values."""
+    name = f"{kind}-{target_id}"
+    _build(HLS_DIR, name, ("master.m3u8",), lambda tmp: _run(hls_command(src, tmp, probe(src))))
+    return {"hls_url": f"/uploads/hls/{name}/master.m3u8"}
+
+
+def poster_command(src: str, out: str, info: dict) -> list:
+    width, height = _fit(info["width"], info["height"], POSTER_SIZE)
+    # Skip intros and fade-ins, then let the thumbnail filter pick the most typical frame
+    seek = min(info["duration"] * 0.1, 30.0)
+    return [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{seek:.2f}", "-i", src, "-an",
+            "-vf", f"scale={width}:{height},thumbnail={POSTER_SAMPLE_FRAMES}", "-frames:v", "1",
+            "-c:v", "libwebp", "-quality", "80", "-threads", str(FFMPEG_THREADS), "-update", "1", out]
+
+
+def sprite_layout(info: dict) -> dict:
+    """Where each seek-preview tile sits in the sprite sheet and which seconds it covers."""
+    interval = max(PREVIEW_MIN_INTERVAL, info["duration"] / PREVIEW_MAX_TILES)
+    count = max(1, min(PREVIEW_MAX_TILES, math.ceil(info["duration"] / interval)))
+    width, height = _fit(info["width"], info["height"], PREVIEW_TILE_SIZE)
+    columns = min(count, PREVIEW_COLUMNS)
+    return {"interval": interval, "count": count, "duration": info["duration"], "width": width,
+            "height": height, "columns": columns, "rows": math.ceil(count / columns)}
+
+
+def sprite_command(src: str, out: str, layout: dict) -> list:
+    # Decoding keyframes only is far cheaper and close enough for a preview
+    return [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-skip_frame", "nokey", "-i", src, "-an",
+            "-vf", (f"fps=1/{layout['interval']:.3f},scale={layout['width']}:{layout['height']},"
+                    f"tile={layout['columns']}x{layout['rows']}"),
+            "-frames:v", "1", "-c:v", "libwebp", "-quality", "60", "-threads", str(FFMPEG_THREADS),
+            "-update", "1", out]
+
+
+def _timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    return f"{hours:02d}:{minutes:02d}:{ms // 1000:02d}.{ms % 1000:03d}"
+
+
+def thumbnail_track(sprite: str, layout: dict) -> str:
+    """WebVTT cues mapping each stretch of the video to its tile in ``sprite``."""
+    lines = ["WEBVTT", ""]
+    for i in range(layout["count"]):
+        start = i * layout["interval"]
+        end = min(start + layout["interval"], layout["duration"])
+        x = (i % layout["columns"]) * layout["width"]
+        y = (i // layout["columns"]) * layout["height"]
+        lines += [f"{_timestamp(start)} --> {_timestamp(end)}",
+                  f"{sprite}#xywh={x},{y},{layout['width']},{layout['height']}", ""]
+    return "\n".join(lines)
+
+
+def extract_previews(src: str, kind: str, target_id: int) -> dict:
+    """Poster frame, seek-preview sprite sheet and its WebVTT track. Returns the row's new column values."""
+    name = f"{kind}-{target_id}"
+
+    def build(tmp):
+        info = probe(src)
+        _run(poster_command(src, os.path.join(tmp, "poster.webp"), info))
+        if info["duration"] >= PREVIEW_MIN_INTERVAL:
+            layout = sprite_layout(info)
+            _run(sprite_command(src, os.path.join(tmp, "sprite.webp"), layout))
+            with open(os.path.join(tmp, "thumbs.vtt"), "w") as f:
+                f.write(thumbnail_track("sprite.webp", layout))
+
+    final = _build(PREVIEW_DIR, name, ("poster.webp",), build)
+    url = f"/uploads/previews/{name}"
+    has_track = os.path.exists(os.path.join(final, "thumbs.vtt"))
+    return {"thumbnail": f"{url}/poster.webp", "preview_vtt": f"{url}/thumbs.vtt" if has_track else None}
+
+
+# stage -> (function run in a pool process, status column on Video and Short)
+STAGES = {
+    "hls": (transcode_hls, "hls_status"),
+    "preview": (extract_previews, "preview_status"),
+}
+# Columns a stage only fills in when they are empty: the uploader's own thumbnail wins
+KEEP_EXISTING = {"thumbnail"}
+
+
+def run_stage(stage: str, src: str, kind: str, target_id: int) -> dict:
+    """Pool entry point."""
+    fn, _ = STAGES[stage]
+    return fn(src, kind, target_id)
+
+
+# --- Queue ---
+def enqueue(kind: str, row):
+    """Queue every stage for a new, committed Video or Short."""
+    if source_path(row.filename) is None:
+        for _, column in STAGES.values():
+            setattr(row, column, "skipped")
+    else:
+        for stage in STAGES:
+            db.session.add(MediaJob(kind=kind, target_id=row.id, stage=stage))
+    db.session.commit()
+    worker.notify()
+
+
+def backfill(bind, stages=None) -> int:
+    """Queue each stage (default: all) for every Video and Short that has no job for it yet. Returns jobs added.
+
+    ``bind`` is a Connection (e.g. inside a migration) or a Session.
+    """
+    added = 0
+    for kind, model in MODELS.items():
+        for stage in stages or STAGES:
+            _, column = STAGES[stage]
+            queued = exists().where(and_(MediaJob.kind == kind, MediaJob.target_id == model.id,
+                                         MediaJob.stage == stage))
+            rows = bind.execute(select(model.id, model.filename).where(~queued).order_by(model.id)).all()
+            remote = [row_id for row_id, filename in rows if source_path(filename) is None]
+            local = [row_id for row_id, filename in rows if source_path(filename) is not None]
+            for i in range(0, len(remote), 1000):
+                bind.execute(update(model).where(model.id.in_(remote[i:i + 1000])).values({column: "skipped"}))
+            jobs = [{"kind": kind, "target_id": row_id, "stage": stage, "status": "pending", "attempts": 0,
+                     "created_at": datetime.utcnow()} for row_id in local]
+            for i in range(0, len(jobs), 1000):
+                bind.execute(insert(MediaJob), jobs[i:i + 1000])
+            added += len(jobs)
+    return added
+
+
+def claim(limit: int) -> list:
+    """Take up to ``limit`` due jobs (pending, or working under an expired lease). Returns their ids."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=MEDIA_LEASE_SECONDS)
+    retry = now - timedelta(seconds=MEDIA_RETRY_SECONDS)
+    due = (MediaJob.status == "pending") & (MediaJob.finished_at.is_(None) | (MediaJob.finished_at < retry))
+    candidates = db.session.execute(
+        select(MediaJob.id, MediaJob.status, MediaJob.claimed_at)
+        .where(due | ((MediaJob.status == "working") & (MediaJob.claimed_at < stale)))
+        .order_by(MediaJob.id)
+        .limit(limit)
+    ).all()
+    claimed = []
+    for job_id, status, claimed_at in candidates:
+        # Conditional update: only one worker wins each job
+        won = db.session.execute(
+            update(MediaJob)
+            .where(MediaJob.id == job_id, MediaJob.status == status, MediaJob.claimed_at == claimed_at)
+            .values(status="working", claimed_at=now, attempts=MediaJob.attempts + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if won:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def finish(job: MediaJob, result: dict | None = None, error: Exception | None = None, retry: bool = True):
+    """Record a job's outcome on the job and its Video/Short row."""
+    model = MODELS[job.kind]
+    _, column = STAGES[job.stage]
+    row = db.session.get(model, job.target_id)
+    if error is None:
+        job.status, job.last_error = "done", None
+        if row is not None:
+            for key, value in (result or {}).items():
+                if key not in KEEP_EXISTING or not getattr(row, key):
+                    setattr(row, key, value)
+            setattr(row, column, "ready")
+    elif not retry or (job.attempts or 0) >= MEDIA_MAX_ATTEMPTS:
+        job.status, job.last_error = "failed", str(error)[:1000]
+        if row is not None:
+            setattr(row, column, "failed")
+        print(f"[media] {job.stage} for {job.kind} #{job.target_id} failed for good: {error}")
+    else:
+        job.status, job.last_error = "pending", str(error)[:1000]
+        print(f"[media] {job.stage} for {job.kind} #{job.target_id} failed, will retry: {error}")
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+# --- Background thread ---
+class MediaWorker:
+    """Claims media jobs and runs them on a bounded process pool."""
+
+    def __init__(self, procs: int = MEDIA_PROCS):
+        self.procs = max(1, procs)
+        self._pool = None
+        self._running = {}  # future -> job id
+        self._idle_since = time.monotonic()
+        self._lock_file = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._at_exit = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _acquire_host_lock(self) -> bool:
+        if fcntl is None or self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+        f = open(LOCK_PATH, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _submit(self, job_ids: list):
+        for job in MediaJob.query.filter(MediaJob.id.in_(job_ids)).order_by(MediaJob.id).all():
+            row = db.session.get(MODELS[job.kind], job.target_id)
+            src = source_path(row.filename) if row is not None else None
+            if row is None:
+                finish(job)  # deleted since it was queued
+                continue
+            if src is None or not os.path.exists(src):
+                finish(job, error=MediaError(f"source file {row.filename} is missing"), retry=False)
+                continue
+            if job.attempts > MEDIA_MAX_ATTEMPTS:
+                # Reclaimed after its worker died on every attempt
+                finish(job, error=MediaError("worker died while processing"), retry=False)
+                continue
+            if self._pool is None:
+                # spawn, not fork: the web worker's threads and DB connections stay behind
+                self._pool = ProcessPoolExecutor(self.procs, mp_context=multiprocessing.get_context("spawn"))
+            future = self._pool.submit(run_stage, job.stage, src, job.kind, job.target_id)
+            future.add_done_callback(lambda _: self._wake.set())
+            self._running[future] = job.id
+
+    def _reap(self):
+        for future in [f for f in self._running if f.done()]:
+            job = db.session.get(MediaJob, self._running.pop(future))
+            if job is None:
+                continue
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # A pool process died (killed, out of memory); start a fresh pool next time
+                self._shutdown_pool()
+                finish(job, error=e)
+            except Exception as e:
+                finish(job, error=e)
+            else:
+                finish(job, result)
+
+    def _heartbeat(self):
+        if self._running:
+            db.session.execute(
+                update(MediaJob)
+                .where(MediaJob.id.in_(list(self._running.values())), MediaJob.status == "working")
+                .values(claimed_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def step(self):
+        """Collect finished jobs, refresh leases and fill free pool slots. Must run inside an app context."""
+        self._reap()
+        self._heartbeat()
+        free = self.procs - len(self._running)
+        if free > 0:
+            claimed = claim(free)
+            if claimed:
+                self._submit(claimed)
+        if self._running:
+            self._idle_since = time.monotonic()
+        elif self._pool is not None and time.monotonic() - self._idle_since > POOL_IDLE_SECONDS:
+            self._shutdown_pool()
+
+    def notify(self):
+        self._wake.set()
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            if self._acquire_host_lock():
+                try:
+                    with app.app_context():
+                        self.step()
+                        db.session.remove()
+                except Exception as e:
+                    print(f"[media] Worker error: {e}")
+            self._wake.wait(MEDIA_POLL_SECONDS)
+            self._wake.clear()
+        self._shutdown_pool()
+
+    def start(self, app):
+        if self.running:
+            return
+        if not available():
+            print(f"[media] {FFMPEG}/{FFPROBE} not found; uploads play from the original files")
+            return
+        if not os.path.exists(HLS_JS_PATH):
+            print(f"[media] {os.path.relpath(HLS_JS_PATH, BASE_DIR)} missing; browsers without native HLS "
+                  f"play the original files (python media_jobs.py --fetch-hls-js)")
+        if not self._at_exit:
+            atexit.register(self.stop)
+            self._at_exit = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,), name="media-jobs", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        # Jobs still encoding are handed out again once their lease runs out
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+worker = MediaWorker()
+
+
+def fetch_hls_js(path: str = HLS_JS_PATH) -> str:
+    """Download the HLS_JS_VERSION build of hls.js to ``path``. Returns its SHA-256.
+
+    Raises MediaError unless the build's digest is HLS_JS_SHA256.
+    """
+    with urlopen(f"{NPM_REGISTRY}/hls.js/{HLS_JS_VERSION}", timeout=30) as r:
+        dist = json.load(r)["dist"]
+    with urlopen(dist["tarball"], timeout=60) as r:
+        tarball = r.read()
+    algorithm, _, expected = dist["integrity"].partition("-")
+    if base64.b64encode(hashlib.new(algorithm, tarball).digest()).decode() != expected:
+        raise MediaError(f"hls.js {HLS_JS_VERSION} tarball does not match the registry's {algorithm} integrity")
+    with tarfile.open(fileobj=io.BytesIO(tarball)) as tar:
+        build = tar.extractfile("package/dist/hls.min.js").read()
+    # The registry's integrity only proves the download is intact, not that it is the build we pinned
+    if hashlib.sha256(build).hexdigest() != HLS_JS_SHA256:
+        raise MediaError(f"hls.js {HLS_JS_VERSION} build does not match HLS_JS_SHA256")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(build)
+    os.replace(path + ".tmp", path)
+    return hashlib.sha256(build).hexdigest()
+
+
+if __name__ == "__main__":
+    if "--fetch-hls-js" in sys.argv[1:]:
+        sha256 = fetch_hls_js()
+        print(f"[media] wrote {os.path.relpath(HLS_JS_PATH, BASE_DIR)} (sha256 {sha256})")
+        sys.exit(0)
+
+    from app import app
+
+    if "--backfill" in sys.argv[1:]:
+        with app.app_context():
+            added = backfill(db.session)
+            db.session.commit()
+            print(f"[media] queued {added} jobs")
+    elif not available():
+        sys.exit(f"[media] {FFMPEG}/{FFPROBE} not found")
+    else:
+        # Standalone worker process: python media_jobs.py
+        print(f"[media] Worker running ({worker.procs} processes, poll {MEDIA_POLL_SECONDS}s)")
+        try:
+            worker.run_forever(app)
+        except KeyboardInterrupt:
+            worker._shutdown_pool()
@@ -0,0 +1,429 @@
+"""
+Versioned schema migrations for CannaSpot.
+
+Every schema change is an ordered, numbered step. Applied steps are recorded
+in the ``schema_version`` table so each one runs exactly once per database.
+The check runs once when a worker boots (see ``wsgi.py``); the request path
+never touches the schema. Use ``python migrate_db.py`` to apply, dry-run or
+verify migrations by hand.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db
+
+SCHEMA_TABLE = "schema_version"
+
+# Ordered list of (version, name, fn). fn receives an open connection.
+MIGRATIONS = []
+
+
+def migration(version: int, name: str):
+    """Register a migration step. Versions must be unique and increasing."""
+    def wrap(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"migration {version} registered out of order")
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return wrap
+
+
+def head_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+# --- Helpers used by migration steps ---
+def _columns(conn, table: str) -> set:
+    insp = inspect(conn)
+    if not insp.has_table(table):
+        return set()
+    return {c["name"] for c in insp.get_columns(table)}
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    if not inspect(conn).has_table(table) or column in _columns(conn, table):
+        return False
+    quoted = conn.dialect.identifier_preparer.quote
+    conn.execute(text(f"ALTER TABLE {quoted(table)} ADD COLUMN {quoted(column)} {ddl}"))
+    return True
+
+
+def create_tables(conn, *models):
+    for model in models:
+        model.__table__.create(bind=conn, checkfirst=True)
+
+
+def create_index(conn, table: str, name: str, *columns: str, unique: bool = False):
+    """CREATE INDEX unless the table is missing or the index already exists.
+
+    Steps name their indexes here instead of reading them from models.py, so
+    an old step keeps creating what it created when it was written, not
+    indexes on columns a later step adds.
+    """
+    insp = inspect(conn)
+    if not insp.has_table(table) or name in {ix["name"] for ix in insp.get_indexes(table)}:
+        return False
+    quoted = conn.dialect.identifier_preparer.quote
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {quoted(name)} ON {quoted(table)} "
+                      f"({', '.join(quoted(c) for c in columns)})"))
+    return True
+
+
+def create_indexes(conn, *models):
+    """Create every index the current models declare that is not there yet.
+
+    For rebuilding indexes on an up-to-date schema (seed_data.py); migration
+    steps use create_index().
+    """
+    insp = inspect(conn)
+    for model in models:
+        table = model.__table__
+        if not insp.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=conn)
+
+
+# --- Migration steps ---
+@migration(1, "baseline tables")
+def _m001_baseline(conn):
+    # Replaces the old per-request db.create_all() safeguard
+    db.metadata.create_all(bind=conn, checkfirst=True)
+
+
+@migration(2, "legacy columns")
+def _m002_legacy_columns(conn):
+    # Formerly migrate_db.py, migrate_add_is_live.py and add_view_count.py
+    columns = [
+        ("user", "pw_hash", "VARCHAR(256)"),
+        ("user", "dname", "VARCHAR(120)"),
+        ("user", "admin", "BOOLEAN DEFAULT 0"),
+        ("user", "avatar", "VARCHAR(255)"),
+        ("user", "p_html", "TEXT"),
+        ("user", "status", "VARCHAR(20) DEFAULT 'online'"),
+        ("user", "seen", "DATETIME"),
+        ("user", "created", "DATETIME"),
+        ("user", "uname", "VARCHAR(80)"),
+        ("server", "created", "DATETIME"),
+        ("server", "owner", "INTEGER"),
+        ("server", "icon", "VARCHAR(255)"),
+        ("channel", "cat", "VARCHAR(100)"),
+        ("channel", "pos", "INTEGER DEFAULT 0"),
+        ("music_bot", "loop_mode", "VARCHAR(20) DEFAULT 'off'"),
+        ("music_bot", "is_shuffled", "BOOLEAN DEFAULT 0"),
+        ("video", "is_live", "BOOLEAN DEFAULT 0"),
+        ("video", "view_count", "INTEGER DEFAULT 0"),
+    ]
+    for table, column, ddl in columns:
+        if conn.dialect.name == "postgresql":
+            ddl = ddl.replace("DATETIME", "TIMESTAMP").replace("DEFAULT 0", "DEFAULT false")
+        add_column(conn, table, column, ddl)
+
+
+@migration(3, "custom_emoji image support")
+def _m003_custom_emoji(conn):
+    # Formerly update_emoji_db.py: emoji_char becomes optional, image_path added
+    insp = inspect(conn)
+    if not insp.has_table("custom_emoji"):
+        return
+    cols = {c["name"]: c for c in insp.get_columns("custom_emoji")}
+    add_column(conn, "custom_emoji", "image_path", "VARCHAR(255)")
+    if cols.get("emoji_char", {}).get("nullable", True):
+        return
+    if conn.dialect.name == "sqlite":
+        # SQLite can't ALTER COLUMN, so rebuild the table
+        conn.execute(text("""
+            CREATE TABLE custom_emoji_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category VARCHAR(50) NOT NULL DEFAULT 'custom',
+                emoji_char VARCHAR(10),
+                image_path VARCHAR(255),
+                label VARCHAR(100),
+                sort_order INTEGER DEFAULT 0,
+                is_active BOOLEAN DEFAULT 1,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO custom_emoji_new (id, category, emoji_char, image_path, label, sort_order, is_active, created_at)
+            SELECT id, category, emoji_char, image_path, label, sort_order, is_active, created_at
+            FROM custom_emoji
+        """))
+        conn.execute(text("DROP TABLE custom_emoji"))
+        conn.execute(text("ALTER TABLE custom_emoji_new RENAME TO custom_emoji"))
+    elif conn.dialect.name == "mysql":
+        conn.execute(text("ALTER TABLE custom_emoji MODIFY emoji_char VARCHAR(10) NULL"))
+    else:
+        conn.execute(text("ALTER TABLE custom_emoji ALTER COLUMN emoji_char DROP NOT NULL"))
+
+
+@migration(4, "hot path indexes")
+def _m004_hot_path_indexes(conn):
+    # Composite indexes matching the route query shapes (see check_indexes.py)
+    indexes = [
+        ("channel", "ix_channel_server_pos", "server", "pos"),
+        ("membership", "ix_membership_server_user", "server", "user"),
+        ("membership", "ix_membership_user", "user"),
+        ("role", "ix_role_server", "server_id"),
+        ("role_membership", "ix_role_membership_user", "user_id"),
+        ("role_membership", "ix_role_membership_role", "role_id"),
+        ("video", "ix_video_created", "created_at"),
+        ("video", "ix_video_uploader_created", "uploader_id", "created_at"),
+        ("video", "ix_video_live_created", "is_live", "created_at"),
+        ("message", "ix_message_channel_created", "channel_id", "created_at"),
+        ("message", "ix_message_user", "user_id"),
+        ("message", "ix_message_created", "created_at"),
+        ("playlist", "ix_playlist_user", "user_id"),
+        ("playlist_video", "ix_playlist_video_playlist_pos", "playlist_id", "position"),
+        ("playlist_video", "ix_playlist_video_video", "video_id"),
+        ("subscription", "ix_subscription_subscriber_target", "subscriber_id", "subscribed_to_id"),
+        ("subscription", "ix_subscription_target", "subscribed_to_id"),
+        ("video_like", "ix_video_like_video_user", "video_id", "user_id"),
+        ("video_like", "ix_video_like_user_created", "user_id", "created_at"),
+        ("watch_later", "ix_watch_later_user_added", "user_id", "added_at"),
+        ("watch_later", "ix_watch_later_video", "video_id"),
+        ("short", "ix_short_created", "created_at"),
+        ("notification", "ix_notification_user_read", "user_id", "is_read"),
+        ("notification", "ix_notification_user_created", "user_id", "created_at"),
+        ("voice_participant", "ix_voice_participant_channel", "channel_id"),
+        ("voice_participant", "ix_voice_participant_user", "user_id"),
+        ("friendship", "ix_friendship_user_status", "user_id", "status"),
+        ("friendship", "ix_friendship_friend_status", "friend_id", "status"),
+        ("direct_message", "ix_direct_message_thread", "sender_id", "recipient_id", "created_at"),
+        ("direct_message", "ix_direct_message_unread", "recipient_id", "is_read", "sender_id"),
+        ("video_comment", "ix_video_comment_video_created", "video_id", "created_at"),
+        ("advertisement", "ix_advertisement_active_placement", "is_active", "placement"),
+        ("music_bot", "ix_music_bot_channel", "channel_id"),
+        ("music_queue", "ix_music_queue_channel_played_pos", "channel_id", "is_played", "position"),
+        ("post", "ix_post_created", "created_at"),
+    ]
+    for table, name, *columns in indexes:
+        create_index(conn, table, name, *columns)
+
+
+@migration(5, "email outbox")
+def _m005_email_outbox(conn):
+    from models import EmailOutbox
+    create_tables(conn, EmailOutbox)
+
+
+@migration(6, "denormalized like/comment/subscriber counters")
+def _m006_counters(conn):
+    add_column(conn, "video", "like_count", "INTEGER DEFAULT 0")
+    add_column(conn, "video", "comment_count", "INTEGER DEFAULT 0")
+    add_column(conn, "user", "subscriber_count", "INTEGER DEFAULT 0")
+    # Backfill from the source tables
+    import counters
+    counters.reconcile(conn)
+
+
+@migration(7, "push event log")
+def _m007_event_log(conn):
+    from models import EventLog
+    create_tables(conn, EventLog)
+
+
+@migration(8, "subscription timelines")
+def _m008_timeline(conn):
+    from models import TimelineEntry
+    add_column(conn, "user", "fanout_on_read", "BOOLEAN DEFAULT FALSE")
+    add_column(conn, "video", "fanout", "VARCHAR(8) DEFAULT 'pending'")
+    create_tables(conn, TimelineEntry)
+    create_index(conn, "video", "ix_video_fanout", "fanout")
+    # Fan out every existing video once, as timeline.rebuild() did at this version
+    from timeline import TIMELINE_FANOUT_LIMIT
+    user = conn.dialect.identifier_preparer.quote("user")
+    popular = f"SELECT id FROM {user} WHERE subscriber_count >= :limit"
+    conn.execute(text(f"UPDATE {user} SET fanout_on_read = FALSE"))
+    conn.execute(text(f"UPDATE {user} SET fanout_on_read = TRUE WHERE id IN ({popular})"),
+                 {"limit": TIMELINE_FANOUT_LIMIT})
+    conn.execute(text("UPDATE video SET fanout = 'push'"))
+    conn.execute(text(f"UPDATE video SET fanout = 'pull' WHERE uploader_id IN ({popular})"),
+                 {"limit": TIMELINE_FANOUT_LIMIT})
+    conn.execute(text("DELETE FROM timeline_entry"))
+    conn.execute(text("""
+        INSERT INTO timeline_entry (user_id, video_id, uploader_id, created_at)
+        SELECT DISTINCT s.subscriber_id, v.id, v.uploader_id, v.created_at
+        FROM subscription s JOIN video v ON v.uploader_id = s.subscribed_to_id
+        WHERE v.fanout = 'push' AND v.created_at IS NOT NULL AND s.subscriber_id IS NOT NULL
+    """))
+
+
+
+@migration(9, "trending scores")
+def _m009_trending(conn):
+    from models import TrendingScore, TrendingEpoch
+    create_tables(conn, TrendingScore, TrendingEpoch)
+    import trending
+    trending.rebuild(conn)
+
+
+@migration(10, "related videos")
+def _m010_related(conn):
+    from models import RelatedVideo
+    # Every existing video starts stale, so related.py's RelatedWorker fills the table
+    add_column(conn, "video", "related_stale", "BOOLEAN DEFAULT TRUE")
+    create_tables(conn, RelatedVideo)
+    create_index(conn, "video", "ix_video_related_stale", "related_stale")
+
+
+@migration(11, "resumable upload sessions")
+def _m011_upload_sessions(conn):
+    from models import UploadSession
+    create_tables(conn, UploadSession)
+
+
+def _queue_media_stage(conn, stage: str, column: str):
+    """Queue ``stage`` for every Video and Short without a job for it; non-local files are skipped."""
+    for kind, table in (("video", "video"), ("short", "short")):
+        params = {"kind": kind, "stage": stage}
+        unqueued = ("NOT EXISTS (SELECT 1 FROM media_job j "
+                    f"WHERE j.kind = :kind AND j.target_id = {table}.id AND j.stage = :stage)")
+        # media_jobs.source_path(): only files under /uploads/ are processed (not YouTube embeds)
+        conn.execute(text(f"UPDATE {table} SET {column} = 'skipped' "
+                          f"WHERE (filename IS NULL OR filename NOT LIKE '/uploads/%') AND {unqueued}"), params)
+        conn.execute(text(f"""
+            INSERT INTO media_job (kind, target_id, stage, status, attempts, created_at)
+            SELECT :kind, id, :stage, 'pending', 0, :now FROM {table}
+            WHERE filename LIKE '/uploads/%' AND {unqueued}
+            ORDER BY id
+        """), {**params, "now": datetime.utcnow()})
+
+
+@migration(12, "hls transcoding jobs")
+def _m012_media_jobs(conn):
+    from models import MediaJob
+    for table in ("video", "short"):
+        add_column(conn, table, "hls_status", "VARCHAR(12) DEFAULT 'pending'")
+        add_column(conn, table, "hls_url", "VARCHAR(255)")
+    create_tables(conn, MediaJob)
+    # Queue every existing upload once
+    _queue_media_stage(conn, "hls", "hls_status")
+
+
+@migration(13, "poster frames and seek previews")
+def _m013_previews(conn):
+    for table in ("video", "short"):
+        add_column(conn, table, "preview_status", "VARCHAR(12) DEFAULT 'pending'")
+        add_column(conn, table, "preview_vtt", "VARCHAR(255)")
+    _queue_media_stage(conn, "preview", "preview_status")
+
+
+@migration(14, "content-addressed upload blobs")
+def _m014_blobs(conn):
+    from models import Blob
+    create_tables(conn, Blob)
+
+
+@migration(15, "title token index for related videos")
+def _m015_title_tokens(conn):
+    from models import VideoTitleToken
+    create_tables(conn, VideoTitleToken)
+    import related
+    related.index_titles(conn)
+
+# --- Engine ---
+def _ensure_version_table(conn):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(200) NOT NULL, "
+        "applied_at VARCHAR(32) NOT NULL)"
+    ))
+
+
+def applied_versions(engine) -> set:
+    if not inspect(engine).has_table(SCHEMA_TABLE):
+        return set()
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(f"SELECT version FROM {SCHEMA_TABLE}"))}
+
+
+def current_version(engine) -> int:
+    versions = applied_versions(engine)
+    return max(versions) if versions else 0
+
+
+def pending(engine) -> list:
+    done = applied_versions(engine)
+    return [(v, name, fn) for v, name, fn in MIGRATIONS if v not in done]
+
+
+def _record(conn, version: int, name: str):
+    conn.execute(
+        text(f"INSERT INTO {SCHEMA_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)"),
+        {"v": version, "n": name, "t": datetime.utcnow().isoformat()},
+    )
+
+
+def upgrade(engine, dry_run: bool = False, log=print) -> list:
+    """Apply every pending step in order. Each step commits on its own."""
+    todo = pending(engine)
+    for version, name, fn in todo:
+        if dry_run:
+            log(f"[migrate] would apply {version:03d} {name}")
+            continue
+        with engine.begin() as conn:
+            _ensure_version_table(conn)
+            # Another worker may have applied it while we were waiting
+            already = conn.execute(
+                text(f"SELECT 1 FROM {SCHEMA_TABLE} WHERE version = :v"), {"v": version}
+            ).first()
+            if already:
+                continue
+            fn(conn)
+            _record(conn, version, name)
+        log(f"[migrate] applied {version:03d} {name}")
+    return todo
+
+
+def stamp(engine, version: int | None = None):
+    """Mark steps up to ``version`` (default: head) as applied without running them.
+
+    Used right after a fresh ``db.create_all()`` such as the install flow.
+    """
+    version = head_version() if version is None else version
+    done = applied_versions(engine)
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        for v, name, _ in MIGRATIONS:
+            if v <= version and v not in done:
+                _record(conn, v, name)
+
+
+def verify(engine) -> list:
+    """Compare the live database with models.py. Returns a list of problems."""
+    problems = []
+    insp = inspect(engine)
+    current = current_version(engine)
+    if current < head_version():
+        problems.append(f"schema at version {current}, head is {head_version()}")
+    for table in db.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            problems.append(f"missing table {table.name}")
+            continue
+        live_cols = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name not in live_cols:
+                problems.append(f"missing column {table.name}.{col.name}")
+        live_ix = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in live_ix:
+                problems.append(f"missing index {index.name} on {table.name}")
+    return problems
+
+
+def ensure_schema(app):
+    """One-time schema check at worker boot. Never raises."""
+    try:
+        with app.app_context():
+            applied = upgrade(db.engine)
+            if not applied:
+                print(f"✅ Database schema up to date (version {head_version()})")
+    except Exception as e:
+        print(f"⚠️ Database migration warning (app will still run): {e}")
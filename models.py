@@ -26,6 +26,8 @@ class User(db.Model):
     status = db.Column(db.String(20), default="online")  # online, offline, too_stoned
     seen = db.Column(db.DateTime, default=datetime.utcnow)
     created = db.Column(db.DateTime, default=datetime.utcnow)
+    subscriber_count = db.Column(db.Integer, default=0)  # maintained by counters.py
+    fanout_on_read = db.Column(db.Boolean, default=False)  # some uploads skipped timeline fan-out, see timeline.py
 
 
 class Server(db.Model):
@@ -46,12 +48,21 @@ class Channel(db.Model):
     pos = db.Column(db.Integer, default=0)  # Display order
     created = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_channel_server_pos", "server", "pos"),
+    )
+
 
 class Membership(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user = db.Column(db.Integer, db.ForeignKey("user.id"))
     server = db.Column(db.Integer, db.ForeignKey("server.id"))
 
+    __table_args__ = (
+        db.Index("ix_membership_server_user", "server", "user"),
+        db.Index("ix_membership_user", "user"),
+    )
+
 
 class Role(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,6 +81,10 @@ class Role(db.Model):
     can_mention_everyone = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_role_server", "server_id"),
+    )
+
 
 class RoleMembership(db.Model):
     """Links users to roles within a server"""
@@ -78,6 +93,11 @@ class RoleMembership(db.Model):
     role_id = db.Column(db.Integer, db.ForeignKey("role.id"), nullable=False)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_role_membership_user", "user_id"),
+        db.Index("ix_role_membership_role", "role_id"),
+    )
+
 
 class Video(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -87,8 +107,24 @@ class Video(db.Model):
     description = db.Column(db.Text)
     uploader_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     view_count = db.Column(db.Integer, default=0)
+    like_count = db.Column(db.Integer, default=0)  # maintained by counters.py
+    comment_count = db.Column(db.Integer, default=0)  # maintained by counters.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_live = db.Column(db.Boolean, default=False)  # True if this video is a live stream
+    fanout = db.Column(db.String(8), default="pending")  # pending, push, pull - see timeline.py
+    related_stale = db.Column(db.Boolean, default=True)  # RelatedVideo rows need recomputing - see related.py
+    hls_status = db.Column(db.String(12), default="pending")  # pending, ready, failed, skipped - see media_jobs.py
+    hls_url = db.Column(db.String(255))  # master playlist once hls_status is ready
+    preview_status = db.Column(db.String(12), default="pending")  # poster + seek previews, see media_jobs.py
+    preview_vtt = db.Column(db.String(255))  # WebVTT track of sprite-sheet tiles
+
+    __table_args__ = (
+        db.Index("ix_video_created", "created_at"),  # home feed, music, downloads
+        db.Index("ix_video_uploader_created", "uploader_id", "created_at"),  # my videos, subscriptions
+        db.Index("ix_video_live_created", "is_live", "created_at"),  # live banner
+        db.Index("ix_video_fanout", "fanout"),  # timeline fan-out queue
+        db.Index("ix_video_related_stale", "related_stale"),  # related-videos queue
+    )
 
 
 class Message(db.Model):
@@ -99,6 +135,12 @@ class Message(db.Model):
     content = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_message_channel_created", "channel_id", "created_at"),  # channel history
+        db.Index("ix_message_user", "user_id"),
+        db.Index("ix_message_created", "created_at"),  # admin moderation feed
+    )
+
 
 class Sponsor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -121,6 +163,10 @@ class Playlist(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_playlist_user", "user_id"),
+    )
+
 
 class PlaylistVideo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -129,6 +175,11 @@ class PlaylistVideo(db.Model):
     position = db.Column(db.Integer)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_playlist_video_playlist_pos", "playlist_id", "position"),
+        db.Index("ix_playlist_video_video", "video_id"),
+    )
+
 
 class Subscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -136,6 +187,65 @@ class Subscription(db.Model):
     subscribed_to_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_subscription_subscriber_target", "subscriber_id", "subscribed_to_id"),
+        db.Index("ix_subscription_target", "subscribed_to_id"),
+    )
+
+
+class TimelineEntry(db.Model):
+    """A subscribed uploader's video in one user's subscriptions feed, written by timeline.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=False)
+    uploader_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # copy of Video.created_at, the sort key
+
+    __table_args__ = (
+        db.Index("ix_timeline_user_created", "user_id", "created_at", "video_id"),  # subscriptions page
+        db.Index("uq_timeline_user_video", "user_id", "video_id", unique=True),
+        db.Index("ix_timeline_video", "video_id"),
+    )
+
+
+class TrendingScore(db.Model):
+    """Time-decayed engagement score of one video, maintained by trending.py"""
+    video_id = db.Column(db.Integer, db.ForeignKey("video.id"), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0)  # scaled to TrendingEpoch.epoch
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_trending_score", "score", "video_id"),  # /trending, home feed
+    )
+
+
+class TrendingEpoch(db.Model):
+    """Single row: the reference time TrendingScore values are scaled to"""
+    id = db.Column(db.Integer, primary_key=True)
+    epoch = db.Column(db.Float, nullable=False)  # unix seconds
+
+
+class RelatedVideo(db.Model):
+    """One of a video's top related videos, written by related.py"""
+    video_id = db.Column(db.Integer, db.ForeignKey("video.id"), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)  # 0 = most related
+    related_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_related_video_related", "related_id"),  # cleanup when a video is deleted
+    )
+
+
+class VideoTitleToken(db.Model):
+    """A word of a video's title, for the title signal of related.py"""
+    token = db.Column(db.String(40), primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey("video.id"), primary_key=True)
+
+    __table_args__ = (
+        db.Index("ix_video_title_token_video", "video_id"),  # re-indexing one title
+    )
+
 
 class VideoLike(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -143,6 +253,11 @@ class VideoLike(db.Model):
     video_id = db.Column(db.Integer, db.ForeignKey("video.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_video_like_video_user", "video_id", "user_id"),  # like counts, already-liked check
+        db.Index("ix_video_like_user_created", "user_id", "created_at"),  # liked page
+    )
+
 
 class WatchLater(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -150,6 +265,11 @@ class WatchLater(db.Model):
     video_id = db.Column(db.Integer, db.ForeignKey("video.id"))
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_watch_later_user_added", "user_id", "added_at"),
+        db.Index("ix_watch_later_video", "video_id"),
+    )
+
 
 class Short(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -158,6 +278,14 @@ class Short(db.Model):
     thumbnail = db.Column(db.String(255))
     uploader_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    hls_status = db.Column(db.String(12), default="pending")  # pending, ready, failed, skipped - see media_jobs.py
+    hls_url = db.Column(db.String(255))
+    preview_status = db.Column(db.String(12), default="pending")
+    preview_vtt = db.Column(db.String(255))
+
+    __table_args__ = (
+        db.Index("ix_short_created", "created_at"),
+    )
 
 
 class Notification(db.Model):
@@ -168,6 +296,11 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_notification_user_read", "user_id", "is_read"),  # unread badge poll
+        db.Index("ix_notification_user_created", "user_id", "created_at"),
+    )
+
 
 class VoiceParticipant(db.Model):
     """Tracks users currently in voice channels"""
@@ -177,6 +310,11 @@ class VoiceParticipant(db.Model):
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_muted = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        db.Index("ix_voice_participant_channel", "channel_id"),
+        db.Index("ix_voice_participant_user", "user_id"),
+    )
+
 
 class Friendship(db.Model):
     """Tracks friend relationships between users"""
@@ -187,6 +325,11 @@ class Friendship(db.Model):
     requested_at = db.Column(db.DateTime, default=datetime.utcnow)
     accepted_at = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index("ix_friendship_user_status", "user_id", "status"),
+        db.Index("ix_friendship_friend_status", "friend_id", "status"),
+    )
+
 
 class DirectMessage(db.Model):
     """Direct messages between friends"""
@@ -197,6 +340,11 @@ class DirectMessage(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_direct_message_thread", "sender_id", "recipient_id", "created_at"),  # conversation view
+        db.Index("ix_direct_message_unread", "recipient_id", "is_read", "sender_id"),  # unread counts
+    )
+
 
 class RtcSignal(db.Model):
     """Lightweight signaling messages for WebRTC using HTTP polling.
@@ -228,6 +376,10 @@ class VideoComment(db.Model):
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
+    __table_args__ = (
+        db.Index("ix_video_comment_video_created", "video_id", "created_at"),
+    )
+
 
 class CustomEmoji(db.Model):
     """Custom emojis managed by admins"""
@@ -256,6 +408,10 @@ class Advertisement(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_advertisement_active_placement", "is_active", "placement"),
+    )
+
 
 class MusicBot(db.Model):
     """Music bot for voice channels"""
@@ -271,6 +427,10 @@ class MusicBot(db.Model):
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_activity = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_music_bot_channel", "channel_id"),
+    )
+
 
 class MusicQueue(db.Model):
     """Queue of songs for music bot"""
@@ -283,6 +443,10 @@ class MusicQueue(db.Model):
     is_played = db.Column(db.Boolean, default=False)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_music_queue_channel_played_pos", "channel_id", "is_played", "position"),
+    )
+
 
 def hash_pw(pw: str) -> str:
     import hashlib
@@ -305,6 +469,87 @@ class EmailVerification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class EmailOutbox(db.Model):
+    """Outgoing emails, queued by send_email() and delivered by email_outbox.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    to_addr = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    text_body = db.Column(db.Text, nullable=False)
+    html_body = db.Column(db.Text)
+    status = db.Column(db.String(20), default="pending")  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_due", "status", "next_attempt_at"),
+    )
+
+
+class EventLog(db.Model):
+    """Push events for /api/events; every worker's bridge in events.py tails this table"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class UploadSession(db.Model):
+    """A resumable video/short upload in progress; resumable.py appends chunks to its staging file"""
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    kind = db.Column(db.String(8), nullable=False)  # video or short
+    filename = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    thumbnail = db.Column(db.String(255))  # staged thumbnail file name
+    length = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # bytes stored so far = next offset
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("uq_upload_session_token", "token", unique=True),
+        db.Index("ix_upload_session_expires", "expires_at"),  # pruning abandoned uploads
+    )
+
+
+class MediaJob(db.Model):
+    """Background processing of an uploaded Video or Short, run by media_jobs.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(8), nullable=False)  # video or short
+    target_id = db.Column(db.Integer, nullable=False)  # Video.id or Short.id
+    stage = db.Column(db.String(16), nullable=False)  # hls, preview
+    status = db.Column(db.String(12), default="pending")  # pending, working, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    claimed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("uq_media_job_target", "kind", "target_id", "stage", unique=True),
+        db.Index("ix_media_job_status", "status", "id"),  # claim queue
+    )
+
+
+class Blob(db.Model):
+    """An uploaded file stored once per content under uploads/blobs/, see blobs.py"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    ext = db.Column(db.String(16), nullable=False, default="")  # of the first upload with this content
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)  # columns pointing at it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime)  # last time a reference was dropped
+
+    __table_args__ = (
+        db.Index("ix_blob_refcount_released", "refcount", "released_at"),  # garbage collection
+    )
+
+
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -313,3 +558,7 @@ class Post(db.Model):
     content_html = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_post_created", "created_at"),
+    )
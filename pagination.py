@@ -0,0 +1,96 @@
+"""
+Keyset pagination for the video listings.
+
+Pages are ordered by a (timestamp, id) pair, newest first. The continuation
+token is the pair from the last row of the previous page, signed so clients
+can't forge positions; the next page is
+
+    WHERE ts <= :ts AND (ts < :ts OR id < :id) ORDER BY ts DESC, id DESC LIMIT n
+
+which starts on the (ts) index right where the previous page stopped, so
+page 500 costs the same as page one. OFFSET would scan and discard every
+earlier row.
+
+One extra row is fetched to tell whether another page exists.
+"""
+
+import os
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import and_, or_
+
+PAGE_LIMIT = int(os.environ.get("PAGE_LIMIT", "24"))
+PAGE_LIMIT_MAX = int(os.environ.get("PAGE_LIMIT_MAX", "60"))
+
+
+class Page:
+    """One page of items plus the token for the next page (None on the last page)."""
+
+    __slots__ = ("items", "next_cursor")
+
+    def __init__(self, items: list, next_cursor: str | None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+
+def clamp_limit(raw, default: int = PAGE_LIMIT) -> int:
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, PAGE_LIMIT_MAX))
+
+
+def _serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.secret_key, salt="page-cursor")
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    return _serializer().dumps([ts.isoformat(), row_id])
+
+
+def decode_cursor(token: str):
+    """(timestamp, id) from a token, or None if it is missing or not one of ours."""
+    if not token:
+        return None
+    try:
+        ts, row_id = _serializer().loads(token)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (BadSignature, ValueError, TypeError):
+        return None
+
+
+def keyset_page(query, ts_col, id_col, cursor: str | None = None, limit: int = PAGE_LIMIT) -> Page:
+    """Newest-first page of ``query`` (an ORM query returning one entity per row).
+
+    ``ts_col``/``id_col`` are the ordering pair; they may belong to a joined
+    table, e.g. VideoLike.created_at/VideoLike.id for the liked page.
+    """
+    # NULLs sort first on Postgres and last elsewhere, so rows without a timestamp are left out
+    query = query.filter(ts_col.isnot(None))
+    position = decode_cursor(cursor)
+    if position is not None:
+        ts, row_id = position
+        query = query.filter(ts_col <= ts, or_(ts_col < ts, and_(ts_col == ts, id_col < row_id)))
+    rows = (query.add_columns(ts_col, id_col)
+            .order_by(ts_col.desc(), id_col.desc())
+            .limit(limit + 1)
+            .all())
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = [row[0] for row in rows]
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][2]) if more else None
+    return Page(items, next_cursor)
+
+
+def merge_pages(pages, key, limit: int = PAGE_LIMIT) -> Page:
+    """Combine pages fetched with the same cursor from sources sharing one ordering.
+
+    ``key(item)`` returns the item's (timestamp, id) pair.
+    """
+    items = sorted((item for page in pages for item in page.items), key=key, reverse=True)
+    more = len(items) > limit or any(page.next_cursor for page in pages)
+    items = items[:limit]
+    return Page(items, encode_cursor(*key(items[-1])) if more and items else None)
@@ -0,0 +1,154 @@
+"""
+Per-route query and latency instrumentation.
+
+Hooks Flask request start/end and SQLAlchemy cursor execution, and keeps per
+endpoint aggregates: request count, p50/p95/p99 latency, SQL statement count,
+SQL time and rows returned. Samples go into fixed-size deques (append is
+atomic under the GIL, so the hot path takes no lock); percentiles are only
+computed when the admin Profiling tab is viewed.
+
+Send ``X-Profile-Queries: 1`` on a request while logged in as an admin to
+capture that request's full query list. The response carries an
+``X-Profile-Id`` header; the dump is at ``/theGspot/profile/<id>``.
+
+Set PROFILING=off to disable.
+"""
+
+import itertools
+import os
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILING = os.environ.get("PROFILING", "on").lower() not in ("0", "off", "false", "no")
+PROFILE_WINDOW = int(os.environ.get("PROFILE_WINDOW", "500"))
+PROFILE_HEADER = "X-Profile-Queries"
+
+
+class EndpointStats:
+    """Counters plus a ring buffer of (latency, sql_count, sql_time, rows) samples."""
+
+    __slots__ = ("counter", "requests", "samples")
+
+    def __init__(self, window: int):
+        self.counter = itertools.count(1)
+        self.requests = 0
+        self.samples = deque(maxlen=window)
+
+
+class RouteProfiler:
+    def __init__(self, window: int = PROFILE_WINDOW):
+        self.window = window
+        self.endpoints = {}
+        self.dumps = deque(maxlen=50)  # (id, endpoint, path, queries)
+        self._dump_ids = itertools.count(1)
+
+    # --- Collection ---
+    def _stats(self, endpoint: str) -> EndpointStats:
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            # setdefault keeps the first writer's object if two threads race here
+            stats = self.endpoints.setdefault(endpoint, EndpointStats(self.window))
+        return stats
+
+    def start_request(self):
+        g._prof_start = time.perf_counter()
+        g._prof_sql_count = 0
+        g._prof_sql_time = 0.0
+        g._prof_rows = 0
+        g._prof_queries = [] if request.headers.get(PROFILE_HEADER) == "1" else None
+
+    def finish_request(self, response, is_admin=None):
+        start = g.get("_prof_start")
+        if start is None:
+            return response
+        latency = time.perf_counter() - start
+        endpoint = request.endpoint or "<unmatched>"
+        stats = self._stats(endpoint)
+        stats.requests = next(stats.counter)
+        stats.samples.append((latency, g._prof_sql_count, g._prof_sql_time, g._prof_rows))
+        queries = g.get("_prof_queries")
+        if queries is not None and is_admin and is_admin():
+            dump_id = next(self._dump_ids)
+            self.dumps.append((dump_id, endpoint, request.full_path, queries))
+            response.headers["X-Profile-Id"] = str(dump_id)
+            response.headers["X-Profile-SQL"] = f"{g._prof_sql_count} queries, {g._prof_sql_time * 1000:.1f} ms"
+        return response
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "_prof_start" in g:
+            conn.info.setdefault("_prof_t0", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not (has_request_context() and "_prof_start" in g):
+            return
+        stack = conn.info.get("_prof_t0")
+        elapsed = time.perf_counter() - stack.pop() if stack else 0.0
+        g._prof_sql_count += 1
+        g._prof_sql_time += elapsed
+        if cursor.rowcount and cursor.rowcount > 0:
+            g._prof_rows += cursor.rowcount
+        if g._prof_queries is not None:
+            g._prof_queries.append({"sql": statement, "params": repr(parameters)[:500], "ms": round(elapsed * 1000, 3)})
+
+    def count_loaded_row(self, target, context):
+        # SELECT rowcount is -1 on most drivers; count ORM rows as they load instead
+        if has_request_context() and "_prof_start" in g:
+            g._prof_rows += 1
+
+    # --- Reporting ---
+    def report(self) -> list:
+        """Per-endpoint aggregates, most total time first."""
+        rows = []
+        for endpoint, stats in list(self.endpoints.items()):
+            samples = list(stats.samples)
+            if not samples:
+                continue
+            latencies = sorted(s[0] for s in samples)
+            n = len(samples)
+
+            def pct(p):
+                return latencies[min(n - 1, int(p * n))] * 1000
+
+            sql_counts = [s[1] for s in samples]
+            requests = stats.requests
+            rows.append({
+                "endpoint": endpoint,
+                "requests": requests,
+                "p50_ms": round(pct(0.50), 2),
+                "p95_ms": round(pct(0.95), 2),
+                "p99_ms": round(pct(0.99), 2),
+                "avg_sql": round(sum(sql_counts) / n, 1),
+                "max_sql": max(sql_counts),
+                "avg_sql_ms": round(sum(s[2] for s in samples) / n * 1000, 2),
+                "avg_rows": round(sum(s[3] for s in samples) / n, 1),
+                "total_ms": round(sum(latencies) / n * requests * 1000, 1),
+            })
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows
+
+    def dump(self, dump_id: int):
+        for entry in list(self.dumps):
+            if entry[0] == dump_id:
+                return {"id": entry[0], "endpoint": entry[1], "path": entry[2], "queries": entry[3]}
+        return None
+
+    def reset(self):
+        self.endpoints.clear()
+        self.dumps.clear()
+
+    # --- Wiring ---
+    def init_app(self, app, model_base, is_admin=None):
+        if not PROFILING:
+            return
+        app.before_request(self.start_request)
+        app.after_request(lambda response: self.finish_request(response, is_admin))
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(model_base, "load", self.count_loaded_row, propagate=True)
+
+
+profiler = RouteProfiler()
@@ -0,0 +1,272 @@
+"""
+Related videos for the watch page.
+
+Two videos are related when the same baskets hold both: one user's likes,
+one playlist, one user's watch-later list, or the titles sharing a word
+(VideoTitleToken, one row per word of a title).
+Per signal that is the sparse product Xᵀ·X of the basket × video incidence
+matrix, normalised to cosine similarity
+
+    sim(a, b) = shared(a, b) / sqrt(baskets(a) * baskets(b))
+
+and a pair's score is the weighted sum over SIGNALS. The best RELATED_K
+per video are stored in RelatedVideo keyed by (video_id, rank), so watch()
+reads them with one primary-key range scan.
+
+- ``rebuild()`` computes the whole table (seed_data.py, ``python
+  related.py --rebuild`` from cron); baskets holding more than
+  RELATED_MAX_BASKET videos are skipped, since they relate everything to
+  everything and cost quadratically many pairs
+- likes, playlist adds, watch-later adds and title edits mark the video
+  ``related_stale``, as is every new upload and, after migration 10, every
+  existing video; the ``RelatedWorker`` thread recomputes stale videos one
+  at a time from indexed queries, re-indexing the video's own title first.
+  Title words are looked up by token, and a word shared by more than
+  RELATED_MAX_BASKET videos is dropped from its count alone, so a refresh
+  never reads beyond its neighbourhood
+- recomputing a video rewrites its own list only; the other side of each
+  pair catches up on its own next change or the next rebuild
+"""
+
+import heapq
+import math
+import os
+import re
+import sys
+import threading
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, select, update
+
+from models import db, Video, VideoLike, PlaylistVideo, WatchLater, RelatedVideo, VideoTitleToken
+
+RELATED_K = int(os.environ.get("RELATED_K", "12"))
+RELATED_MAX_BASKET = int(os.environ.get("RELATED_MAX_BASKET", "200"))
+RELATED_BATCH_SIZE = int(os.environ.get("RELATED_BATCH_SIZE", "20"))
+RELATED_POLL_SECONDS = float(os.environ.get("RELATED_POLL_SECONDS", "30"))
+
+# (weight, basket column, video column); titles are the "title" signal below
+SIGNALS = [
+    (1.0, VideoLike.user_id, VideoLike.video_id),
+    (2.0, PlaylistVideo.playlist_id, PlaylistVideo.video_id),
+    (0.5, WatchLater.user_id, WatchLater.video_id),
+]
+TITLE_WEIGHT = 1.0
+
+
+def title_tokens(title: str | None) -> set:
+    return {t[:40] for t in re.findall(r"[a-z0-9]+", (title or "").lower()) if len(t) >= 3}
+
+
+def _all_title_tokens(bind) -> list:
+    return [(token, video_id) for video_id, title in bind.execute(select(Video.id, Video.title))
+            for token in title_tokens(title)]
+
+
+def index_titles(bind, pairs=None) -> int:
+    """Rewrite VideoTitleToken from every title (or the given (token, video) pairs). Returns rows written.
+
+    ``bind`` is a Connection (e.g. inside a migration) or a Session.
+    """
+    pairs = _all_title_tokens(bind) if pairs is None else pairs
+    bind.execute(delete(VideoTitleToken))
+    rows = [{"token": token, "video_id": video_id} for token, video_id in pairs]
+    for i in range(0, len(rows), 1000):
+        bind.execute(insert(VideoTitleToken), rows[i:i + 1000])
+    return len(rows)
+
+
+def index_title(video_id: int, title: str | None):
+    """Re-index one video's title. Joins the caller's transaction."""
+    db.session.execute(delete(VideoTitleToken).where(VideoTitleToken.video_id == video_id))
+    tokens = title_tokens(title)
+    if tokens:
+        db.session.execute(insert(VideoTitleToken), [{"token": t, "video_id": video_id} for t in tokens])
+
+
+def _accumulate(scores, weight: float, baskets: dict, sizes: dict, only=None):
+    """Add one signal's cosine terms to ``scores[a][b]``.
+
+    ``baskets`` maps basket -> set of videos, ``sizes`` video -> number of
+    baskets it is in. With ``only`` set, just that video's row is filled.
+    """
+    for members in baskets.values():
+        if len(members) < 2 or len(members) > RELATED_MAX_BASKET:
+            continue
+        for a in (members if only is None else (only,)):
+            row = scores[a]
+            norm = weight / math.sqrt(sizes[a])
+            for b in members:
+                if b != a:
+                    row[b] = row.get(b, 0.0) + norm / math.sqrt(sizes[b])
+
+
+def _top(row: dict) -> list:
+    return heapq.nlargest(RELATED_K, row.items(), key=lambda item: (item[1], item[0]))
+
+
+def _rows(video_id: int, top: list) -> list:
+    return [{"video_id": video_id, "rank": rank, "related_id": other, "score": score}
+            for rank, (other, score) in enumerate(top)]
+
+
+# --- Full rebuild ---
+def _group(pairs) -> tuple:
+    baskets, sizes = defaultdict(set), defaultdict(int)
+    for basket, video_id in pairs:
+        if basket is None or video_id is None or video_id in baskets[basket]:
+            continue
+        baskets[basket].add(video_id)
+        sizes[video_id] += 1
+    return baskets, sizes
+
+
+def rebuild(bind) -> int:
+    """Recompute every video's related list and VideoTitleToken. Returns rows written.
+
+    ``bind`` is a Connection or a Session.
+    """
+    scores = defaultdict(dict)
+    alive = select(Video.id)
+    for weight, basket_col, video_col in SIGNALS:
+        pairs = bind.execute(select(basket_col, video_col).where(video_col.in_(alive)))
+        _accumulate(scores, weight, *_group(pairs))
+    titles = _all_title_tokens(bind)
+    _accumulate(scores, TITLE_WEIGHT, *_group(titles))
+    index_titles(bind, titles)
+
+    bind.execute(delete(RelatedVideo))
+    rows = [row for video_id, row in scores.items() for row in _rows(video_id, _top(row))]
+    for i in range(0, len(rows), 1000):
+        bind.execute(insert(RelatedVideo), rows[i:i + 1000])
+    bind.execute(update(Video).values(related_stale=False))
+    return len(rows)
+
+
+# --- One video ---
+def _neighbourhood(video_id: int, basket_col, video_col) -> tuple:
+    """Baskets holding ``video_id`` with all their videos, and basket counts for those videos."""
+    mine = select(basket_col).where(video_col == video_id)
+    baskets, _ = _group(db.session.execute(select(basket_col, video_col).where(basket_col.in_(mine))))
+    members = set().union(*baskets.values()) if baskets else set()
+    if not members:
+        return {}, {}
+    sizes = dict(db.session.execute(
+        select(video_col, func.count(func.distinct(basket_col))).where(video_col.in_(members)).group_by(video_col)
+    ).all())
+    return baskets, sizes
+
+
+def _title_neighbourhood(video_id: int) -> tuple:
+    """Like _neighbourhood() for title words; words too common to be a signal are never loaded."""
+    mine = select(VideoTitleToken.token).where(VideoTitleToken.video_id == video_id)
+    counts = db.session.execute(
+        select(VideoTitleToken.token, func.count()).where(VideoTitleToken.token.in_(mine))
+        .group_by(VideoTitleToken.token)
+    ).all()
+    tokens = [token for token, n in counts if 2 <= n <= RELATED_MAX_BASKET]
+    if not tokens:
+        return {}, {}
+    baskets, _ = _group(db.session.execute(
+        select(VideoTitleToken.token, VideoTitleToken.video_id).where(VideoTitleToken.token.in_(tokens))))
+    members = set().union(*baskets.values())
+    sizes = dict(db.session.execute(
+        select(VideoTitleToken.video_id, func.count()).where(VideoTitleToken.video_id.in_(members))
+        .group_by(VideoTitleToken.video_id)
+    ).all())
+    return baskets, sizes
+
+
+def refresh(video_id: int) -> int:
+    """Recompute one video's related list. Joins the caller's transaction. Returns rows written."""
+    title = db.session.execute(select(Video.title).where(Video.id == video_id)).scalar()
+    index_title(video_id, title)
+    scores = defaultdict(dict)
+    for weight, basket_col, video_col in SIGNALS:
+        baskets, sizes = _neighbourhood(video_id, basket_col, video_col)
+        _accumulate(scores, weight, baskets, sizes, only=video_id)
+    _accumulate(scores, TITLE_WEIGHT, *_title_neighbourhood(video_id), only=video_id)
+    db.session.execute(delete(RelatedVideo).where(RelatedVideo.video_id == video_id))
+    rows = _rows(video_id, _top(scores[video_id]))
+    if rows:
+        db.session.execute(insert(RelatedVideo), rows)
+    return len(rows)
+
+
+def mark_stale(video_id: int):
+    """Queue a video whose baskets changed. Joins the caller's transaction."""
+    db.session.execute(update(Video).where(Video.id == video_id, Video.related_stale.isnot(True))
+                       .values(related_stale=True).execution_options(synchronize_session=False))
+
+
+def refresh_stale(limit: int = RELATED_BATCH_SIZE) -> int:
+    """Recompute one batch of stale videos. Must run inside an app context. Returns videos handled."""
+    stale = db.session.execute(
+        select(Video.id).where(Video.related_stale.is_(True)).order_by(Video.id).limit(limit)
+    ).scalars().all()
+    for video_id in stale:
+        # Cleared before computing, so a like landing meanwhile queues the video again
+        won = db.session.execute(update(Video).where(Video.id == video_id, Video.related_stale.is_(True))
+                                 .values(related_stale=False).execution_options(synchronize_session=False)).rowcount
+        if won:
+            refresh(video_id)
+        db.session.commit()
+    return len(stale)
+
+
+def related_videos(video_id: int, limit: int = RELATED_K):
+    """The stored related videos, most related first."""
+    return (Video.query.join(RelatedVideo, RelatedVideo.related_id == Video.id)
+            .filter(RelatedVideo.video_id == video_id)
+            .order_by(RelatedVideo.rank)
+            .limit(limit)
+            .all())
+
+
+class RelatedWorker:
+    """Background thread that recomputes stale related lists."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    while refresh_stale() >= RELATED_BATCH_SIZE and not self._stop.is_set():
+                        pass
+                    db.session.remove()
+            except Exception as e:
+                print(f"[related] Refresh error: {e}")
+            self._stop.wait(RELATED_POLL_SECONDS)
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,), name="related-videos", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        if "--rebuild" in sys.argv[1:]:
+            written = rebuild(db.session)
+            db.session.commit()
+            print(f"[related] rebuilt {written} rows")
+        else:
+            total = 0
+            while True:
+                n = refresh_stale()
+                total += n
+                if n < RELATED_BATCH_SIZE:
+                    break
+            print(f"[related] refreshed {total} stale videos")
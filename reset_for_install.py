@@ -8,6 +8,8 @@ import os
 import shutil
 from datetime import datetime
 
+import snapshots
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "cannaspot.db")
 INSTANCE_DB_PATH = os.path.join(BASE_DIR, "instance", "cannaspot.db")
@@ -45,8 +47,8 @@ def reset_for_install():
     
     # Backup uploads if they exist
     if os.path.exists(UPLOAD_DIR) and any(os.scandir(UPLOAD_DIR)):
-        backup_uploads = os.path.join(BACKUP_DIR, f"uploads_pre_test_{timestamp}")
-        shutil.copytree(UPLOAD_DIR, backup_uploads, dirs_exist_ok=True)
+        # Incremental: files unchanged since the last snapshot are hard-linked, not copied again
+        backup_uploads = os.path.join(snapshots.BACKUP_DIR, snapshots.snapshot(label="pre-test"))
         print(f"✅ Uploads backed up to: {backup_uploads}")
         
         # Clear uploads but keep directories
@@ -0,0 +1,231 @@
+"""
+Resumable uploads for videos and shorts (modelled on the tus protocol).
+
+    POST   /api/uploads          kind, filename, length, title, description, thumb
+                                 -> 201 {"token", "offset": 0, "expires"}
+    HEAD   /api/uploads/<token>  -> Upload-Offset / Upload-Length headers
+    PATCH  /api/uploads/<token>  Upload-Offset: n, optional Upload-Checksum: sha256 <base64>,
+                                 body = the next bytes (application/offset+octet-stream)
+                                 -> {"offset", "complete", "url"}
+    DELETE /api/uploads/<token>  abandon the upload
+
+- each PATCH is streamed to a staging file under instance/ in
+  UPLOAD_BLOCK_SIZE reads, so memory use doesn't depend on the chunk size
+- UploadSession.received is the committed offset; a PATCH must start
+  exactly there (409 otherwise, with the current offset) and only one PATCH
+  per upload runs at a time (423)
+- with Upload-Checksum a chunk that doesn't match is cut off again (460);
+  without it, the bytes that arrived before a dropped connection are kept
+  so the client resumes from there
+- the PATCH that reaches the full length moves the file into the blob
+  store (blobs.py) and creates the Video or Short row
+- sessions idle for RESUMABLE_EXPIRY_HOURS are deleted with their files by
+  ``prune()``, which runs on every create (or ``python resumable.py``)
+"""
+
+import base64
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import secure_filename
+
+import blobs
+from models import db, Video, Short, UploadSession
+
+try:
+    import fcntl
+except ImportError:  # Windows development: no per-upload lock
+    fcntl = None
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+STAGING_DIR = os.environ.get("UPLOAD_STAGING_DIR", os.path.join(BASE_DIR, "instance", "upload-staging"))
+
+RESUMABLE_MAX_BYTES = int(os.environ.get("RESUMABLE_MAX_BYTES", str(512 * 1024 * 1024)))
+RESUMABLE_EXPIRY_HOURS = float(os.environ.get("RESUMABLE_EXPIRY_HOURS", "24"))
+UPLOAD_BLOCK_SIZE = 64 * 1024
+CHECKSUM_ALGORITHMS = ("sha256", "sha1", "md5")
+KINDS = ("video", "short")
+
+
+class UploadError(Exception):
+    """A request the protocol rejects; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def staging_path(upload: UploadSession) -> str:
+    return os.path.join(STAGING_DIR, f"{upload.token}.part")
+
+
+def _staged_thumb(token: str, thumbnail: str) -> str:
+    return os.path.join(STAGING_DIR, f"{token}.{thumbnail}")
+
+
+def _expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=RESUMABLE_EXPIRY_HOURS)
+
+
+def create(user_id: int, kind: str, filename: str, length: int, title: str,
+           description: str = "", thumb=None) -> UploadSession:
+    """Start an upload. ``thumb`` is an optional werkzeug FileStorage, small enough to take whole."""
+    if kind not in KINDS:
+        raise UploadError(400, "kind must be video or short")
+    if length <= 0:
+        raise UploadError(400, "length must be positive")
+    if length > RESUMABLE_MAX_BYTES:
+        raise UploadError(413, f"file is larger than {RESUMABLE_MAX_BYTES} bytes")
+    prune()
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    upload = UploadSession(token=secrets.token_hex(16), user_id=user_id, kind=kind,
+                           filename=secure_filename(filename) or f"{kind}.mp4",
+                           title=title or ("Untitled Short" if kind == "short" else "Untitled"),
+                           description=description, length=length, received=0, expires_at=_expiry())
+    if thumb and thumb.filename:
+        upload.thumbnail = secure_filename(thumb.filename) or "thumb.jpg"
+        thumb.save(_staged_thumb(upload.token, upload.thumbnail))
+    open(staging_path(upload), "wb").close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def _checksum(header: str | None):
+    """(hash object, expected digest) from an Upload-Checksum header, or (None, None)."""
+    if not header:
+        return None, None
+    algorithm, _, value = header.strip().partition(" ")
+    if algorithm.lower() not in CHECKSUM_ALGORITHMS:
+        raise UploadError(400, f"unsupported checksum algorithm {algorithm!r}")
+    try:
+        expected = base64.b64decode(value, validate=True)
+    except ValueError:
+        raise UploadError(400, "checksum is not base64")
+    return hashlib.new(algorithm.lower()), expected
+
+
+def append(upload: UploadSession, offset: int, stream, checksum: str | None = None) -> int:
+    """Write the next chunk from ``stream`` at ``offset``. Returns the new offset."""
+    if offset != upload.received:
+        raise UploadError(409, "offset does not match the upload")
+    digest, expected = _checksum(checksum)
+    try:
+        f = open(staging_path(upload), "r+b")
+    except OSError:
+        raise UploadError(410, "upload expired")
+    with f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise UploadError(423, "another request is writing to this upload")
+        # A PATCH that finished while we waited for the lock moved the offset
+        db.session.refresh(upload)
+        if offset != upload.received:
+            raise UploadError(409, "offset does not match the upload")
+        # Drop bytes past the committed offset left by an earlier rejected or cut-off chunk
+        f.truncate(offset)
+        f.seek(offset)
+        written, dropped = 0, False
+        try:
+            while True:
+                block = stream.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                if offset + written + len(block) > upload.length:
+                    f.truncate(offset)
+                    raise UploadError(413, "chunk runs past the declared length")
+                f.write(block)
+                written += len(block)
+                if digest is not None:
+                    digest.update(block)
+        except ClientDisconnected:
+            dropped = True
+        if digest is not None and (dropped or digest.digest() != expected):
+            f.truncate(offset)
+            raise UploadError(460, "checksum mismatch")
+        f.flush()
+        os.fsync(f.fileno())
+        won = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload.id, UploadSession.received == offset)
+            .values(received=offset + written, expires_at=_expiry())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    if not won:
+        raise UploadError(409, "offset does not match the upload")
+    db.session.refresh(upload)
+    if dropped:
+        raise UploadError(400, "connection dropped; resume from Upload-Offset")
+    return upload.received
+
+
+def finalize(upload: UploadSession):
+    """Turn a complete upload into its Video or Short row. Returns the new row."""
+    video_url = blobs.adopt(staging_path(upload), upload.filename)
+    thumb_rel = None
+    if upload.thumbnail:
+        staged = _staged_thumb(upload.token, upload.thumbnail)
+        if os.path.exists(staged):
+            thumb_rel = blobs.adopt(staged, upload.thumbnail)
+    if upload.kind == "short":
+        row = Short(title=upload.title, filename=video_url, thumbnail=thumb_rel, uploader_id=upload.user_id)
+    else:
+        row = Video(title=upload.title, filename=video_url, thumbnail=thumb_rel,
+                    description=upload.description, uploader_id=upload.user_id)
+    db.session.add(row)
+    db.session.delete(upload)
+    db.session.commit()
+    return row
+
+
+def _remove_files(token: str, thumbnail: str | None):
+    paths = [os.path.join(STAGING_DIR, f"{token}.part")]
+    if thumbnail:
+        paths.append(_staged_thumb(token, thumbnail))
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def abandon(upload: UploadSession):
+    _remove_files(upload.token, upload.thumbnail)
+    db.session.delete(upload)
+    db.session.commit()
+
+
+def prune(limit: int = 100) -> int:
+    """Delete expired sessions and their staged files. Returns sessions removed."""
+    expired = db.session.execute(
+        select(UploadSession.id, UploadSession.token, UploadSession.thumbnail)
+        .where(UploadSession.expires_at < datetime.utcnow())
+        .limit(limit)
+    ).all()
+    if not expired:
+        return 0
+    for _, token, thumbnail in expired:
+        _remove_files(token, thumbnail)
+    db.session.execute(delete(UploadSession).where(UploadSession.id.in_([row[0] for row in expired])))
+    db.session.commit()
+    return len(expired)
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        total = 0
+        while True:
+            n = prune()
+            total += n
+            if n < 100:
+                break
+        print(f"[uploads] pruned {total} abandoned uploads")
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator for benchmarks and load tests.
+
+Replaces the one-ORM-object-at-a-time inserts of populate_videos.py and
+create_users.py with bulk Core inserts in chunked transactions. Foreign keys
+are computed from explicit ids, so nothing is read back while seeding.
+
+Data shape, not just volume:
+- server, channel and video popularity follow a Zipf-like curve, so a few
+  channels hold most of the chat and a few videos get most of the likes
+- friendships are a power-law graph (Chung-Lu: each user gets a Pareto
+  weight and edge endpoints are drawn in proportion to it)
+- DMs come as threads between friends, alternating sender, with most older
+  messages read and the tail unread
+
+Every table draws from its own RNG derived from --seed, and every timestamp
+counts back from --epoch, so the same arguments always produce the same
+database. --epoch defaults to today (UTC): trending scores decay from the
+real clock, and data that ended months ago would leave the trending page
+empty.
+
+    python seed_data.py --preset small              # ~100k rows, a few seconds
+    python seed_data.py --preset full               # 100k users, 1M messages, 5M likes
+    python seed_data.py --preset medium --likes 0   # override single tables
+    DATABASE_URL=postgresql://... python seed_data.py --preset full
+
+Every seeded user can log in as user<N> / password.
+"""
+
+import argparse
+import bisect
+import functools
+import itertools
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, insert, text
+
+PRESETS = {
+    "small": {
+        "users": 1_000, "servers": 100, "channels_per_server": 4, "memberships_per_user": 3,
+        "videos": 2_000, "messages": 10_000, "likes": 50_000, "comments": 5_000,
+        "subscriptions": 5_000, "friendships": 5_000, "dm_threads": 500, "dms_per_thread": 10,
+    },
+    "medium": {
+        "users": 10_000, "servers": 1_000, "channels_per_server": 5, "memberships_per_user": 4,
+        "videos": 10_000, "messages": 100_000, "likes": 500_000, "comments": 50_000,
+        "subscriptions": 50_000, "friendships": 50_000, "dm_threads": 5_000, "dms_per_thread": 20,
+    },
+    "full": {
+        "users": 100_000, "servers": 10_000, "channels_per_server": 5, "memberships_per_user": 5,
+        "videos": 50_000, "messages": 1_000_000, "likes": 5_000_000, "comments": 500_000,
+        "subscriptions": 500_000, "friendships": 500_000, "dm_threads": 50_000, "dms_per_thread": 20,
+    },
+}
+
+DEFAULT_EPOCH = datetime.utcnow().date().isoformat()
+DEFAULT_CHUNK = 50_000
+PASSWORD = "password"
+
+WORDS = ("grow", "light", "soil", "harvest", "cure", "strain", "nutes", "tent", "clone", "seed",
+         "trichome", "flower", "veg", "ppm", "humidity", "yield", "organic", "hydro", "topping", "scrog")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every preset volume")
+    parser.add_argument("--seed", type=int, default=420, help="RNG seed (same seed, same data)")
+    parser.add_argument("--epoch", default=DEFAULT_EPOCH, help="timestamp of the newest row (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=365, help="how far back rows are spread")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="rows per insert/transaction")
+    parser.add_argument("--force", action="store_true", help="seed even if the user table is not empty")
+    parser.add_argument("--keep-indexes", action="store_true",
+                        help="insert with secondary indexes in place instead of rebuilding them afterwards")
+    for key in PRESETS["small"]:
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, dest=key, default=None)
+    return parser.parse_args(argv)
+
+
+def volumes(args) -> dict:
+    counts = {k: max(0, int(v * args.scale)) for k, v in PRESETS[args.preset].items()}
+    for key in counts:
+        override = getattr(args, key, None)
+        if override is not None:
+            counts[key] = override
+    counts["users"] = max(counts["users"], 2)
+    counts["servers"] = max(counts["servers"], 1)
+    counts["channels_per_server"] = max(counts["channels_per_server"], 1)
+    return counts
+
+
+# --- Distributions ---
+def rng_for(seed: int, table: str) -> random.Random:
+    # str seeds are hashed with SHA-512, so this is stable across processes
+    return random.Random(f"{seed}:{table}")
+
+
+def zipf_cum_weights(n: int, s: float = 1.1) -> list:
+    """Cumulative weights for ids 1..n where id k has weight 1/k^s."""
+    return list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+
+
+def weighted_ids(rnd: random.Random, cum_weights: list, k: int, perm: list | None = None) -> list:
+    """k ids (1-based) drawn with the given cumulative weights.
+
+    ``perm`` maps popularity rank to id so the popular rows aren't simply the
+    lowest ids.
+    """
+    total = cum_weights[-1]
+    n = len(cum_weights)
+    out = []
+    for _ in range(k):
+        rank = bisect.bisect_left(cum_weights, rnd.random() * total)
+        rank = min(rank, n - 1)
+        out.append(perm[rank] if perm else rank + 1)
+    return out
+
+
+def shuffled_ids(rnd: random.Random, n: int) -> list:
+    ids = list(range(1, n + 1))
+    rnd.shuffle(ids)
+    return ids
+
+
+def split_total(rnd: random.Random, total: int, cum_weights: list, cap: int) -> list:
+    """Spread ``total`` across len(cum_weights) buckets by weight, each capped at ``cap``."""
+    n = len(cum_weights)
+    weights = [cum_weights[0]] + [cum_weights[i] - cum_weights[i - 1] for i in range(1, n)]
+    scale = total / cum_weights[-1]
+    counts = [min(cap, int(w * scale)) for w in weights]
+    # Hand out the rounding/capping remainder one at a time to uncapped buckets
+    short = total - sum(counts)
+    open_buckets = [i for i in range(n) if counts[i] < cap]
+    while short > 0 and open_buckets:
+        i = open_buckets[rnd.randrange(len(open_buckets))]
+        counts[i] += 1
+        short -= 1
+        if counts[i] >= cap:
+            open_buckets.remove(i)
+    return counts
+
+
+@functools.lru_cache(maxsize=None)
+def _sentence_pool(lo: int, hi: int) -> tuple:
+    rnd = random.Random(f"sentences:{lo}:{hi}")
+    return tuple(" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(lo, hi))) for _ in range(4096))
+
+
+def sentence(rnd: random.Random, lo: int = 3, hi: int = 12) -> str:
+    # Joining fresh words per row costs more than the insert itself
+    return _sentence_pool(lo, hi)[rnd.getrandbits(12)]
+
+
+# --- Row generators (each yields dicts in id order) ---
+class Dataset:
+    def __init__(self, counts: dict, seed: int, epoch: datetime, days: int):
+        self.c = counts
+        self.seed = seed
+        self.epoch = epoch
+        self.span = days * 86400
+        self.channels = counts["servers"] * counts["channels_per_server"]
+
+    def ago(self, rnd: random.Random) -> datetime:
+        # Skewed towards recent activity
+        return self.epoch - timedelta(seconds=int(self.span * rnd.random() ** 2))
+
+    def users(self, pw_hash: str):
+        rnd = rng_for(self.seed, "user")
+        for i in range(1, self.c["users"] + 1):
+            created = self.ago(rnd)
+            yield {"id": i, "uname": f"user{i}", "email": f"user{i}@seed.cannaspot.local", "dname": f"User {i}",
+                   "pw_hash": pw_hash, "admin": False, "status": rnd.choice(("online", "offline", "too_stoned")),
+                   "created": created, "seen": created}
+
+    def servers(self):
+        rnd = rng_for(self.seed, "server")
+        for i in range(1, self.c["servers"] + 1):
+            yield {"id": i, "name": f"{rnd.choice(WORDS).title()} Club {i}", "slug": f"seed-server-{i}",
+                   "owner": rnd.randint(1, self.c["users"]), "created": self.ago(rnd)}
+
+    def channel_rows(self):
+        cps = self.c["channels_per_server"]
+        cid = 0
+        for server in range(1, self.c["servers"] + 1):
+            for pos in range(cps):
+                cid += 1
+                voice = pos == cps - 1 and cps > 1
+                yield {"id": cid, "server": server, "name": "voice" if voice else ("general" if pos == 0 else f"chat-{pos}"),
+                       "voice": voice, "cat": "Voice" if voice else "Text", "pos": pos, "created": self.epoch}
+
+    def memberships(self):
+        rnd = rng_for(self.seed, "membership")
+        cum = zipf_cum_weights(self.c["servers"])
+        perm = shuffled_ids(rng_for(self.seed, "server-rank"), self.c["servers"])
+        per_user = min(self.c["memberships_per_user"], self.c["servers"])
+        mid = 0
+        for user in range(1, self.c["users"] + 1):
+            joined = set(weighted_ids(rnd, cum, per_user, perm))
+            for server in sorted(joined):
+                mid += 1
+                yield {"id": mid, "user": user, "server": server}
+
+    def messages(self):
+        rnd = rng_for(self.seed, "message")
+        cps = self.c["channels_per_server"]
+        # Only text channels carry chat; voice is always the last of a server's channels
+        text_per_server = cps - 1 if cps > 1 else 1
+        text_channels = [s * cps + p + 1 for s in range(self.c["servers"]) for p in range(text_per_server)]
+        cum = zipf_cum_weights(len(text_channels))
+        rnd.shuffle(text_channels)
+        users_cum = zipf_cum_weights(self.c["users"], 0.8)
+        users_perm = shuffled_ids(rng_for(self.seed, "user-rank"), self.c["users"])
+        for i in range(1, self.c["messages"] + 1):
+            channel = text_channels[min(bisect.bisect_left(cum, rnd.random() * cum[-1]), len(cum) - 1)]
+            yield {"id": i, "server_id": (channel - 1) // cps + 1, "channel_id": channel,
+                   "user_id": weighted_ids(rnd, users_cum, 1, users_perm)[0], "content": sentence(rnd),
+                   "created_at": self.ago(rnd)}
+
+    def videos(self):
+        rnd = rng_for(self.seed, "video")
+        uploaders_cum = zipf_cum_weights(self.c["users"], 1.3)
+        uploaders_perm = shuffled_ids(rng_for(self.seed, "uploader-rank"), self.c["users"])
+        for i in range(1, self.c["videos"] + 1):
+            yield {"id": i, "title": f"{sentence(rnd, 2, 6).title()} #{i}", "filename": f"/uploads/videos/seed_{i}.mp4",
+                   "thumbnail": None, "description": sentence(rnd, 8, 30),
+                   "uploader_id": weighted_ids(rnd, uploaders_cum, 1, uploaders_perm)[0],
+                   "view_count": int(rnd.paretovariate(1.2) * 10), "created_at": self.ago(rnd),
+                   "is_live": i % 997 == 0}
+
+    def likes(self):
+        """Distinct (video, user) pairs; per-video counts follow the popularity curve."""
+        rnd = rng_for(self.seed, "like")
+        n_videos, n_users = self.c["videos"], self.c["users"]
+        if not n_videos:
+            return
+        cum = zipf_cum_weights(n_videos)
+        perm = shuffled_ids(rng_for(self.seed, "video-rank"), n_videos)
+        per_rank = split_total(rnd, min(self.c["likes"], n_videos * n_users), cum, n_users)
+        lid = 0
+        for rank, k in enumerate(per_rank):
+            video = perm[rank]
+            for user in rnd.sample(range(1, n_users + 1), k):
+                lid += 1
+                yield {"id": lid, "user_id": user, "video_id": video, "created_at": self.ago(rnd)}
+
+    def comments(self):
+        rnd = rng_for(self.seed, "comment")
+        if not self.c["videos"]:
+            return
+        cum = zipf_cum_weights(self.c["videos"])
+        perm = shuffled_ids(rng_for(self.seed, "video-rank"), self.c["videos"])
+        for i in range(1, self.c["comments"] + 1):
+            yield {"id": i, "video_id": weighted_ids(rnd, cum, 1, perm)[0], "user_id": rnd.randint(1, self.c["users"]),
+                   "content": sentence(rnd), "created_at": self.ago(rnd)}
+
+    def subscriptions(self):
+        rnd = rng_for(self.seed, "subscription")
+        cum = zipf_cum_weights(self.c["users"], 1.3)
+        perm = shuffled_ids(rng_for(self.seed, "uploader-rank"), self.c["users"])
+        seen = set()
+        sid = 0
+        for _ in range(self.c["subscriptions"] * 2):
+            if sid >= self.c["subscriptions"]:
+                break
+            pair = (rnd.randint(1, self.c["users"]), weighted_ids(rnd, cum, 1, perm)[0])
+            if pair[0] == pair[1] or pair in seen:
+                continue
+            seen.add(pair)
+            sid += 1
+            yield {"id": sid, "subscriber_id": pair[0], "subscribed_to_id": pair[1], "created_at": self.ago(rnd)}
+
+    def friend_pairs(self) -> list:
+        """Power-law friendship graph as a list of (user, friend) pairs, deterministic order."""
+        rnd = rng_for(self.seed, "friendship")
+        n = self.c["users"]
+        target = min(self.c["friendships"], n * (n - 1) // 2)
+        cum = list(itertools.accumulate(rnd.paretovariate(1.5) for _ in range(n)))
+        seen = set()
+        pairs = []
+        attempts = 0
+        while len(pairs) < target and attempts < target * 20:
+            attempts += 1
+            a, b = weighted_ids(rnd, cum, 2)
+            if a == b:
+                continue
+            key = (a, b) if a < b else (b, a)
+            if key in seen:
+                continue
+            seen.add(key)
+            pairs.append((a, b))
+        return pairs
+
+    def friendships(self, pairs: list):
+        rnd = rng_for(self.seed, "friendship-status")
+        for i, (a, b) in enumerate(pairs, start=1):
+            requested = self.ago(rnd)
+            accepted = rnd.random() < 0.85
+            yield {"id": i, "user_id": a, "friend_id": b, "status": "accepted" if accepted else "pending",
+                   "requested_at": requested, "accepted_at": requested + timedelta(hours=rnd.randint(1, 72)) if accepted else None}
+
+    def direct_messages(self, pairs: list):
+        rnd = rng_for(self.seed, "dm")
+        threads = min(self.c["dm_threads"], len(pairs)) if pairs else 0
+        chosen = rnd.sample(range(len(pairs)), threads) if threads else []
+        per_thread = self.c["dms_per_thread"]
+        did = 0
+        for idx in sorted(chosen):
+            a, b = pairs[idx]
+            length = max(1, int(rnd.paretovariate(1.5) * per_thread / 3))
+            start = self.ago(rnd)
+            unread_tail = rnd.randint(0, 3)
+            for j in range(length):
+                did += 1
+                sender, recipient = (a, b) if (j + rnd.randint(0, 1)) % 2 == 0 else (b, a)
+                yield {"id": did, "sender_id": sender, "recipient_id": recipient, "content": sentence(rnd),
+                       "is_read": j < length - unread_tail, "created_at": start + timedelta(minutes=j * rnd.randint(1, 30))}
+
+
+# --- Loading ---
+def _sqlite_executemany(conn, table, batch: list):
+    """Straight DBAPI executemany with tuples.
+
+    Core's per-row bind processing (mostly DateTime -> str) is slower than
+    SQLite itself; the values are formatted here exactly as SQLAlchemy stores
+    them.
+    """
+    cols = list(batch[0])
+    quote = conn.dialect.identifier_preparer.quote
+    sql = (f"INSERT INTO {quote(table.name)} ({', '.join(quote(c) for c in cols)}) "
+           f"VALUES ({', '.join('?' * len(cols))})")
+    dates = [i for i, c in enumerate(cols) if isinstance(table.c[c].type, DateTime)]
+    if dates:
+        params = []
+        for row in batch:
+            values = list(row.values())
+            for i in dates:
+                if values[i] is not None:
+                    values[i] = values[i].isoformat(" ", "microseconds")
+            params.append(tuple(values))
+    else:
+        params = [tuple(row.values()) for row in batch]
+    conn.exec_driver_sql(sql, params)
+
+
+def bulk_insert(engine, table, rows, chunk: int) -> int:
+    """Insert an iterable of dicts in chunk-sized transactions. Returns rows written."""
+    total = 0
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, chunk))
+        if not batch:
+            return total
+        with engine.begin() as conn:
+            if conn.dialect.name == "sqlite":
+                # Seeding is reproducible, so durability per chunk isn't needed
+                conn.exec_driver_sql("PRAGMA synchronous = OFF")
+                _sqlite_executemany(conn, table, batch)
+            else:
+                # Postgres/MySQL: Core batches these into multi-row VALUES
+                conn.execute(insert(table), batch)
+        total += len(batch)
+
+
+def reset_sequences(engine, tables):
+    """Explicit ids leave Postgres sequences behind; move them past max(id)."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM \"{table.name}\"), 0) + 1, false)"
+            ))
+
+
+def seed(engine, counts: dict, seed: int = 420, epoch: datetime | None = None, days: int = 365,
+         chunk: int = DEFAULT_CHUNK, keep_indexes: bool = False, log=print) -> dict:
+    """Generate and load a dataset. Returns {table name: rows written}."""
+    import migrations
+    from models import (
+        hash_pw, User, Server, Channel, Membership, Message, Video, VideoLike, VideoComment,
+        Subscription, Friendship, DirectMessage,
+    )
+
+    ds = Dataset(counts, seed, epoch or datetime.fromisoformat(DEFAULT_EPOCH), days)
+    pairs = ds.friend_pairs()
+    plan = [
+        (User, ds.users(hash_pw(PASSWORD))),
+        (Server, ds.servers()),
+        (Channel, ds.channel_rows()),
+        (Membership, ds.memberships()),
+        (Message, ds.messages()),
+        (Video, ds.videos()),
+        (VideoLike, ds.likes()),
+        (VideoComment, ds.comments()),
+        (Subscription, ds.subscriptions()),
+        (Friendship, ds.friendships(pairs)),
+        (DirectMessage, ds.direct_messages(pairs)),
+    ]
+    models = [model for model, _ in plan]
+
+    if not keep_indexes:
+        # Building each index once over sorted data beats maintaining it per row
+        with engine.begin() as conn:
+            for model in models:
+                for index in model.__table__.indexes:
+                    index.drop(bind=conn, checkfirst=True)
+
+    written = {}
+    try:
+        for model, rows in plan:
+            start = time.perf_counter()
+            n = bulk_insert(engine, model.__table__, rows, chunk)
+            written[model.__tablename__] = n
+            elapsed = time.perf_counter() - start
+            rate = n / elapsed if elapsed else 0
+            log(f"[seed] {model.__tablename__:<16} {n:>10,} rows  {elapsed:6.1f}s  ({rate:,.0f} rows/s)")
+    finally:
+        if not keep_indexes:
+            start = time.perf_counter()
+            with engine.begin() as conn:
+                migrations.create_indexes(conn, *models)
+            log(f"[seed] indexes rebuilt in {time.perf_counter() - start:.1f}s")
+
+    reset_sequences(engine, [m.__table__ for m in models])
+    import counters
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        counters.reconcile(conn)
+        log(f"[seed] counters reconciled in {time.perf_counter() - start:.1f}s")
+    import timeline
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        n = timeline.rebuild(conn)
+        log(f"[seed] {n:,} timeline entries in {time.perf_counter() - start:.1f}s")
+    import trending
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        n = trending.rebuild(conn)
+        log(f"[seed] {n:,} trending scores in {time.perf_counter() - start:.1f}s")
+    import related
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        n = related.rebuild(conn)
+        log(f"[seed] {n:,} related-video rows in {time.perf_counter() - start:.1f}s")
+    if engine.dialect.name in ("sqlite", "postgresql"):
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    return written
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts = volumes(args)
+
+    import migrations
+    from app import app
+    from models import db, User
+
+    with app.app_context():
+        migrations.upgrade(db.engine)
+        if db.session.query(User.id).first() and not args.force:
+            print("❌ The user table is not empty. Seed into a fresh database (DATABASE_URL=sqlite:///bench.db),")
+            print("   or pass --force if you are sure the ids won't collide.")
+            return 1
+        db.session.remove()
+
+        print(f"🌱 Seeding preset '{args.preset}' (scale {args.scale}, seed {args.seed}) into {db.engine.url.render_as_string()}")
+        start = time.perf_counter()
+        written = seed(db.engine, counts, seed=args.seed, epoch=datetime.fromisoformat(args.epoch),
+                       days=args.days, chunk=args.chunk, keep_indexes=args.keep_indexes)
+        total = sum(written.values())
+        elapsed = time.perf_counter() - start
+        print(f"✅ {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+        print(f"   Log in as user1 .. user{counts['users']} with password '{PASSWORD}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
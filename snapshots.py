@@ -0,0 +1,497 @@
+"""
+Incremental snapshot backups of uploads/ and the database.
+
+Backups used to be full copies (backups/uploads_backup_<timestamp>), so
+every snapshot stored every video again. A snapshot is now
+
+    backups/snapshots/<YYYYmmdd-HHMMSS>[-label]/
+        manifest.json   created, label, database, {path: {sha256, size, mtime_ns}}
+        uploads/...     the files
+        db.sqlite3 | db.dump | db.sql
+
+- a file whose size and mtime match the previous snapshot's manifest is
+  hard-linked from it without being read; any other file is copied in
+  BLOCK_SIZE reads into one reused buffer (memory doesn't depend on file
+  size), hashed on the way, and replaced by a hard link if the previous
+  snapshot already has the same content under any path. An unchanged tree
+  costs one stat per file and no space beyond directory entries
+- the database is dumped online: SQLite through the backup API (a
+  consistent copy while the app keeps writing), PostgreSQL with pg_dump
+  --format=custom, MySQL with mysqldump --single-transaction
+- a snapshot is built as ``<name>.partial`` and renamed once its manifest
+  is written, so an interrupted run never becomes the base of the next one
+- ``prune()`` keeps the BACKUP_KEEP_LAST newest snapshots plus the newest
+  of each of the last BACKUP_KEEP_DAILY days, BACKUP_KEEP_WEEKLY weeks and
+  BACKUP_KEEP_MONTHLY months. Deleting a snapshot only frees the files no
+  other snapshot links to
+- ``verify()`` rehashes every file against the manifest; ``restore()``
+  verifies while it copies into a staging directory and only then swaps
+  it in, keeping the replaced uploads/ and database next to the originals
+
+    python snapshots.py                    # snapshot, then prune
+    python snapshots.py --list
+    python snapshots.py --verify [NAME]    # default: newest
+    python snapshots.py --restore NAME [--uploads-only | --db-only]
+    python snapshots.py --import-legacy    # fold uploads_backup_* copies into snapshots
+
+Files are hard-linked between snapshots, so never edit a snapshot in place.
+Where a link can't be made (BACKUP_DIR spanning filesystems, link limit)
+the file is copied instead.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy.engine import make_url
+
+try:
+    import fcntl
+except ImportError:  # Windows development: no run lock
+    fcntl = None
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+LEGACY_DIR = os.path.join(BASE_DIR, "backups")
+BACKUP_DIR = os.path.join(BASE_DIR, os.environ.get("BACKUP_DIR", os.path.join("backups", "snapshots")))
+
+BACKUP_KEEP_LAST = int(os.environ.get("BACKUP_KEEP_LAST", "3"))
+BACKUP_KEEP_DAILY = int(os.environ.get("BACKUP_KEEP_DAILY", "7"))
+BACKUP_KEEP_WEEKLY = int(os.environ.get("BACKUP_KEEP_WEEKLY", "4"))
+BACKUP_KEEP_MONTHLY = int(os.environ.get("BACKUP_KEEP_MONTHLY", "6"))
+PG_DUMP = os.environ.get("PG_DUMP", "pg_dump")
+PG_RESTORE = os.environ.get("PG_RESTORE", "pg_restore")
+MYSQLDUMP = os.environ.get("MYSQLDUMP", "mysqldump")
+MYSQL = os.environ.get("MYSQL", "mysql")
+
+BLOCK_SIZE = 1024 * 1024
+MANIFEST = "manifest.json"
+NAME_FORMAT = "%Y%m%d-%H%M%S"
+# Rebuilt on demand or in flight; not worth keeping
+EXCLUDE_DIRS = {"derived", os.path.join("blobs", ".tmp")}
+EXCLUDE_FILES = re.compile(r"(^\.lock$|\.tmp-|\.partial$)")
+_LEGACY = re.compile(r"^uploads_(?:backup|pre_test)_(\d{8}_\d{6})$")
+
+
+class BackupError(Exception):
+    """A snapshot that can't be taken, verified or restored."""
+
+
+@contextmanager
+def _run_lock():
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(BACKUP_DIR, ".lock"), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise BackupError("another backup is running")
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def copy_file(src: str, dst: str, buf: bytearray) -> str:
+    """Stream ``src`` to ``dst`` through ``buf``. Returns the SHA-256 of what was written."""
+    h = hashlib.sha256()
+    view = memoryview(buf)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            n = fin.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            fout.write(view[:n])
+        fout.flush()
+        os.fsync(fout.fileno())
+    return h.hexdigest()
+
+
+def hash_file(path: str, buf: bytearray) -> str:
+    h = hashlib.sha256()
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str, buf: bytearray) -> bool:
+    """Hard-link ``src`` to ``dst``, copying when a link can't be made. False if ``src`` is gone."""
+    try:
+        os.link(src, dst)
+    except FileNotFoundError:
+        return False
+    except OSError:  # other filesystem, or too many links to one inode
+        copy_file(src, dst, buf)
+        shutil.copystat(src, dst)
+    return True
+
+
+def _walk(root: str):
+    """Relative paths of the files to back up below ``root``, sorted."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        rel_dir = "" if rel_dir == "." else rel_dir
+        dirnames[:] = sorted(d for d in dirnames if os.path.join(rel_dir, d) not in EXCLUDE_DIRS)
+        for name in sorted(filenames):
+            if not EXCLUDE_FILES.search(name):
+                yield os.path.join(rel_dir, name)
+
+
+# --- Snapshots on disk ---
+def snapshots() -> list:
+    """(name, manifest) of every complete snapshot, oldest first."""
+    found = []
+    if not os.path.isdir(BACKUP_DIR):
+        return found
+    for name in os.listdir(BACKUP_DIR):
+        path = os.path.join(BACKUP_DIR, name, MANIFEST)
+        if name.endswith(".partial") or not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            found.append((name, json.load(f)))
+    found.sort(key=lambda item: (item[1]["created"], item[0]))
+    return found
+
+
+def _find(name: str | None):
+    all_snapshots = snapshots()
+    if not all_snapshots:
+        raise BackupError(f"no snapshots in {BACKUP_DIR}")
+    if name is None:
+        return all_snapshots[-1]
+    for found in all_snapshots:
+        if found[0] == name:
+            return found
+    raise BackupError(f"no snapshot named {name}")
+
+
+# --- Database dumps ---
+def _sqlite_path(url):
+    path = url.database
+    if not path or path == ":memory:":
+        return None
+    # Flask-SQLAlchemy puts relative SQLite paths in instance/
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, "instance", path)
+
+
+def _sqlite_copy(src_path: str, dst_path: str):
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _client_env(url, var: str) -> dict:
+    env = dict(os.environ)
+    if url.password:
+        env[var] = url.password  # not on the command line, where ps shows it
+    return env
+
+
+def _pg_url(url) -> str:
+    return url.set(drivername="postgresql", password=None).render_as_string(hide_password=False)
+
+
+def _mysql_args(url) -> list:
+    args = [f"--user={url.username}"] if url.username else []
+    args += [f"--host={url.host}"] if url.host else []
+    args += [f"--port={url.port}"] if url.port else []
+    return args
+
+
+def dump_database(database_url: str, out_dir: str, buf: bytearray):
+    """Dump the database into ``out_dir``. Returns its manifest entry, or None if there is nothing to dump."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        path = _sqlite_path(url)
+        if path is None or not os.path.exists(path):
+            return None
+        name = "db.sqlite3"
+        out = os.path.join(out_dir, name)
+        # Online backup: consistent even while the app writes (WAL included)
+        _sqlite_copy(path, out)
+    elif backend == "postgresql":
+        name = "db.dump"
+        out = os.path.join(out_dir, name)
+        subprocess.run([PG_DUMP, "--format=custom", "--no-owner", f"--file={out}", f"--dbname={_pg_url(url)}"],
+                       env=_client_env(url, "PGPASSWORD"), check=True, capture_output=True)
+    elif backend == "mysql":
+        name = "db.sql"
+        out = os.path.join(out_dir, name)
+        subprocess.run([MYSQLDUMP, "--single-transaction", "--routines", "--triggers", *_mysql_args(url),
+                        f"--result-file={out}", url.database],
+                       env=_client_env(url, "MYSQL_PWD"), check=True, capture_output=True)
+    else:
+        raise BackupError(f"don't know how to dump a {backend} database")
+    entry = {"backend": backend, "file": name, "size": os.path.getsize(out), "sha256": hash_file(out, buf)}
+    _check_dump(out, entry)
+    return entry
+
+
+def _check_dump(path: str, entry: dict):
+    """Beyond the checksum: can the dump be read back?"""
+    if entry["backend"] == "sqlite":
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                raise BackupError(f"{path}: integrity check failed")
+        finally:
+            conn.close()
+    elif entry["backend"] == "postgresql":
+        subprocess.run([PG_RESTORE, "--list", path], check=True, capture_output=True)
+
+
+# --- Taking snapshots ---
+def snapshot(database_url: str | None = None, label: str | None = None, source: str = UPLOAD_DIR,
+             created: datetime | None = None, checksum: bool = False) -> str:
+    """Snapshot ``source`` (and the database, if given) against the newest snapshot. Returns its name.
+
+    ``checksum`` rehashes every file instead of trusting an unchanged size and mtime.
+    """
+    created = created or datetime.now()
+    name = created.strftime(NAME_FORMAT) + (f"-{re.sub(r'[^a-z0-9]+', '-', label.lower())}" if label else "")
+    with _run_lock():
+        # The base is the newest snapshot before this one (imported legacy copies predate the rest)
+        previous = [found for found in snapshots() if found[1]["created"] <= created.isoformat(timespec="seconds")]
+        prev_name, prev_manifest = previous[-1] if previous else (None, {"files": {}})
+        prev_files = prev_manifest["files"]
+        prev_root = os.path.join(BACKUP_DIR, prev_name, "uploads") if prev_name else None
+        by_hash = {entry["sha256"]: rel for rel, entry in prev_files.items()}
+
+        final = os.path.join(BACKUP_DIR, name)
+        if os.path.exists(final):
+            raise BackupError(f"snapshot {name} already exists")
+        work = final + ".partial"
+        shutil.rmtree(work, ignore_errors=True)
+        root = os.path.join(work, "uploads")
+        os.makedirs(root)
+        buf = bytearray(BLOCK_SIZE)
+        files, stats = {}, {"linked": 0, "copied": 0, "bytes_copied": 0}
+        for rel in _walk(source) if os.path.isdir(source) else ():
+            src = os.path.join(source, rel)
+            dst = os.path.join(root, rel)
+            try:
+                st = os.stat(src)
+            except FileNotFoundError:  # deleted while we walked
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            prev = prev_files.get(rel)
+            unchanged = prev and not checksum and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns
+            if unchanged and _link_or_copy(os.path.join(prev_root, rel), dst, buf):
+                files[rel] = prev
+                stats["linked"] += 1
+                continue
+            sha256 = copy_file(src, dst, buf)
+            same = by_hash.get(sha256)
+            # Same content as a file of the previous snapshot (touched, renamed): share its inode
+            if same is not None and _link_or_copy(os.path.join(prev_root, same), dst + ".link", buf):
+                os.replace(dst + ".link", dst)
+                stats["linked"] += 1
+            else:
+                os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+                stats["copied"] += 1
+                stats["bytes_copied"] += st.st_size
+            files[rel] = {"sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+        database = dump_database(database_url, work, buf) if database_url else None
+        manifest = {"created": created.isoformat(timespec="seconds"), "label": label, "base": prev_name,
+                    "database": database, "stats": stats, "files": files}
+        with open(os.path.join(work, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(work, final)
+    print(f"[backup] {name}: {len(files)} files, {stats['linked']} linked, {stats['copied']} copied "
+          f"({stats['bytes_copied'] / 1e6:.1f} MB)" + (f", database {database['file']}" if database else ""))
+    return name
+
+
+def import_legacy() -> int:
+    """Turn backups/uploads_backup_* full copies into snapshots and delete the copies. Returns copies folded."""
+    legacy = []
+    for entry in os.listdir(LEGACY_DIR) if os.path.isdir(LEGACY_DIR) else ():
+        m = _LEGACY.match(entry)
+        if m:
+            legacy.append((datetime.strptime(m.group(1), "%Y%m%d_%H%M%S"), entry))
+    for created, entry in sorted(legacy):
+        path = os.path.join(LEGACY_DIR, entry)
+        name = snapshot(label="legacy", source=path, created=created)
+        verify(name)
+        shutil.rmtree(path)
+    return len(legacy)
+
+
+# --- Retention ---
+def select_kept(found: list, last: int = BACKUP_KEEP_LAST, daily: int = BACKUP_KEEP_DAILY,
+                weekly: int = BACKUP_KEEP_WEEKLY, monthly: int = BACKUP_KEEP_MONTHLY) -> set:
+    """Names of the snapshots the retention policy keeps. ``found`` is snapshots(), oldest first."""
+    newest_first = [(name, datetime.fromisoformat(m["created"])) for name, m in reversed(found)]
+    # The newest is always kept: it is the base of the next snapshot
+    keep = {name for name, _ in newest_first[:max(last, 1)]}
+    for count, period in ((daily, "%Y-%m-%d"), (weekly, "%G-W%V"), (monthly, "%Y-%m")):
+        periods = set()
+        for name, created in newest_first:
+            key = created.strftime(period)
+            if key in periods:
+                continue
+            if len(periods) >= count:
+                break
+            periods.add(key)
+            keep.add(name)
+    return keep
+
+
+def prune() -> list:
+    """Delete snapshots the retention policy doesn't keep. Returns their names."""
+    with _run_lock():
+        found = snapshots()
+        keep = select_kept(found)
+        removed = [name for name, _ in found if name not in keep]
+        for name in removed:
+            shutil.rmtree(os.path.join(BACKUP_DIR, name))
+        # Left by runs that died before their rename
+        for entry in os.listdir(BACKUP_DIR):
+            if entry.endswith(".partial"):
+                shutil.rmtree(os.path.join(BACKUP_DIR, entry), ignore_errors=True)
+    return removed
+
+
+# --- Verify and restore ---
+def _check(path: str, entry: dict, buf: bytearray, dst: str | None = None):
+    """Hash ``path`` (copying it to ``dst`` on the way) and compare with its manifest entry."""
+    sha256 = copy_file(path, dst, buf) if dst else hash_file(path, buf)
+    if sha256 != entry["sha256"] or os.path.getsize(path) != entry["size"]:
+        raise BackupError(f"{path} does not match the manifest")
+
+
+def verify(name: str | None = None) -> str:
+    """Rehash a snapshot (default: the newest) against its manifest. Raises BackupError on any mismatch."""
+    name, manifest = _find(name)
+    path = os.path.join(BACKUP_DIR, name)
+    buf = bytearray(BLOCK_SIZE)
+    for rel, entry in manifest["files"].items():
+        file_path = os.path.join(path, "uploads", rel)
+        if not os.path.isfile(file_path):
+            raise BackupError(f"{file_path} is missing")
+        _check(file_path, entry, buf)
+    database = manifest.get("database")
+    if database:
+        dump = os.path.join(path, database["file"])
+        _check(dump, database, buf)
+        _check_dump(dump, database)
+    return name
+
+
+def restore(name: str, database_url: str | None = None, uploads: bool = True, target: str = UPLOAD_DIR):
+    """Put a snapshot back. Stop the app first.
+
+    Files are verified while they are copied to ``<target>.restoring``; only a
+    complete, matching copy replaces ``target``, which is kept as
+    ``<target>.before-restore-<time>``. The database is restored when
+    ``database_url`` is given; a SQLite file is kept the same way.
+    """
+    name, manifest = _find(name)
+    path = os.path.join(BACKUP_DIR, name)
+    stamp = datetime.now().strftime(NAME_FORMAT)
+    buf = bytearray(BLOCK_SIZE)
+    database = manifest.get("database")
+    if database_url:
+        if not database:
+            raise BackupError(f"snapshot {name} has no database")
+        dump = os.path.join(path, database["file"])
+        _check(dump, database, buf)
+        _check_dump(dump, database)
+
+    if uploads:
+        staging = target.rstrip(os.sep) + ".restoring"
+        shutil.rmtree(staging, ignore_errors=True)
+        for rel, entry in manifest["files"].items():
+            dst = os.path.join(staging, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            # Copies, not links: the live tree must not share inodes with the snapshots
+            _check(os.path.join(path, "uploads", rel), entry, buf, dst)
+            os.utime(dst, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        os.makedirs(staging, exist_ok=True)
+        if os.path.exists(target):
+            os.rename(target, f"{target.rstrip(os.sep)}.before-restore-{stamp}")
+        os.rename(staging, target)
+        print(f"[backup] restored {len(manifest['files'])} files to {target}")
+
+    if database_url:
+        url = make_url(database_url)
+        backend = url.get_backend_name()
+        if backend != database["backend"]:
+            raise BackupError(f"snapshot {name} holds a {database['backend']} database, not {backend}")
+        if backend == "sqlite":
+            live = _sqlite_path(url)
+            if os.path.exists(live):
+                _sqlite_copy(live, f"{live}.before-restore-{stamp}")
+            _sqlite_copy(dump, live)  # through the backup API, so the live WAL is reset too
+        elif backend == "postgresql":
+            subprocess.run([PG_RESTORE, "--clean", "--if-exists", "--no-owner", f"--dbname={_pg_url(url)}", dump],
+                           env=_client_env(url, "PGPASSWORD"), check=True, capture_output=True)
+        else:
+            with open(dump, "rb") as f:
+                subprocess.run([MYSQL, *_mysql_args(url), url.database], stdin=f,
+                               env=_client_env(url, "MYSQL_PWD"), check=True, capture_output=True)
+        print(f"[backup] restored the {backend} database from {name}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def _arg(flag):
+        i = args.index(flag)
+        return args[i + 1] if i + 1 < len(args) and not args[i + 1].startswith("--") else None
+
+    def _database_url():
+        from app import app, db
+
+        with app.app_context():
+            return db.engine.url.render_as_string(hide_password=False)
+
+    try:
+        if "--list" in args:
+            for name, manifest in snapshots():
+                size = sum(entry["size"] for entry in manifest["files"].values())
+                db_file = (manifest.get("database") or {}).get("file", "-")
+                print(f"{name:40} {len(manifest['files']):7} files {size / 1e6:10.1f} MB  db: {db_file}")
+        elif "--verify" in args:
+            print(f"[backup] {verify(_arg('--verify'))} verified")
+        elif "--restore" in args:
+            target = _arg("--restore")
+            if not target:
+                raise BackupError("--restore needs a snapshot name (see --list)")
+            restore(target, database_url=None if "--uploads-only" in args else _database_url(),
+                    uploads="--db-only" not in args)
+        elif "--import-legacy" in args:
+            print(f"[backup] folded {import_legacy()} full copies into snapshots")
+        else:
+            snapshot(_database_url(), label=_arg("--label") if "--label" in args else None,
+                     checksum="--checksum" in args)
+            removed = prune()
+            if removed:
+                print(f"[backup] pruned {', '.join(removed)}")
+    except (BackupError, subprocess.CalledProcessError) as e:
+        detail = getattr(e, "stderr", None)
+        print(f"[backup] failed: {e}" + (f"\n{detail.decode(errors='replace')}" if detail else ""))
+        sys.exit(1)
@@ -162,6 +162,7 @@ function addEmojiPicker(button, targetInput) {
           // Custom emoji image
           const img = document.createElement('img');
           img.src = emojiData.image;
+          if (emojiData.srcset) img.srcset = emojiData.srcset;
           img.alt = emojiData.label || 'emoji';
           img.style.cssText = 'width:28px;height:28px;object-fit:contain;pointer-events:none';
           btn.appendChild(img);
@@ -0,0 +1,53 @@
+// Adaptive playback for transcoded uploads (see media_jobs.py). A <video data-hls="…/master.m3u8">
+// plays the HLS ladder natively where the browser can (Safari, iOS, Android) and through hls.js,
+// fetched only then, elsewhere. Its src / data-original (the uploaded file) stays the fallback.
+(function () {
+  // Same-origin and pinned (HLS_JS_VERSION and HLS_JS_SHA256 in media_jobs.py).
+  // If the load fails the video keeps playing the original file.
+  const HLS_JS = "/static/js/vendor/hls-1.4.10.min.js";
+  let loading = null;
+
+  function loadHlsJs() {
+    if (!loading) {
+      loading = new Promise((resolve, reject) => {
+        const script = document.createElement("script");
+        script.src = HLS_JS;
+        script.onload = () => resolve(window.Hls);
+        script.onerror = reject;
+        document.head.appendChild(script);
+      });
+    }
+    return loading;
+  }
+
+  function fallback(video) {
+    if (video.hls) video.hls.destroy();
+    video.hls = null;
+    if (video.dataset.original) video.src = video.dataset.original;
+  }
+
+  function attach(video) {
+    if (video.hls) {
+      video.hls.destroy();
+      video.hls = null;
+    }
+    const url = video.dataset.hls;
+    if (!url) return;
+    if (video.canPlayType("application/vnd.apple.mpegurl")) {
+      video.addEventListener("error", () => fallback(video), {once: true});
+      video.src = url;
+      return;
+    }
+    loadHlsJs().then((Hls) => {
+      if (!Hls || !Hls.isSupported() || video.dataset.hls !== url) return;
+      const hls = new Hls();
+      hls.on(Hls.Events.ERROR, (_, data) => { if (data.fatal) fallback(video); });
+      hls.loadSource(url);
+      hls.attachMedia(video);
+      video.hls = hls;
+    }).catch(() => {});
+  }
+
+  window.attachHls = attach;
+  document.querySelectorAll("video[data-hls]").forEach(attach);
+})();
@@ -0,0 +1,36 @@
+// Infinite scroll for keyset-paginated grids. A .load-more button right after a grid
+// fetches /api/videos/<listing>?cursor=... and appends the returned cards to the grid.
+(function () {
+  async function loadMore(btn) {
+    if (btn.dataset.loading) return;
+    btn.dataset.loading = "1";
+    try {
+      const res = await fetch(`/api/videos/${btn.dataset.listing}?cursor=${encodeURIComponent(btn.dataset.next)}`);
+      if (!res.ok) return;
+      const data = await res.json();
+      btn.previousElementSibling.insertAdjacentHTML("beforeend", data.html);
+      document.dispatchEvent(new CustomEvent("more:loaded", {detail: {listing: btn.dataset.listing, items: data.items}}));
+      if (data.next) btn.dataset.next = data.next; else btn.remove();
+    } finally {
+      delete btn.dataset.loading;
+    }
+  }
+
+  document.addEventListener("click", (e) => {
+    const btn = e.target.closest(".load-more");
+    if (btn) loadMore(btn);
+  });
+
+  // Load the next page once the button is close to the viewport (any scrolling element)
+  let pending = false;
+  document.addEventListener("scroll", () => {
+    if (pending) return;
+    pending = true;
+    requestAnimationFrame(() => {
+      pending = false;
+      for (const btn of document.querySelectorAll(".load-more")) {
+        if (btn.getBoundingClientRect().top < window.innerHeight + 400) loadMore(btn);
+      }
+    });
+  }, {capture: true, passive: true});
+})();
@@ -0,0 +1,99 @@
+// Resumable uploads (see resumable.py). A form with data-resumable="video" or "short" sends
+// its video file in chunks through /api/uploads; after a dropped connection or a reload the
+// same file continues from the offset the server has. Without fetch/Blob.slice the form
+// posts normally.
+(function () {
+  const CHUNK = 8 * 1024 * 1024;
+  const MAX_FAILURES = 8;
+
+  async function checksum(blob) {
+    if (!window.crypto || !crypto.subtle) return null;  // only available on https
+    const digest = new Uint8Array(await crypto.subtle.digest("SHA-256", await blob.arrayBuffer()));
+    return "sha256 " + btoa(String.fromCharCode(...digest));
+  }
+
+  async function serverOffset(token) {
+    const res = await fetch(`/api/uploads/${token}`, {method: "HEAD", cache: "no-store"});
+    return res.ok ? Number(res.headers.get("Upload-Offset")) : null;
+  }
+
+  async function create(form, kind, file) {
+    const body = new FormData();
+    body.append("kind", kind);
+    body.append("filename", file.name);
+    body.append("length", file.size);
+    for (const name of ["title", "description"]) {
+      if (form.elements[name]) body.append(name, form.elements[name].value);
+    }
+    const thumb = form.elements.thumb && form.elements.thumb.files[0];
+    if (thumb) body.append("thumb", thumb);
+    const res = await fetch("/api/uploads", {method: "POST", body});
+    const data = await res.json();
+    if (!res.ok) throw new Error(data.error || res.statusText);
+    return data.token;
+  }
+
+  async function upload(form, kind, file, progress) {
+    const key = `upload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+    let token = localStorage.getItem(key);
+    let offset = token ? await serverOffset(token) : null;
+    if (offset === null) {
+      token = await create(form, kind, file);
+      offset = 0;
+      localStorage.setItem(key, token);
+    }
+    let failures = 0;
+    for (;;) {
+      progress.value = offset / file.size;
+      const chunk = file.slice(offset, offset + CHUNK);
+      const headers = {"Content-Type": "application/offset+octet-stream", "Upload-Offset": String(offset)};
+      const sum = await checksum(chunk);
+      if (sum) headers["Upload-Checksum"] = sum;
+      let res = null;
+      try {
+        res = await fetch(`/api/uploads/${token}`, {method: "PATCH", headers, body: chunk});
+      } catch (e) {
+        // Network gone: fall through to the retry below
+      }
+      const data = res ? await res.json().catch(() => ({})) : {};
+      if (res && res.ok) {
+        failures = 0;
+        offset = data.offset;
+        if (data.complete) {
+          localStorage.removeItem(key);
+          return data.url;
+        }
+        continue;
+      }
+      if (res && (res.status === 404 || res.status === 410 || res.status === 413)) {
+        localStorage.removeItem(key);
+        throw new Error(data.error || res.statusText);
+      }
+      if (++failures > MAX_FAILURES) throw new Error(data.error || "connection lost");
+      await new Promise((resolve) => setTimeout(resolve, Math.min(30000, 500 * 2 ** failures)));
+      const current = typeof data.offset === "number" ? data.offset : await serverOffset(token).catch(() => null);
+      if (current !== null) offset = current;
+    }
+  }
+
+  document.addEventListener("submit", (e) => {
+    const form = e.target.closest("form[data-resumable]");
+    const file = form && form.elements.video && form.elements.video.files[0];
+    if (!file || !window.fetch || !Blob.prototype.slice) return;
+    e.preventDefault();
+    const button = form.querySelector("button:not([type]), button[type=submit]");
+    let progress = form.querySelector("progress");
+    if (!progress) {
+      progress = document.createElement("progress");
+      progress.style.cssText = "display:block;width:100%;margin-top:12px";
+      form.appendChild(progress);
+    }
+    if (button) button.disabled = true;
+    upload(form, form.dataset.resumable, file, progress)
+      .then((url) => { location.href = url; })
+      .catch((err) => {
+        alert(`Upload failed: ${err.message}. Submit again to resume.`);
+        if (button) button.disabled = false;
+      });
+  });
+})();
@@ -0,0 +1,52 @@
+// Seek previews for <video data-preview="…/thumbs.vtt"> (see media_jobs.py). Hovering the bottom
+// strip of the player, where the native progress bar sits, shows the sprite-sheet tile the
+// WebVTT track maps that point in time to.
+(function () {
+  const BAR_HEIGHT = 48;
+  const CUE = /([\d:.]+)\s+-->\s+([\d:.]+)\s*\n\s*(\S+?)#xywh=(\d+),(\d+),(\d+),(\d+)/g;
+
+  function seconds(stamp) {
+    return stamp.split(":").reduce((total, part) => total * 60 + parseFloat(part), 0);
+  }
+
+  function parse(text, base) {
+    const cues = [];
+    for (const m of text.matchAll(CUE)) {
+      cues.push({start: seconds(m[1]), end: seconds(m[2]), url: new URL(m[3], base).href,
+                 x: +m[4], y: +m[5], w: +m[6], h: +m[7]});
+    }
+    return cues;
+  }
+
+  async function attach(video) {
+    const base = new URL(video.dataset.preview, location.href);
+    const res = await fetch(base);
+    if (!res.ok) return;
+    const cues = parse(await res.text(), base);
+    if (!cues.length) return;
+    const tip = document.createElement("div");
+    tip.style.cssText = "position:fixed;display:none;pointer-events:none;z-index:50;border:1px solid var(--green);" +
+                        "border-radius:4px;background-repeat:no-repeat;box-shadow:0 2px 8px rgba(0,0,0,.5)";
+    document.body.appendChild(tip);
+
+    video.addEventListener("mousemove", (e) => {
+      const rect = video.getBoundingClientRect();
+      if (!video.duration || e.clientY < rect.bottom - BAR_HEIGHT) {
+        tip.style.display = "none";
+        return;
+      }
+      const t = (e.clientX - rect.left) / rect.width * video.duration;
+      const cue = cues.find((c) => t >= c.start && t < c.end) || cues[cues.length - 1];
+      tip.style.width = `${cue.w}px`;
+      tip.style.height = `${cue.h}px`;
+      tip.style.backgroundImage = `url("${cue.url}")`;
+      tip.style.backgroundPosition = `-${cue.x}px -${cue.y}px`;
+      tip.style.left = `${Math.min(Math.max(e.clientX - cue.w / 2, rect.left), rect.right - cue.w)}px`;
+      tip.style.top = `${rect.bottom - BAR_HEIGHT - cue.h - 6}px`;
+      tip.style.display = "block";
+    });
+    video.addEventListener("mouseleave", () => { tip.style.display = "none"; });
+  }
+
+  document.querySelectorAll("video[data-preview]").forEach((video) => attach(video).catch(() => {}));
+})();
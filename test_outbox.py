@@ -0,0 +1,203 @@
+"""
+Drains the email outbox against a local SMTP stand-in (no relay or .env needed).
+
+Covers delivery over one session, retry with backoff, dead-lettering, and a
+dead relay handing the rest of its batch back unsent.
+
+Usage:
+    python test_outbox.py
+    python -m pytest test_outbox.py
+"""
+
+import os
+import smtplib
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+import email_outbox
+from email_outbox import EMAIL_MAX_ATTEMPTS, OutboxSender, backoff_delay
+from models import db, EmailOutbox
+
+
+class FakeSMTP(socketserver.ThreadingTCPServer):
+    """Just enough SMTP for smtplib: records messages, refuses or defers chosen recipients."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.port = self.server_address[1]
+        self.messages = []  # (recipients, data)
+        self.connections = 0
+        self.refuse = set()  # 550 at RCPT TO
+        self.defer = set()  # 451 after DATA
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 fake ESMTP")
+        rcpts = []
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            if not line:
+                return
+            verb = line.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 fake")
+            elif verb == "MAIL":
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                addr = line.split(":", 1)[1].strip().strip("<>")
+                if addr in server.refuse:
+                    self.reply("550 No such user")
+                else:
+                    rcpts.append(addr)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                if server.defer & set(rcpts):
+                    self.reply("451 Try again later")
+                else:
+                    server.messages.append((rcpts, b"".join(data)))
+                    self.reply("250 Queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+def _app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "outbox.db")
+    db.init_app(app)
+    with app.app_context():
+        EmailOutbox.__table__.create(bind=db.engine)
+    return app
+
+
+def _sender(port, connects=None):
+    def factory(host, port):
+        if connects is not None:
+            connects.append(port)
+        return smtplib.SMTP(host, port, timeout=5)
+    return OutboxSender("127.0.0.1", port, use_tls=False, smtp_factory=factory)
+
+
+def _queue(*addrs):
+    return [email_outbox.enqueue("Hello", addr, "Body").id for addr in addrs]
+
+
+def _make_due(ids):
+    EmailOutbox.query.filter(EmailOutbox.id.in_(ids)).update({"next_attempt_at": datetime.utcnow()},
+                                                            synchronize_session=False)
+    db.session.commit()
+
+
+def test_sent():
+    smtp, app = FakeSMTP(), _app()
+    with app.app_context():
+        ids = _queue("a@example.com", "b@example.com", "c@example.com")
+        sender = _sender(smtp.port)
+        assert sender.drain() == 3
+        sender.close()
+        rows = EmailOutbox.query.filter(EmailOutbox.id.in_(ids)).all()
+        assert {r.status for r in rows} == {"sent"}
+        assert all(r.sent_at and r.attempts == 1 for r in rows)
+        assert sorted(rcpt for rcpts, _ in smtp.messages for rcpt in rcpts) == ["a@example.com", "b@example.com",
+                                                                               "c@example.com"]
+        assert smtp.connections == 1  # one session for the whole batch
+    smtp.shutdown()
+
+
+def test_retry_backoff():
+    smtp, app = FakeSMTP(), _app()
+    smtp.defer.add("later@example.com")
+    with app.app_context():
+        [row_id] = _queue("later@example.com")
+        sender = _sender(smtp.port)
+        for attempt in (1, 2):
+            before = datetime.utcnow()
+            assert sender.drain_once() == 0
+            row = db.session.get(EmailOutbox, row_id)
+            assert row.status == "pending" and row.attempts == attempt and "451" in row.last_error
+            delay = row.next_attempt_at - before
+            assert backoff_delay(attempt) <= delay <= backoff_delay(attempt) + timedelta(seconds=5)
+            assert sender.drain_once() == 0  # not due yet
+            _make_due([row_id])
+        smtp.defer.clear()
+        assert sender.drain_once() == 1
+        row = db.session.get(EmailOutbox, row_id)
+        assert row.status == "sent" and row.attempts == 3 and row.last_error is None
+        sender.close()
+    smtp.shutdown()
+
+
+def test_dead_letter():
+    smtp, app = FakeSMTP(), _app()
+    smtp.refuse.add("nobody@example.com")
+    smtp.defer.add("full@example.com")
+    with app.app_context():
+        refused, deferred = _queue("nobody@example.com", "full@example.com")
+        sender = _sender(smtp.port)
+        sender.drain_once()
+        row = db.session.get(EmailOutbox, refused)
+        assert row.status == "dead" and row.attempts == 1  # refused recipients aren't retried
+        for _ in range(EMAIL_MAX_ATTEMPTS - 1):
+            _make_due([deferred])
+            sender.drain_once()
+        row = db.session.get(EmailOutbox, deferred)
+        assert row.status == "dead" and row.attempts == EMAIL_MAX_ATTEMPTS
+        _make_due([refused, deferred])
+        assert sender.drain_once() == 0 and smtp.messages == []  # dead rows are never claimed again
+        sender.close()
+    smtp.shutdown()
+
+
+def test_dead_relay():
+    with socket.socket() as s:  # a port nothing listens on: connections are refused
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    app, connects = _app(), []
+    with app.app_context():
+        first, *rest = _queue(*(f"u{i}@example.com" for i in range(5)))
+        sender = _sender(port, connects)
+        assert sender.drain_once() == 0
+        assert len(connects) == 1  # the batch stopped at the first failure
+        row = db.session.get(EmailOutbox, first)
+        assert row.status == "pending" and row.attempts == 1
+        others = EmailOutbox.query.filter(EmailOutbox.id.in_(rest)).all()
+        assert all(r.status == "pending" and r.attempts == 0 for r in others)
+        assert all(r.next_attempt_at <= datetime.utcnow() for r in others)  # due again right away
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, test in [(n, f) for n, f in globals().items() if n.startswith("test_")]:
+        try:
+            test()
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e!r}")
+        else:
+            print(f"✅ {name}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,177 @@
+"""
+Materialized subscription timelines (fan-out on write).
+
+Every user has TimelineEntry rows for the videos of the uploaders they
+follow, so the subscriptions page is one range scan of
+``(user_id, created_at, video_id)`` instead of joining Video to
+Subscription and sorting.
+
+- upload() leaves the new video's ``fanout`` at "pending"; the
+  ``TimelineFanout`` thread claims pending videos in batches and copies each
+  one into its uploader's followers' timelines with a single INSERT ... SELECT
+- uploaders with TIMELINE_FANOUT_LIMIT or more subscribers are not fanned
+  out: their videos are marked "pull", the uploader gets ``fanout_on_read``,
+  and ``timeline_page()`` merges those videos in at read time
+- subscribe() backfills the uploader's latest TIMELINE_BACKFILL videos,
+  unsubscribe() removes the uploader's entries
+
+``rebuild()`` recomputes everything from Subscription and Video (seed_data.py,
+or ``python timeline.py --rebuild``); migration 8 runs the same statements
+as SQL frozen at that version.
+"""
+
+import os
+import sys
+import threading
+
+from sqlalchemy import and_, delete, distinct, exists, insert, literal, select, update
+
+from models import db, User, Video, Subscription, TimelineEntry
+from pagination import PAGE_LIMIT, keyset_page, merge_pages
+
+TIMELINE_FANOUT_LIMIT = int(os.environ.get("TIMELINE_FANOUT_LIMIT", "10000"))
+TIMELINE_BACKFILL = int(os.environ.get("TIMELINE_BACKFILL", "100"))
+TIMELINE_BATCH_SIZE = int(os.environ.get("TIMELINE_BATCH_SIZE", "50"))
+TIMELINE_POLL_SECONDS = float(os.environ.get("TIMELINE_POLL_SECONDS", "5"))
+
+ENTRY_COLUMNS = ["user_id", "video_id", "uploader_id", "created_at"]
+
+
+def _fan_out_video(video_id: int, uploader_id: int, created_at):
+    """Copy one video into its followers' timelines (skips followers who already have it)."""
+    followers = (select(distinct(Subscription.subscriber_id), literal(video_id), literal(uploader_id), literal(created_at))
+                 .where(Subscription.subscribed_to_id == uploader_id)
+                 .where(~exists().where(and_(TimelineEntry.user_id == Subscription.subscriber_id,
+                                             TimelineEntry.video_id == video_id))))
+    return db.session.execute(insert(TimelineEntry).from_select(ENTRY_COLUMNS, followers)).rowcount
+
+
+def fan_out_pending(limit: int = TIMELINE_BATCH_SIZE) -> int:
+    """Fan out one batch of pending videos. Must run inside an app context. Returns videos handled."""
+    pending = db.session.execute(
+        select(Video.id, Video.uploader_id, Video.created_at, User.subscriber_count)
+        .outerjoin(User, User.id == Video.uploader_id)
+        .where(Video.fanout == "pending")
+        .order_by(Video.id)
+        .limit(limit)
+    ).all()
+    for video_id, uploader_id, created_at, subscribers in pending:
+        mode = "pull" if (subscribers or 0) >= TIMELINE_FANOUT_LIMIT else "push"
+        # Conditional update: only one worker wins each video
+        won = db.session.execute(update(Video).where(Video.id == video_id, Video.fanout == "pending")
+                                 .values(fanout=mode).execution_options(synchronize_session=False)).rowcount
+        if not won:
+            continue
+        if mode == "pull":
+            db.session.execute(update(User).where(User.id == uploader_id).values(fanout_on_read=True)
+                               .execution_options(synchronize_session=False))
+        elif created_at is not None:
+            _fan_out_video(video_id, uploader_id, created_at)
+        db.session.commit()
+    return len(pending)
+
+
+def backfill(user_id: int, uploader_id: int, limit: int = TIMELINE_BACKFILL):
+    """Add an uploader's latest pushed videos to a new follower's timeline. Joins the caller's transaction."""
+    recent = (select(literal(user_id), Video.id, Video.uploader_id, Video.created_at)
+              .where(Video.uploader_id == uploader_id, Video.fanout != "pull", Video.created_at.isnot(None))
+              .where(~exists().where(and_(TimelineEntry.user_id == user_id, TimelineEntry.video_id == Video.id)))
+              .order_by(Video.created_at.desc())
+              .limit(limit))
+    db.session.execute(insert(TimelineEntry).from_select(ENTRY_COLUMNS, recent))
+
+
+def remove(user_id: int, uploader_id: int):
+    """Drop an uploader's videos from a timeline after unsubscribing. Joins the caller's transaction."""
+    db.session.execute(delete(TimelineEntry).where(TimelineEntry.user_id == user_id,
+                                                   TimelineEntry.uploader_id == uploader_id))
+
+
+def timeline_page(user_id: int, cursor: str | None = None, limit: int = PAGE_LIMIT):
+    """Newest-first page of a user's subscriptions feed, in Video rows."""
+    pushed = keyset_page(
+        Video.query.join(TimelineEntry, TimelineEntry.video_id == Video.id).filter(TimelineEntry.user_id == user_id),
+        TimelineEntry.created_at, TimelineEntry.video_id, cursor, limit)
+    pull_from = (select(Subscription.subscribed_to_id)
+                 .join(User, User.id == Subscription.subscribed_to_id)
+                 .where(Subscription.subscriber_id == user_id, User.fanout_on_read.is_(True)))
+    if db.session.execute(pull_from.limit(1)).first() is None:
+        return pushed
+    pulled = keyset_page(Video.query.filter(Video.uploader_id.in_(pull_from), Video.fanout == "pull"),
+                         Video.created_at, Video.id, cursor, limit)
+    # TimelineEntry.created_at is a copy of Video.created_at, so both sides share one cursor
+    return merge_pages([pushed, pulled], lambda v: (v.created_at, v.id), limit)
+
+
+def rebuild(bind) -> int:
+    """Recompute every timeline from Subscription and Video. Returns entries written.
+
+    ``bind`` is a Connection (e.g. inside a migration) or a Session.
+    """
+    popular = list(bind.execute(select(User.id).where(User.subscriber_count >= TIMELINE_FANOUT_LIMIT)).scalars())
+    bind.execute(update(User).values(fanout_on_read=False))
+    bind.execute(update(Video).values(fanout="push"))
+    if popular:
+        bind.execute(update(User).where(User.id.in_(popular)).values(fanout_on_read=True))
+        bind.execute(update(Video).where(Video.uploader_id.in_(popular)).values(fanout="pull"))
+    bind.execute(delete(TimelineEntry))
+    entries = (select(Subscription.subscriber_id, Video.id, Video.uploader_id, Video.created_at)
+               .distinct()
+               .join(Video, Video.uploader_id == Subscription.subscribed_to_id)
+               .where(Video.fanout == "push", Video.created_at.isnot(None), Subscription.subscriber_id.isnot(None)))
+    return bind.execute(insert(TimelineEntry).from_select(ENTRY_COLUMNS, entries)).rowcount
+
+
+class TimelineFanout:
+    """Background thread that drains pending videos into timelines."""
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def notify(self):
+        self._wake.set()
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    while fan_out_pending() >= TIMELINE_BATCH_SIZE:
+                        pass
+                    db.session.remove()
+            except Exception as e:
+                print(f"[timeline] Fan-out error: {e}")
+            self._wake.wait(TIMELINE_POLL_SECONDS)
+            self._wake.clear()
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,), name="timeline-fanout", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        if "--rebuild" in sys.argv[1:]:
+            written = rebuild(db.session)
+            db.session.commit()
+            print(f"[timeline] rebuilt {written} entries")
+        else:
+            total = 0
+            while True:
+                n = fan_out_pending()
+                total += n
+                if n < TIMELINE_BATCH_SIZE:
+                    break
+            print(f"[timeline] fanned out {total} pending videos")
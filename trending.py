@@ -0,0 +1,284 @@
+"""
+Trending scores for videos.
+
+A video's score is the sum of its views, likes and comments, each weighted by
+kind (WEIGHTS) and halved every TRENDING_HALF_LIFE_HOURS. Decaying every row
+on a timer would rewrite the whole table, so scores use forward decay: an
+event at time t adds
+
+    weight * 2 ** ((t - epoch) / half_life)
+
+to the stored value. Later events count for more and every row ages at the
+same rate, so ``ORDER BY score DESC`` on ix_trending_score is the decayed
+ranking and reading it is one index scan.
+
+- watch(), like_video() and comments call ``record()``; events are summed in
+  memory per video and the ``TrendingWorker`` thread flushes them every
+  TRENDING_FLUSH_SECONDS as one batch of ``score = score + :delta``
+  UPDATEs, so workers never overwrite each other's counts
+- stored values double every half-life, so once TRENDING_REBASE_SECONDS
+  have passed a worker moves the epoch forward: one UPDATE scales every row
+  down and rows that decayed below TRENDING_MIN_SCORE are deleted
+- without a running worker (scripts, TRENDING_WORKER=off) ``record()``
+  writes through immediately
+
+``rebuild()`` recomputes every score from VideoLike, VideoComment and the
+view counters (migration 9, seed_data.py, ``python trending.py --rebuild``).
+Views carry no timestamp, so they count as of the upload date. The decay
+sums are computed in batches with NumPy when it is installed.
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, insert, literal, select, update
+
+from models import db, Video, VideoLike, VideoComment, TrendingScore, TrendingEpoch
+
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", "24"))
+TRENDING_FLUSH_SECONDS = float(os.environ.get("TRENDING_FLUSH_SECONDS", "10"))
+TRENDING_REBASE_SECONDS = float(os.environ.get("TRENDING_REBASE_SECONDS", "3600"))
+TRENDING_MIN_SCORE = float(os.environ.get("TRENDING_MIN_SCORE", "0.05"))
+TRENDING_LIMIT = int(os.environ.get("TRENDING_LIMIT", "48"))
+TRENDING_BATCH_SIZE = 50000
+
+WEIGHTS = {"view": 1.0, "like": 4.0, "comment": 8.0}
+HALF_LIFE = TRENDING_HALF_LIFE_HOURS * 3600
+UNIX_EPOCH = datetime(1970, 1, 1)
+# How often the worker checks whether the epoch is due to move
+REBASE_CHECK_SECONDS = 60
+
+
+def growth(t: float, epoch: float) -> float:
+    """Weight of an event at unix time ``t`` relative to one at ``epoch``."""
+    return 2.0 ** ((t - epoch) / HALF_LIFE)
+
+
+def _seconds(ts: datetime) -> float:
+    return (ts - UNIX_EPOCH).total_seconds()
+
+
+class TrendingBuffer:
+    """Per-video sums of events not yet written, scaled to a local anchor time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._anchor = time.time()
+        self._pending = {}
+
+    def add(self, video_id: int, weight: float):
+        with self._lock:
+            self._pending[video_id] = self._pending.get(video_id, 0.0) + weight * growth(time.time(), self._anchor)
+
+    def drain(self):
+        """(anchor, {video_id: delta}) collected so far; the buffer starts over."""
+        with self._lock:
+            anchor, pending = self._anchor, self._pending
+            self._anchor, self._pending = time.time(), {}
+        return anchor, pending
+
+    def restore(self, anchor: float, pending: dict):
+        """Put back deltas whose write failed."""
+        with self._lock:
+            scale = growth(anchor, self._anchor)
+            for video_id, delta in pending.items():
+                self._pending[video_id] = self._pending.get(video_id, 0.0) + delta * scale
+
+
+def _lock_epoch(conn) -> float:
+    """The current epoch, row-locked so a rebase can't move it under an open write."""
+    epoch = conn.execute(select(TrendingEpoch.epoch).where(TrendingEpoch.id == 1).with_for_update()).scalar()
+    if epoch is None:
+        epoch = time.time()
+        conn.execute(insert(TrendingEpoch).values(id=1, epoch=epoch))
+    return epoch
+
+
+def apply(anchor: float, pending: dict) -> int:
+    """Add buffered deltas (scaled to ``anchor``) to the stored scores. Returns rows written."""
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        scale = growth(anchor, _lock_epoch(conn))
+        ids = list(pending)
+        existing = set(conn.execute(select(TrendingScore.video_id).where(TrendingScore.video_id.in_(ids))).scalars())
+        if existing:
+            conn.execute(
+                update(TrendingScore)
+                .where(TrendingScore.video_id == bindparam("vid"))
+                .values(score=TrendingScore.score + bindparam("delta"), updated_at=now),
+                [{"vid": vid, "delta": pending[vid] * scale} for vid in existing],
+            )
+        new = [vid for vid in ids if vid not in existing]
+        if new:
+            # Skip videos deleted since the event
+            alive = conn.execute(select(Video.id).where(Video.id.in_(new))).scalars().all()
+            if alive:
+                conn.execute(insert(TrendingScore),
+                             [{"video_id": vid, "score": pending[vid] * scale, "updated_at": now} for vid in alive])
+    return len(pending)
+
+
+def rebase(min_age: float = TRENDING_REBASE_SECONDS) -> int:
+    """Move the epoch to now if it is at least ``min_age`` seconds old. Returns rows dropped."""
+    with db.engine.begin() as conn:
+        epoch = _lock_epoch(conn)
+        now = time.time()
+        if now - epoch < min_age:
+            return 0
+        conn.execute(update(TrendingScore).values(score=TrendingScore.score * growth(epoch, now)))
+        dropped = conn.execute(delete(TrendingScore).where(TrendingScore.score < TRENDING_MIN_SCORE)).rowcount
+        conn.execute(update(TrendingEpoch).where(TrendingEpoch.id == 1).values(epoch=now))
+    return dropped
+
+
+def top_videos(limit: int = TRENDING_LIMIT):
+    """Highest-scoring videos, best first."""
+    return (Video.query.join(TrendingScore, TrendingScore.video_id == Video.id)
+            .order_by(TrendingScore.score.desc(), TrendingScore.video_id.desc())
+            .limit(limit)
+            .all())
+
+
+# --- Rebuild ---
+def _event_batches(bind):
+    """Lists of (video_id, unix seconds, weight) for every recorded event of a live video."""
+    sources = [
+        (select(VideoLike.video_id, VideoLike.created_at, literal(1))
+         .join(Video, Video.id == VideoLike.video_id).where(VideoLike.created_at.isnot(None)), WEIGHTS["like"]),
+        (select(VideoComment.video_id, VideoComment.created_at, literal(1))
+         .join(Video, Video.id == VideoComment.video_id).where(VideoComment.created_at.isnot(None)), WEIGHTS["comment"]),
+        (select(Video.id, Video.created_at, Video.view_count)
+         .where(Video.view_count > 0, Video.created_at.isnot(None)), WEIGHTS["view"]),
+    ]
+    for stmt, weight in sources:
+        for part in bind.execute(stmt).partitions(TRENDING_BATCH_SIZE):
+            yield [(vid, _seconds(ts), weight * n) for vid, ts, n in part]
+
+
+def _sum_numpy(np, batches, epoch: float) -> dict:
+    totals = np.zeros(0)
+    for batch in batches:
+        rows = np.asarray(batch, dtype=np.float64)
+        part = np.bincount(rows[:, 0].astype(np.int64),
+                           weights=rows[:, 2] * np.exp2((rows[:, 1] - epoch) / HALF_LIFE))
+        if len(part) > len(totals):
+            totals = np.pad(totals, (0, len(part) - len(totals)))
+        totals[:len(part)] += part
+    keep = np.flatnonzero(totals >= TRENDING_MIN_SCORE)
+    return dict(zip(keep.tolist(), totals[keep].tolist()))
+
+
+def _sum_python(batches, epoch: float) -> dict:
+    totals = {}
+    for batch in batches:
+        for vid, t, weight in batch:
+            totals[vid] = totals.get(vid, 0.0) + weight * growth(t, epoch)
+    return {vid: score for vid, score in totals.items() if score >= TRENDING_MIN_SCORE}
+
+
+def rebuild(bind) -> int:
+    """Recompute every score from the source tables. Returns rows written.
+
+    ``bind`` is a Connection (e.g. inside a migration) or a Session.
+    """
+    epoch = time.time()
+    batches = _event_batches(bind)
+    try:
+        import numpy as np  # optional, only speeds up the sums
+    except ImportError:
+        scores = _sum_python(batches, epoch)
+    else:
+        scores = _sum_numpy(np, batches, epoch)
+    bind.execute(delete(TrendingScore))
+    bind.execute(delete(TrendingEpoch))
+    bind.execute(insert(TrendingEpoch).values(id=1, epoch=epoch))
+    now = datetime.utcnow()
+    rows = [{"video_id": vid, "score": score, "updated_at": now} for vid, score in scores.items()]
+    for i in range(0, len(rows), 1000):
+        bind.execute(insert(TrendingScore), rows[i:i + 1000])
+    return len(rows)
+
+
+# --- Recording ---
+class TrendingWorker:
+    """Background thread that flushes the buffer and moves the epoch."""
+
+    def __init__(self, buffer: TrendingBuffer):
+        self.buffer = buffer
+        self._stop = threading.Event()
+        self._thread = None
+        self._at_exit = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def flush(self) -> int:
+        """Write the buffered deltas. Must run inside an app context. Never raises."""
+        anchor, pending = self.buffer.drain()
+        if not pending:
+            return 0
+        try:
+            return apply(anchor, pending)
+        except Exception as e:
+            self.buffer.restore(anchor, pending)
+            print(f"[trending] Flush failed, will retry: {e}")
+            return 0
+
+    def run_forever(self, app):
+        next_rebase = 0.0
+        while not self._stop.is_set():
+            self._stop.wait(TRENDING_FLUSH_SECONDS)
+            try:
+                with app.app_context():
+                    self.flush()
+                    if time.monotonic() >= next_rebase:
+                        next_rebase = time.monotonic() + REBASE_CHECK_SECONDS
+                        rebase()
+                    db.session.remove()
+            except Exception as e:
+                print(f"[trending] Worker error: {e}")
+
+    def start(self, app):
+        if self.running:
+            return
+        if not self._at_exit:
+            # Graceful shutdown flushes what is still buffered
+            atexit.register(self.stop)
+            self._at_exit = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,), name="trending", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        # The loop flushes once more on its way out
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+worker = TrendingWorker(TrendingBuffer())
+
+
+def record(video_id: int, kind: str):
+    """Count a "view", "like" or "comment" towards a video's score. Never raises into the caller."""
+    worker.buffer.add(video_id, WEIGHTS[kind])
+    if not worker.running:
+        worker.flush()
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        if "--rebuild" in sys.argv[1:]:
+            written = rebuild(db.session)
+            db.session.commit()
+            print(f"[trending] rebuilt {written} scores")
+        else:
+            dropped = rebase(min_age=0)
+            print(f"[trending] moved the epoch to now, dropped {dropped} faded scores")
@@ -0,0 +1,146 @@
+"""
+Buffered view counting for the watch page.
+
+watch() used to bump ``Video.view_count`` in Python and commit on every GET:
+a read-modify-write that loses increments under concurrency and turns the
+busiest page into a write transaction. Views are now summed in memory per
+worker and the ``ViewCounter`` thread writes them every VIEW_FLUSH_SECONDS
+as one batch of ``UPDATE video SET view_count = view_count + :n``, which the
+database applies atomically however many workers flush at once.
+
+- with VIEW_DEDUP_SECONDS set, repeat views of the same video by the same
+  session (user id, or a random id kept in the session cookie) within that
+  window are not counted; the window is tracked per worker, in an LRU of at
+  most VIEW_DEDUP_MAX entries
+- the thread flushes once more when it stops, and ``start()`` registers the
+  stop with atexit, so a graceful gunicorn shutdown or restart keeps every
+  buffered view; only a hard kill loses up to VIEW_FLUSH_SECONDS of views
+- without a running thread (scripts, tests) ``count()`` writes through
+"""
+
+import atexit
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, func, update
+
+from models import db, Video
+
+VIEW_FLUSH_SECONDS = float(os.environ.get("VIEW_FLUSH_SECONDS", "5"))
+VIEW_DEDUP_SECONDS = float(os.environ.get("VIEW_DEDUP_SECONDS", "0"))
+VIEW_DEDUP_MAX = int(os.environ.get("VIEW_DEDUP_MAX", "100000"))
+
+
+def viewer_key(session):
+    """Who is watching, for dedup: the user id, or a random id stored in the session. None with dedup off."""
+    if VIEW_DEDUP_SECONDS <= 0:
+        return None
+    if session.get("uid"):
+        return f"u{session['uid']}"
+    if "viewer" not in session:
+        session["viewer"] = secrets.token_urlsafe(8)
+    return f"s{session['viewer']}"
+
+
+class ViewCounter:
+    """Per-worker view buffer plus the thread that flushes it."""
+
+    def __init__(self, dedup_seconds: float = VIEW_DEDUP_SECONDS, dedup_max: int = VIEW_DEDUP_MAX):
+        self.dedup_seconds = dedup_seconds
+        self.dedup_max = dedup_max
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seen = OrderedDict()  # (viewer, video_id) -> monotonic time counted, oldest first
+        self._stop = threading.Event()
+        self._thread = None
+        self._at_exit = False
+        self.flushed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _duplicate(self, viewer, video_id: int, now: float) -> bool:
+        while self._seen:
+            _, oldest = next(iter(self._seen.items()))
+            if now - oldest < self.dedup_seconds:
+                break
+            self._seen.popitem(last=False)
+        key = (viewer, video_id)
+        if key in self._seen:
+            return True
+        self._seen[key] = now
+        if len(self._seen) > self.dedup_max:
+            self._seen.popitem(last=False)
+        return False
+
+    def count(self, video_id: int, viewer=None) -> bool:
+        """Record one view. Returns False if it was a repeat within the dedup window."""
+        with self._lock:
+            if viewer is not None and self.dedup_seconds > 0 and self._duplicate(viewer, video_id, time.monotonic()):
+                return False
+            self._pending[video_id] = self._pending.get(video_id, 0) + 1
+        if not self.running:
+            self.flush()
+        return True
+
+    def pending(self, video_id: int) -> int:
+        """Views of a video counted here but not written yet."""
+        return self._pending.get(video_id, 0)
+
+    def flush(self) -> int:
+        """Write buffered views. Must run inside an app context. Never raises; returns views written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with db.engine.begin() as conn:
+                # In id order, so two workers flushing the same videos lock rows in the same order
+                conn.execute(
+                    update(Video)
+                    .where(Video.id == bindparam("vid"))
+                    .values(view_count=func.coalesce(Video.view_count, 0) + bindparam("n")),
+                    [{"vid": vid, "n": n} for vid, n in sorted(pending.items())],
+                )
+        except Exception as e:
+            with self._lock:
+                for vid, n in pending.items():
+                    self._pending[vid] = self._pending.get(vid, 0) + n
+            print(f"[views] Flush failed, will retry: {e}")
+            return 0
+        written = sum(pending.values())
+        self.flushed += written
+        return written
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            self._stop.wait(VIEW_FLUSH_SECONDS)
+            # Runs once more after stop() so nothing buffered is left behind
+            try:
+                with app.app_context():
+                    self.flush()
+                    db.session.remove()
+            except Exception as e:
+                print(f"[views] Flush error: {e}")
+
+    def start(self, app):
+        if self.running:
+            return
+        if not self._at_exit:
+            atexit.register(self.stop)
+            self._at_exit = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,), name="view-counter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+view_counter = ViewCounter()
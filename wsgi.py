@@ -30,15 +30,9 @@ except Exception as e:
     traceback.print_exc()
     raise
 
-# Create tables on startup - wrapped in try/except to not block startup
-try:
-    with application.app_context():
-        from models import db
-        db.create_all()
-        print("✅ Database tables created/verified")
-except Exception as e:
-    print(f"⚠️ Database setup warning (app will still run): {e}")
-    # Don't crash - let the app start even if DB has issues
+# Apply pending schema migrations and start background workers once per worker boot - never blocks startup
+from app import boot_worker
+boot_worker()
 
 # WSGI entry point for LiteSpeed
 if __name__ == '__main__':